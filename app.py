@@ -1,10 +1,30 @@
 # app.py
+import io
+import os
 import json
+import asyncio
+import tempfile
+import time
+from datetime import datetime, timedelta
 import streamlit as st
-from db import init_db, list_opportunities, create_opportunity, get_opportunity, update_opportunity
-from llm import run_day0_analysis
-from utils import compute_bucket
-from utils import estimate_openai_cost
+from db import init_db, create_opportunity, get_opportunity, update_opportunity, cache_stats, prompt_cache_usage
+from db import get_opportunity_header, get_jd_text, get_analysis
+from db import count_unanalyzed_opportunities, list_opportunities_page, search_opportunities, transaction
+from db import sweep_buckets, list_due_queue
+from db import analysis_history, analysis_version, near_duplicates
+from db import span_percentiles, token_throughput, slowest_traces, trace_spans, prune_spans, repair_stats
+from db import get_job, latest_job, queue_position, job_counts, opportunity_titles
+import tracing
+from tracing import span, traced
+from llm import run_day0_analysis_sectioned, run_day0_reanalysis, analysis_update_fields
+from llm import triage_enabled, triage_model, triage_threshold
+from schemas import JD_SECTIONS
+from utils import compute_bucket, estimate_tiered_cost
+from batch import analyze_new_opportunities, DEFAULT_CONCURRENCY
+import transfer
+import jobs
+import governor
+import prescreen
 
 st.set_page_config(page_title="JD Copilot", layout="wide")
 
@@ -25,6 +45,14 @@ DEFAULT_PROFILE = """Paste your resume summary here as structured bullets:
 - 3 signature stories (STAR bullets)
 """
 
+STAGES = ["NEW", "ANALYZED", "DECISION_PENDING", "QUALIFIED_PREP", "APPLIED", "INTERVIEWING", "CLOSED", "DQ"]
+DECISIONS = ["PENDING", "QUALIFIED", "UNQUALIFIED"]
+PAGE_SIZES = [25, 50, 100]
+ANALYSIS_MODES = ["Streaming", "Single call", "Sectioned (parallel)"]
+JOB_MODES = {"Streaming": "stream", "Single call": "single", "Sectioned (parallel)": "sectioned"}
+JOB_POLL_SECONDS = 1.0
+SWEEP_INTERVAL_S = 300
+
 DQ_CODES = [
     "COMP_BELOW_THRESHOLD",
     "LOCATION_MISMATCH",
@@ -37,10 +65,11 @@ DQ_CODES = [
     "TIMING_CONSTRAINT",
 ]
 
-def render_analysis(a: dict):
+def _render_summary(a: dict):
     st.subheader("Role Summary")
     st.write(a.get("role_summary", ""))
 
+def _render_requirements(a: dict):
     c1, c2 = st.columns(2)
     with c1:
         st.subheader("Responsibilities")
@@ -49,20 +78,25 @@ def render_analysis(a: dict):
         st.subheader("Requirements")
         st.write(a.get("extracted_requirements", []))
 
+def _render_score_item(item: dict):
+    with st.expander(f"{item['quality']} — {item['score']}/5", expanded=False):
+        st.write(item.get("rationale", ""))
+        ev = item.get("evidence", [])
+        if ev:
+            st.markdown("**Evidence**")
+            for e in ev:
+                st.markdown(f"- “{e.get('quote','').strip()}” — {e.get('note','')}")
+        unk = item.get("unknowns", [])
+        if unk:
+            st.markdown("**Unknowns**")
+            st.write(unk)
+
+def _render_scorecard(a: dict):
     st.subheader("Scorecard (1–5)")
     for item in a.get("scorecard", []):
-        with st.expander(f"{item['quality']} — {item['score']}/5", expanded=False):
-            st.write(item.get("rationale", ""))
-            ev = item.get("evidence", [])
-            if ev:
-                st.markdown("**Evidence**")
-                for e in ev:
-                    st.markdown(f"- “{e.get('quote','').strip()}” — {e.get('note','')}")
-            unk = item.get("unknowns", [])
-            if unk:
-                st.markdown("**Unknowns**")
-                st.write(unk)
+        _render_score_item(item)
 
+def _render_strengths_gaps(a: dict):
     st.subheader("Strengths & Gaps")
     sg = a.get("strengths_and_gaps", {})
     c1, c2, c3 = st.columns(3)
@@ -76,6 +110,7 @@ def render_analysis(a: dict):
         st.markdown("**Bridging language**")
         st.write(sg.get("bridging_language", []))
 
+def _render_storyline(a: dict):
     st.subheader("Storyline (Cover Letter Beats)")
     story = a.get("storyline", {})
     c1, c2 = st.columns(2)
@@ -90,6 +125,7 @@ def render_analysis(a: dict):
         st.markdown("**Closing**")
         st.write(story.get("closing", []))
 
+def _render_interview_prep(a: dict):
     st.subheader("Interview Prep")
     ip = a.get("interview_prep", {})
     c1, c2 = st.columns(2)
@@ -100,6 +136,7 @@ def render_analysis(a: dict):
         st.markdown("**Questions to ask**")
         st.write(ip.get("questions_to_ask", []))
 
+def _render_downside_case(a: dict):
     st.subheader("Downside Case")
     dc = a.get("downside_case", {})
     c1, c2 = st.columns(2)
@@ -109,17 +146,276 @@ def render_analysis(a: dict):
     with c2:
         st.markdown("**What to verify**")
         st.write(dc.get("what_to_verify", []))
-    
+
+# (renderer, JDAnalysis fields it displays) in page order
+ANALYSIS_SECTIONS = [
+    (_render_summary, ("role_summary",)),
+    (_render_requirements, ("extracted_responsibilities", "extracted_requirements")),
+    (_render_scorecard, ("scorecard",)),
+    (_render_strengths_gaps, ("strengths_and_gaps",)),
+    (_render_storyline, ("storyline",)),
+    (_render_interview_prep, ("interview_prep",)),
+    (_render_downside_case, ("downside_case",)),
+]
+
+@traced("app.render_analysis")
+def render_analysis(a: dict, opp: dict):
+    for render, _ in ANALYSIS_SECTIONS:
+        render(a)
+
     st.subheader("Run Cost & Token Usage")
-    
+
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Prompt tokens", opp.get("prompt_tokens") or 0)
+    c2.metric("Cached prompt tokens", opp.get("cached_prompt_tokens") or 0)
+    c3.metric("Completion tokens", opp.get("completion_tokens") or 0)
+    c4.metric("Total tokens", opp.get("total_tokens") or 0)
+    c5.metric("Estimated cost ($)", f"${opp.get('estimated_cost_usd') or 0:.4f}")
+    if opp.get("jd_tokens_raw"):
+        saved = 1 - opp["jd_tokens_compact"] / opp["jd_tokens_raw"]
+        st.caption(f"JD compacted from ~{opp['jd_tokens_raw']} to ~{opp['jd_tokens_compact']} tokens ({saved:.0%} fewer) before prompting.")
+    if opp.get("triage_model"):
+        costs = estimate_tiered_cost(_tier_usage(opp))
+        st.caption(
+            f"Triage ({opp['triage_model']}): {(opp.get('triage_prompt_tokens') or 0) + (opp.get('triage_completion_tokens') or 0)} tokens, "
+            f"${costs['triage']:.4f} · Full ({opp.get('analysis_model') or '—'}): ${costs['full']:.4f} · Total ${costs['total']:.4f}"
+        )
+
+def _tier_usage(opp: dict) -> dict:
+    return {
+        "triage": {
+            "model": opp.get("triage_model"),
+            "prompt_tokens": opp.get("triage_prompt_tokens"),
+            "completion_tokens": opp.get("triage_completion_tokens"),
+            "cached_prompt_tokens": opp.get("triage_cached_prompt_tokens"),
+        },
+        "full": {
+            "model": opp.get("analysis_model"),
+            "prompt_tokens": opp.get("prompt_tokens"),
+            "completion_tokens": opp.get("completion_tokens"),
+            "cached_prompt_tokens": opp.get("cached_prompt_tokens"),
+        },
+    }
+
+def render_triage(opp: dict):
+    """The triage tier's result, shown until a full analysis exists."""
+    t = json.loads(opp["triage_json"])
+    score = opp.get("triage_score")
+    threshold = triage_threshold()
+    st.subheader("Triage")
+    if score is not None:
+        verdict = "passes" if score >= threshold else "is below"
+        st.caption(f"Provisional score {score:.1f}/5 {verdict} the {threshold:.1f} threshold · "
+                   f"{opp['triage_model']}, ${opp.get('triage_cost_usd') or 0:.4f}")
+    _render_summary(t)
+    st.write(t.get("extracted_requirements", []))
+    st.dataframe(t.get("provisional_scores", []), hide_index=True, use_container_width=True)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_job_status(job_id: int):
+    """
+    Polls one queued/running job; reruns the whole page once it finishes.
+    A streaming job's sections are drawn as they arrive.
+    """
+    job = get_job(job_id)
+    if job["status"] == "queued":
+        ahead = queue_position(job_id)
+        st.info(f"Queued, {ahead} job(s) ahead." if ahead else "Queued, next to run.")
+    elif job["status"] == "running":
+        st.progress(job["progress"], text=job["progress_text"] or "Analyzing JD...")
+        partial = job["partial"] or {}
+        for render, fields in ANALYSIS_SECTIONS:
+            if any(f in partial for f in fields):
+                render(partial)
+    else:
+        st.session_state["job_finished"] = job_id
+        st.rerun(scope="app")
+
+def sync_sla(opp: dict) -> bool:
+    """Writes recomputed SLA fields if they changed. Returns True when it wrote."""
+    if not opp.get("day0_at"):
+        return False
+    with span("utils.compute_bucket"):
+        bucket = compute_bucket(opp["stage"], opp["day0_at"], opp["decision"])
+    if bucket["stage"] != opp["stage"] or bucket["bucket_due"] != opp.get("bucket_due") or bucket["next_action"] != (opp.get("next_action") or ""):
+        update_opportunity(opp["id"], {
+            "stage": bucket["stage"],
+            "bucket_due": bucket["bucket_due"],
+            "next_action": bucket["next_action"],
+            "next_action_due": bucket["next_action_due"],
+        })
+        return True
+    return False
+
+def render_due_queue():
+    st.title("Due queue")
+    c1, c2, c3 = st.columns([1, 1, 2])
+    horizon = c1.selectbox("Due within", [7, 14, 30, 90], format_func=lambda d: f"{d} days")
+    limit = c2.selectbox("Show", [50, 200, 1000], index=1)
+
+    # Sweeping first means rows that were never opened still show current buckets
+    last = st.session_state.get("last_sweep")
+    if c3.button("Re-sweep now") or last is None or time.time() - last[0] > SWEEP_INTERVAL_S:
+        last = st.session_state["last_sweep"] = (time.time(), sweep_buckets())
+    swept = last[1]
+
+    due_before = (datetime.utcnow() + timedelta(days=horizon)).date().isoformat() + "T23:59:59"
+    rows = list_due_queue(due_before=due_before, limit=limit)
+    st.caption(f"Last sweep: {swept['scanned']} active opportunities, {swept['updated']} updated")
+    if not rows:
+        st.info("Nothing due in this window.")
+        return
+    st.dataframe(rows, use_container_width=True, hide_index=True)
+
+def render_near_duplicates(opp: dict):
+    """Offers to link a fresh opportunity to an earlier posting of the same JD, or reuse its analysis."""
+    if opp.get("duplicate_of"):
+        st.caption(f"Linked as a repost of #{opp['duplicate_of']}.")
+        return
+    dismissed = st.session_state.setdefault("dup_dismissed", set())
+    if opp["has_analysis"] or opp["id"] in dismissed:
+        return
+    dups = near_duplicates(opp["id"])
+    if not dups:
+        return
+
+    d = dups[0]
+    st.warning(
+        f"This JD is ~{d['similarity']:.0%} similar to #{d['id']} — {d['company']} / {d['role_title']} ({d['stage']})."
+        + (f" {len(dups) - 1} more similar postings." if len(dups) > 1 else "")
+    )
+    c1, c2, c3 = st.columns(3)
+    if c1.button(f"Link to #{d['id']}", use_container_width=True):
+        update_opportunity(opp["id"], {"duplicate_of": d["id"]})
+        st.rerun()
+    if c2.button("Reuse its analysis", disabled=not d["has_analysis"], use_container_width=True,
+                 help="Copies the analysis without a model call. It stays anchored to the other JD's text, so the differences can be re-analyzed."):
+        src = get_opportunity(d["id"])
+        update_opportunity(opp["id"], {
+            "duplicate_of": d["id"],
+            "analysis_json": src["analysis_json"],
+            "analysis_model": src["analysis_model"],
+            "analysis_jd_text": src.get("analysis_jd_text") or src.get("jd_text"),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "estimated_cost_usd": 0.0,
+            "stage": "ANALYZED",
+        })
+        st.rerun()
+    if c3.button("Not a duplicate", use_container_width=True):
+        dismissed.add(opp["id"])
+        st.rerun()
+
+def render_import_export():
+    upload = st.file_uploader(
+        "Import JSONL or CSV", type=["jsonl", "ndjson", "csv"],
+        help="One opportunity per line/row: company, role_title, jd_link, jd_text, optional stage, decision, day0_at, analysis. "
+             "Rows whose link or JD text already exist are skipped.",
+    )
+    if upload is not None and st.button("Import", use_container_width=True):
+        bar = st.progress(0.0, text="Importing...")
+        total = upload.size or 1
+
+        def on_progress(s):
+            bar.progress(min(1.0, upload.tell() / total), text=f"{s['inserted']} inserted, {s['duplicates']} duplicates, {s['errors']} errors")
+
+        fp = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        r = transfer.import_opportunities(fp, transfer.detect_format(upload.name), on_progress=on_progress)
+        bar.progress(1.0, text="Done")
+        st.success(f"Imported {r['inserted']} of {r['read']} ({r['duplicates']} duplicates, {r['errors']} errors) in {r['seconds']:.1f}s")
+        if r["error_rows"]:
+            st.dataframe(r["error_rows"], hide_index=True, use_container_width=True)
+
+    fmt = st.radio("Export as", transfer.EXPORT_FORMATS, horizontal=True, format_func=lambda f: {"jsonl": "JSONL", "zip": "ZIP of JSON files"}[f])
+    if st.button("Prepare export", use_container_width=True):
+        previous = st.session_state.pop("export_file", None)
+        if previous and os.path.exists(previous[0]):
+            os.remove(previous[0])
+        # Streamed to a temp file rather than built in memory
+        with tempfile.NamedTemporaryFile(dir="data", suffix=f".{fmt}", delete=False) as fp:
+            n = transfer.write_export(fp, fmt)
+        st.session_state["export_file"] = (fp.name, fmt, n)
+    if st.session_state.get("export_file"):
+        path, fmt, n = st.session_state["export_file"]
+        with open(path, "rb") as fp:
+            st.download_button(
+                f"Download {n} opportunities", data=fp, file_name=f"opportunities.{fmt}",
+                mime="application/zip" if fmt == "zip" else "application/x-ndjson", use_container_width=True,
+            )
+
+def render_performance():
+    st.title("Performance")
+    c1, c2, c3 = st.columns([1, 1, 2])
+    window = c1.selectbox("Window", [1, 24, 24 * 7, 24 * 30], index=1, format_func=lambda h: f"last {h}h" if h < 48 else f"last {h // 24}d")
+    rate = c2.slider("Sampling rate", 0.0, 1.0, tracing.sample_rate(), 0.05, help="Share of requests traced (this process)")
+    tracing.set_sample_rate(rate)
+    if c3.button("Prune spans older than 30 days"):
+        st.caption(f"Removed {prune_spans((datetime.utcnow() - timedelta(days=30)).isoformat())} spans")
+
+    tracing.flush()
+    since = (datetime.utcnow() - timedelta(hours=window)).isoformat()
+
+    st.subheader("Latency per stage")
+    stages = span_percentiles(since)
+    if not stages:
+        st.info("No spans recorded in this window yet.")
+        return
+    st.dataframe(stages, use_container_width=True, hide_index=True, column_config={
+        k: st.column_config.NumberColumn(format="%.1f") for k in ("p50_ms", "p95_ms", "p99_ms", "mean_ms")
+    })
+
+    st.subheader("Token throughput")
+    tp = token_throughput(since)
+    if tp:
+        st.line_chart({"tokens/s": [r["tokens_per_s"] for r in tp], "tokens": [r["tokens"] for r in tp]})
+        st.dataframe(tp, use_container_width=True, hide_index=True)
+    else:
+        st.caption("No model calls in this window.")
+
+    st.subheader("Rate limiter and spend")
+    sp = governor.spend_summary()
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Prompt tokens", opp.get("prompt_tokens", 0))
-    c2.metric("Completion tokens", opp.get("completion_tokens", 0))
-    c3.metric("Total tokens", opp.get("total_tokens", 0))
-    c4.metric("Estimated cost ($)", f"${opp.get('estimated_cost_usd', 0):.4f}")
+    c1.metric("Spent today", f"${sp['today_usd']:.4f}", help=f"{sp['today_calls']} calls; budget: " + (f"${sp['daily_usd']:.2f}" if sp["daily_usd"] is not None else "none"))
+    c2.metric("Spent this month", f"${sp['month_usd']:.4f}", help="Budget: " + (f"${sp['monthly_usd']:.2f}" if sp["monthly_usd"] is not None else "none"))
+    c3.metric("Limits", f"{sp['rpm']} RPM", help=f"{sp['tpm']:,} tokens/min, shared by every session and worker")
+    c4.metric("Waiting now", sp["waiting"])
+    waits = [s for s in stages if s["stage"] == "llm.rate_wait"]
+    if waits:
+        st.caption(f"Wait for a rate-limit slot: p50 {waits[0]['p50_ms']:.0f}ms, p95 {waits[0]['p95_ms']:.0f}ms, p99 {waits[0]['p99_ms']:.0f}ms over {waits[0]['count']} calls")
+
+    st.subheader("Schema repairs")
+    rs = repair_stats(since)
+    if rs["outputs"]:
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Salvaged outputs", f"{rs['salvaged']}/{rs['outputs']}", help=f"{rs['fixed_locally']} fixed locally, no extra call")
+        c2.metric("Follow-up calls", rs["remote_attempts"])
+        c3.metric("Tokens saved", rs["tokens_saved"], help=f"vs. re-running; repairs billed {rs['extra_tokens']} tokens")
+        c4.metric("Time saved", f"{rs['seconds_saved']:.1f}s")
+    else:
+        st.caption("Every model output validated as returned.")
+
+    st.subheader("Slowest requests")
+    slow = slowest_traces(since)
+    st.dataframe(slow, use_container_width=True, hide_index=True)
+    if slow:
+        pick = st.selectbox("Drill down", range(len(slow)), format_func=lambda i: f"{slow[i]['name']} — {slow[i]['duration_ms']:.0f}ms @ {slow[i]['started_at']}")
+        st.dataframe(trace_spans(slow[pick]["trace_id"]), use_container_width=True, hide_index=True)
 
 def main():
     init_db()
+    jobs.start_workers()
+
+    with st.sidebar:
+        view = st.radio("View", ["Tracker", "Due queue", "Performance"], horizontal=True)
+
+    if view == "Due queue":
+        render_due_queue()
+        return
+    if view == "Performance":
+        render_performance()
+        return
 
     st.title("JD Copilot — Opportunity Tracker + Day Buckets")
 
@@ -127,6 +423,26 @@ def main():
         st.header("Your inputs")
         rubric = st.text_area("Rubric (core qualities)", value=DEFAULT_RUBRIC, height=180)
         profile = st.text_area("Profile (resume summary/story bank)", value=DEFAULT_PROFILE, height=220)
+        analysis_mode = st.radio(
+            "Analysis mode", ANALYSIS_MODES, index=0,
+            help="Streaming shows each section as it is written; Sectioned generates the sections in parallel.",
+        )
+        bypass_cache = st.checkbox("Bypass analysis cache", value=False, help="Always call the model, then refresh the cached result.")
+        triage_first = st.checkbox(
+            "Triage first", value=triage_enabled(),
+            help=f"A cheap pass on {triage_model()} scores the JD; the full analysis runs only if the mean "
+                 f"provisional score is at least {triage_threshold():.1f}.",
+        )
+
+        with st.expander("Analysis cache", expanded=False):
+            cs = cache_stats()
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Hits", cs["hits"])
+            c2.metric("Misses", cs["misses"])
+            c3.metric("Hit rate", f"{cs['hit_rate']:.0%}")
+            st.caption(f"{cs['entries']} entries, {cs['size_bytes'] / 1024:.1f} KB, {cs['evictions']} evicted, {cs['bypasses']} bypassed")
+            pu = prompt_cache_usage()
+            st.caption(f"Provider prompt cache: {pu['cached_share']:.0%} of {pu['prompt_tokens']} billed prompt tokens")
 
         st.divider()
         st.header("Add Opportunity")
@@ -143,23 +459,133 @@ def main():
                 st.success(f"Created opportunity #{oid}")
                 st.rerun()
 
+        with st.expander("Import / export", expanded=False):
+            render_import_export()
+
+        st.divider()
+        st.header("Batch analysis")
+        pending = count_unanalyzed_opportunities()
+        jc = job_counts()
+        st.caption(f"{pending} NEW opportunities with JD text · job queue: {jc['queued']} queued, {jc['running']} running")
+        concurrency = st.slider("Concurrency", 1, 32, DEFAULT_CONCURRENCY)
+        batch_ids = None
+        if st.checkbox("Pre-screen: best predicted fit first", key="batch_prescreen", disabled=not pending,
+                       help="Ranks NEW JDs locally against your profile and rubric, without calling the model."):
+            t0 = time.perf_counter()
+            ranked = prescreen.rank_new(profile, rubric)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+            f1, f2 = st.columns(2)
+            skip_dq = f1.checkbox("Skip likely DQs", key="batch_skip_dq")
+            top_n = f2.number_input("Only top N (0 = all)", min_value=0, value=0, step=5, key="batch_top_n")
+            candidates = [r for r in ranked if not (skip_dq and r["flags"])]
+            batch_ids = [r["id"] for r in candidates][:top_n or None]
+            st.caption(f"Ranked {len(ranked)} in {elapsed_ms:.0f} ms · {len(batch_ids)} will be analyzed")
+            with st.expander("Ranking", expanded=False):
+                titles = opportunity_titles([r["id"] for r in ranked[:50]])
+                st.dataframe(
+                    [
+                        {
+                            "id": r["id"],
+                            "company": titles.get(r["id"], {}).get("company"),
+                            "role": titles.get(r["id"], {}).get("role_title"),
+                            "fit": round(r["fit"], 3),
+                            "likely DQ": "; ".join(f"{f['code']}: {f['reason']}" for f in r["flags"]),
+                        }
+                        for r in ranked[:50]
+                    ],
+                    hide_index=True,
+                    use_container_width=True,
+                )
+        if st.button("Analyze all NEW" if batch_ids is None else f"Analyze {len(batch_ids)} NEW",
+                     use_container_width=True, disabled=not pending or batch_ids == []):
+            bar = st.progress(0.0, text="Starting batch...")
+
+            def on_done(item, finished, total):
+                bar.progress(finished / total, text=f"{finished}/{total} done")
+
+            try:
+                summary = asyncio.run(analyze_new_opportunities(
+                    rubric, profile, concurrency=concurrency,
+                    use_cache=not bypass_cache, on_done=on_done, ids=batch_ids, triage=triage_first,
+                ))
+            except Exception as e:
+                st.error(str(e))
+            else:
+                st.success(
+                    f"Analyzed {summary['succeeded']}/{summary['total']} in {summary['seconds']:.1f}s"
+                    + (f" ({summary['triaged_out']} stopped at triage)" if summary["triaged_out"] else "")
+                )
+                for f in summary["failed"]:
+                    st.error(f"#{f['id']}: {f['error']}")
+
         st.divider()
         st.header("Opportunities")
-        opps = list_opportunities()
+        text_query = st.text_input(
+            "Search JDs and analyses", key="opp_fts", placeholder='e.g. fintech kafka, "event streaming"',
+            help="Full-text, best match first. Words are ANDed; use quotes for phrases and * for prefixes.",
+        )
+        search = st.text_input("Search company", key="opp_search", placeholder="Company name prefix", disabled=bool(text_query.strip()))
+        f1, f2 = st.columns(2)
+        stage_filter = f1.selectbox("Stage", ["All"] + STAGES, key="opp_stage_filter")
+        decision_filter = f2.selectbox("Decision", ["All"] + DECISIONS, key="opp_decision_filter")
+        f1, f2 = st.columns(2)
+        due_by = f1.date_input("Bucket due by", value=None, key="opp_due_by")
+        page_size = f2.selectbox("Page size", PAGE_SIZES, index=1, key="opp_page_size")
+
+        # Stack of keyset cursors for the pages visited; reset when filters change
+        filters = (text_query, search, stage_filter, decision_filter, due_by, page_size)
+        if st.session_state.get("opp_filters") != filters:
+            st.session_state["opp_filters"] = filters
+            st.session_state["opp_cursors"] = [None]
+        cursors = st.session_state["opp_cursors"]
+
+        if text_query.strip():
+            # Ranked results: one page of best matches, no keyset paging
+            opps = search_opportunities(
+                text_query,
+                limit=page_size,
+                stage=None if stage_filter == "All" else stage_filter,
+                decision=None if decision_filter == "All" else decision_filter,
+            )
+            next_cursor = None
+        else:
+            opps, next_cursor = list_opportunities_page(
+                limit=page_size,
+                after=cursors[-1],
+                stage=None if stage_filter == "All" else stage_filter,
+                decision=None if decision_filter == "All" else decision_filter,
+                company_prefix=search,
+                due_to=f"{due_by.isoformat()}T23:59:59" if due_by else None,
+            )
         labels = [f"#{o['id']} — {o['company']} / {o['role_title']} ({o['stage']})" for o in opps]
         selected_idx = st.selectbox("Select", range(len(opps)) if opps else [], format_func=lambda i: labels[i] if opps else "")
         selected_id = opps[selected_idx]["id"] if opps else None
+        if opps and opps[selected_idx].get("snippet"):
+            st.caption(opps[selected_idx]["snippet"])
+        elif text_query.strip() and not opps:
+            st.caption("No matches.")
+
+        p1, p2, p3 = st.columns([1, 1, 1])
+        if p1.button("◀ Prev", disabled=len(cursors) == 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+        p2.caption(f"Page {len(cursors)}")
+        if p3.button("Next ▶", disabled=next_cursor is None, use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
 
     if not selected_id:
         st.info("Create or select an opportunity to begin.")
         return
 
-    opp = get_opportunity(selected_id)
+    # Header only: the JD and analysis blobs are loaded where they're shown
+    opp = get_opportunity_header(selected_id)
     if not opp:
         st.error("Opportunity not found.")
         return
 
     st.subheader(f"#{opp['id']} — {opp['company']} / {opp['role_title']}")
+    render_near_duplicates(opp)
 
     c1, c2, c3 = st.columns([2, 1, 1])
     with c1:
@@ -167,42 +593,41 @@ def main():
         role_edit = st.text_input("Role Title", value=opp["role_title"])
         link_edit = st.text_input("JD Link", value=opp.get("jd_link") or "")
     with c2:
-        stage = st.selectbox("Stage", ["NEW","ANALYZED","DECISION_PENDING","QUALIFIED_PREP","APPLIED","INTERVIEWING","CLOSED","DQ"], index=["NEW","ANALYZED","DECISION_PENDING","QUALIFIED_PREP","APPLIED","INTERVIEWING","CLOSED","DQ"].index(opp["stage"]))
-        decision = st.selectbox("Decision", ["PENDING","QUALIFIED","UNQUALIFIED"], index=["PENDING","QUALIFIED","UNQUALIFIED"].index(opp["decision"]))
+        stage = st.selectbox("Stage", STAGES, index=STAGES.index(opp["stage"]))
+        decision = st.selectbox("Decision", DECISIONS, index=DECISIONS.index(opp["decision"]))
     with c3:
         st.caption("SLA / Next action")
         st.write("Bucket due:", opp.get("bucket_due") or "—")
         st.write("Next action:", opp.get("next_action") or "—")
         st.write("Next due:", opp.get("next_action_due") or "—")
 
-    jd_text_edit = st.text_area("JD Text", value=opp.get("jd_text") or "", height=220)
+    show_jd = st.toggle("Show / edit JD text", value=not opp["has_analysis"], key=f"show_jd_{opp['id']}")
+    jd_text_edit = None
+    if show_jd:
+        jd_text_edit = st.text_area("JD Text", value=get_jd_text(opp["id"]) or "", height=220)
 
     if st.button("Save fields"):
-        update_opportunity(opp["id"], {
+        fields = {
             "company": company_edit,
             "role_title": role_edit,
             "jd_link": link_edit,
-            "jd_text": jd_text_edit,
             "stage": stage,
             "decision": decision
-        })
-        opp = get_opportunity(selected_id)
+        }
+        if jd_text_edit is not None:
+            fields["jd_text"] = jd_text_edit
+        # Field save and SLA recompute land in a single commit
+        with transaction():
+            update_opportunity(opp["id"], fields)
+            sync_sla(get_opportunity_header(selected_id))
         st.success("Saved.")
         st.rerun()
 
     st.divider()
 
     # Compute SLA updates
-    if opp.get("day0_at"):
-        bucket = compute_bucket(opp["stage"], opp["day0_at"], opp["decision"])
-        if bucket["stage"] != opp["stage"] or bucket["bucket_due"] != opp.get("bucket_due") or bucket["next_action"] != (opp.get("next_action") or ""):
-            update_opportunity(opp["id"], {
-                "stage": bucket["stage"],
-                "bucket_due": bucket["bucket_due"],
-                "next_action": bucket["next_action"],
-                "next_action_due": bucket["next_action_due"],
-            })
-            opp = get_opportunity(selected_id)
+    if sync_sla(opp):
+        opp = get_opportunity_header(selected_id)
 
     # Decision / DQ handling
     st.subheader("Qualification")
@@ -227,51 +652,111 @@ def main():
     st.divider()
 
     st.subheader("Day 0 Analysis")
-    run_btn = st.button("Run Day 0 analysis", type="primary")
-    if run_btn:
-        if not (opp.get("jd_text") or "").strip():
+    job = latest_job(opp["id"], "day0")
+    job_active = job is not None and job["status"] in jobs.ACTIVE
+    if st.button("Run Day 0 analysis", type="primary", disabled=job_active):
+        jd_text = get_jd_text(opp["id"]) or ""
+        if not jd_text.strip():
             st.error("Paste the JD text first.")
         else:
-            with st.spinner("Analyzing JD..."):
-                try:
-                    result = run_day0_analysis(
-                        jd_text=opp["jd_text"],
-                        company=opp["company"],
-                        role_title=opp["role_title"],
-                        user_rubric=rubric,
-                        user_profile=profile,
-                    )
-                    analysis = result["analysis"]
-                    model = result["model"]
-                    
-                    prompt_tokens = result["prompt_tokens"]
-                    completion_tokens = result["completion_tokens"]
-                    total_tokens = result["total_tokens"]
-                    
-                    estimated_cost = estimate_openai_cost(
-                        prompt_tokens,
-                        completion_tokens,
-                        model
-                    )
-                    
-                    update_opportunity(opp["id"], {
-                        "analysis_json": json.dumps(analysis),
-                        "analysis_model": model,
-                        "prompt_tokens": prompt_tokens,
-                        "completion_tokens": completion_tokens,
-                        "total_tokens": total_tokens,
-                        "estimated_cost_usd": estimated_cost,
-                        "stage": "ANALYZED"
-                    })
-
-                    st.success("Analysis saved.")
-                    st.rerun()
-                except Exception as e:
-                    st.error(str(e))
-
-    if opp.get("analysis_json"):
-        analysis = json.loads(opp["analysis_json"])
-        render_analysis(analysis)
+            try:
+                job = jobs.enqueue_day0(
+                    opp, jd_text, rubric, profile, mode=JOB_MODES[analysis_mode], use_cache=not bypass_cache, triage=triage_first,
+                )
+            except Exception as e:
+                st.error(str(e))
+            else:
+                job_active = True
+
+    if job_active:
+        render_job_status(job["id"])
+    elif job and job["status"] == "failed":
+        st.error(f"Analysis failed: {job['error']}")
+    elif job and st.session_state.get("job_finished") == job["id"]:
+        del st.session_state["job_finished"]
+        if job["result"].get("triage_only"):
+            st.info("Triage score below the threshold; the full analysis was skipped.")
+        else:
+            st.success("Analysis saved (served from cache, no tokens billed)." if job["result"]["cached"] else "Analysis saved.")
+
+    if opp.get("triage_json") and not opp["has_analysis"]:
+        render_triage(opp)
+        if st.button("Run full analysis", disabled=job_active):
+            try:
+                job = jobs.enqueue_day0(
+                    opp, get_jd_text(opp["id"]) or "", rubric, profile, mode=JOB_MODES[analysis_mode], use_cache=not bypass_cache,
+                )
+            except Exception as e:
+                st.error(str(e))
+            else:
+                st.rerun()
+
+    if opp["has_analysis"]:
+        analysis = get_analysis(opp["id"], opp["updated_at"])
+
+        if opp["jd_changed"]:
+            c1, c2 = st.columns([3, 1])
+            c1.warning("The JD text changed since this analysis was produced.")
+            if c2.button("Re-analyze changes", use_container_width=True):
+                with st.spinner("Re-analyzing the edited passages..."):
+                    try:
+                        result = run_day0_reanalysis(
+                            old_jd_text=get_jd_text(opp["id"], "analysis_jd_text"),
+                            new_jd_text=get_jd_text(opp["id"]) or "",
+                            prior_analysis=analysis,
+                            company=opp["company"],
+                            role_title=opp["role_title"],
+                            user_rubric=rubric,
+                            user_profile=profile,
+                        )
+                        if result["skipped"]:
+                            # Nothing material changed: just re-anchor the analysis to the new text
+                            update_opportunity(opp["id"], {"analysis_jd_text": result["source_jd_text"]})
+                        else:
+                            update_opportunity(opp["id"], analysis_update_fields(result, opp))
+                        st.rerun()
+                    except Exception as e:
+                        st.error(str(e))
+
+        render_analysis(analysis, opp)
+
+        history = analysis_history(opp["id"])
+        if history:
+            with st.expander(f"Analysis history ({len(history)} earlier versions)", expanded=False):
+                saved = sum(h["full_bytes"] - h["delta_bytes"] for h in history)
+                st.caption(f"Stored as deltas: {sum(h['delta_bytes'] for h in history)} bytes ({saved} bytes saved vs full copies)")
+                pick = st.selectbox(
+                    "Version", range(len(history)),
+                    format_func=lambda i: f"superseded {history[i]['superseded_at'][:16]} ({history[i]['analysis_model'] or 'unknown model'})",
+                )
+                old_version = analysis_version(opp["id"], history[pick]["id"])
+                if old_version is not None:
+                    st.json(old_version, expanded=False)
+
+        with st.expander("Regenerate a section", expanded=False):
+            st.caption("Re-runs only that part of the analysis; only its tokens are billed.")
+            usage = json.loads(opp.get("section_usage_json") or "{}")
+            for name, fields in JD_SECTIONS.items():
+                c1, c2 = st.columns([3, 1])
+                u = usage.get(name)
+                c1.markdown(f"**{name}** — {', '.join(fields)}")
+                c1.caption(f"{u['total_tokens']} tokens, generated {u['generated_at'][:16]}" if u else "No per-section usage recorded")
+                if c2.button("Regenerate", key=f"regen_{name}", use_container_width=True):
+                    with st.spinner(f"Regenerating {name}..."):
+                        try:
+                            result = run_day0_analysis_sectioned(
+                                jd_text=get_jd_text(opp["id"]) or "",
+                                company=opp["company"],
+                                role_title=opp["role_title"],
+                                user_rubric=rubric,
+                                user_profile=profile,
+                                sections=[name],
+                                prior_analysis=analysis,
+                            )
+                            update_opportunity(opp["id"], analysis_update_fields(result, opp))
+                            st.rerun()
+                        except Exception as e:
+                            st.error(str(e))
 
         st.download_button(
             "Download analysis JSON",
@@ -282,5 +767,6 @@ def main():
 
 if __name__ == "__main__":
 
-    main()
+    with span("app.rerun"):
+        main()
 
@@ -0,0 +1,220 @@
+# batch.py
+"""
+Concurrent Day 0 analysis for every NEW opportunity with JD text.
+
+    python batch.py --rubric-file rubric.txt --profile-file profile.txt --concurrency 8
+    python batch.py ... --prescreen --skip-dq --top 20     # best predicted fit first
+    python batch.py ... --no-triage                         # skip the cheap triage tier
+
+Each item is persisted through db.update_opportunity as soon as it finishes,
+so a failure only loses that one opportunity. With triage, each JD is first
+scored by the cheap triage model and only those passing the threshold get
+the full analysis. JDs that stopped at triage stay NEW; later runs reuse their
+stored triage while the JD text and triage model are unchanged.
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import openai
+
+import db
+import governor
+import prescreen
+from llm import (
+    analysis_update_fields,
+    default_model,
+    get_async_client,
+    run_day0_analysis_async,
+    run_day0_triage_async,
+    triage_enabled,
+    triage_is_current,
+    triage_passed,
+    triage_update_fields,
+)
+
+DEFAULT_CONCURRENCY = 8
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_S = 1.0
+BACKOFF_CAP_S = 60.0
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code >= 500
+    return False
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries out so workers don't stampede together
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+
+async def _analyze_one(
+    client,
+    opp: Dict[str, Any],
+    rubric: str,
+    profile: str,
+    model: str,
+    sem: asyncio.Semaphore,
+    use_cache: bool,
+    triage: bool = False,
+) -> Dict[str, Any]:
+    # RPM/TPM admission (and the pause after a 429) happens in the shared
+    # limiter inside the llm calls
+    kwargs = dict(
+        jd_text=opp["jd_text"],
+        company=opp["company"],
+        role_title=opp["role_title"],
+        user_rubric=rubric,
+        user_profile=profile,
+        use_cache=use_cache,
+    )
+    async with sem:
+        started = time.monotonic()
+        fields: Dict[str, Any] = {}
+        triage_tokens = 0
+        if triage and triage_is_current(opp):
+            # Already triaged on this exact JD: reuse the stored score rather than pay again
+            triage = False
+            if not triage_passed({"score": opp["triage_score"]}):
+                return {"id": opp["id"], "ok": True, "triaged_out": True, "cached": True, "attempts": 0,
+                        "total_tokens": 0, "seconds": time.monotonic() - started}
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                if triage and not fields:
+                    t = await run_day0_triage_async(client, **kwargs)
+                    fields = triage_update_fields(t, opp["jd_text"])
+                    triage_tokens = t["total_tokens"]
+                    if not triage_passed(t):
+                        await asyncio.to_thread(db.update_opportunity, opp["id"], fields)
+                        return {"id": opp["id"], "ok": True, "triaged_out": True, "cached": t["cached"],
+                                "attempts": attempt + 1, "total_tokens": t["total_tokens"],
+                                "seconds": time.monotonic() - started}
+                result = await run_day0_analysis_async(client, **kwargs, model=model)
+            except Exception as e:
+                if not _is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                    if fields:
+                        # The triage was paid for; keep it so a rerun doesn't triage again
+                        await asyncio.to_thread(db.update_opportunity, opp["id"], fields)
+                    return {"id": opp["id"], "ok": False, "error": str(e), "attempts": attempt + 1,
+                            "total_tokens": triage_tokens, "seconds": time.monotonic() - started}
+                await asyncio.sleep(_retry_after(e) or _backoff(attempt))
+                continue
+
+            # Off the loop, so the other in-flight items keep going while SQLite writes
+            await asyncio.to_thread(db.update_opportunity, opp["id"], {**fields, **analysis_update_fields(result)})
+            return {"id": opp["id"], "ok": True, "cached": result["cached"], "attempts": attempt + 1,
+                    "total_tokens": result["total_tokens"] + triage_tokens, "seconds": time.monotonic() - started}
+
+async def analyze_new_opportunities(
+    rubric: str,
+    profile: str,
+    model: Optional[str] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    rpm: Optional[int] = None,
+    tpm: Optional[int] = None,
+    use_cache: bool = True,
+    on_done: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+    ids: Optional[List[int]] = None,
+    triage: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """
+    Analyzes every NEW opportunity with jd_text, or only those in ids, started
+    in that order (e.g. prescreen.rank_new() order, so spend goes to the best
+    fits first). on_done(item, finished, total) is called after each item for
+    progress reporting. rpm / tpm override the shared limiter's configured
+    limits while the batch runs. triage defaults to llm.triage_enabled().
+    """
+    opps = db.list_unanalyzed_opportunities()
+    if ids is not None:
+        by_id = {o["id"]: o for o in opps}
+        opps = [by_id[i] for i in ids if i in by_id]
+    model = model or default_model()
+    triage = triage_enabled() if triage is None else triage
+    started = time.monotonic()
+    results: List[Dict[str, Any]] = []
+    if opps:
+        # Retries are handled here so they respect the shared throttle
+        client = get_async_client(max_retries=0)
+        sem = asyncio.Semaphore(max(1, concurrency))
+        try:
+            with governor.configure(rpm=rpm, tpm=tpm):
+                tasks = [
+                    asyncio.create_task(_analyze_one(client, o, rubric, profile, model, sem, use_cache, triage))
+                    for o in opps
+                ]
+                for fut in asyncio.as_completed(tasks):
+                    item = await fut
+                    results.append(item)
+                    if on_done:
+                        on_done(item, len(results), len(opps))
+        finally:
+            await client.close()
+
+    return {
+        "total": len(opps),
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": [r for r in results if not r["ok"]],
+        "cached": sum(1 for r in results if r.get("cached")),
+        "triaged_out": sum(1 for r in results if r.get("triaged_out")),
+        "total_tokens": sum(r.get("total_tokens", 0) for r in results),
+        "seconds": time.monotonic() - started,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Run Day 0 analysis for every NEW opportunity with JD text.")
+    p.add_argument("--rubric-file", required=True)
+    p.add_argument("--profile-file", required=True)
+    p.add_argument("--model", default=None)
+    p.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    p.add_argument("--rpm", type=int, default=None, help=f"Default: OPENAI_RPM or {governor.DEFAULT_RPM}")
+    p.add_argument("--tpm", type=int, default=None, help=f"Default: OPENAI_TPM or {governor.DEFAULT_TPM}")
+    p.add_argument("--no-cache", action="store_true", help="Bypass the analysis cache")
+    p.add_argument("--no-triage", action="store_true", help="Run the full analysis without the triage tier")
+    p.add_argument("--prescreen", action="store_true", help="Analyze in order of locally predicted fit")
+    p.add_argument("--skip-dq", action="store_true", help="With --prescreen, skip opportunities with likely DQ flags")
+    p.add_argument("--top", type=int, default=None, help="With --prescreen, analyze only the best N")
+    args = p.parse_args(argv)
+
+    with open(args.rubric_file, encoding="utf-8") as f:
+        rubric = f.read()
+    with open(args.profile_file, encoding="utf-8") as f:
+        profile = f.read()
+
+    db.init_db()
+    ids = None
+    if args.prescreen:
+        ranked = prescreen.rank_new(profile, rubric)
+        ids = [r["id"] for r in ranked if not (args.skip_dq and r["flags"])][:args.top]
+        print(f"Pre-screened {len(ranked)} NEW opportunities; analyzing {len(ids)}", flush=True)
+
+    def progress(item, finished, total):
+        status = "ok" if item["ok"] else f"FAILED: {item['error']}"
+        print(f"[{finished}/{total}] #{item['id']} {status} ({item['seconds']:.1f}s)", flush=True)
+
+    summary = asyncio.run(analyze_new_opportunities(
+        rubric, profile, model=args.model, concurrency=args.concurrency,
+        rpm=args.rpm, tpm=args.tpm, use_cache=not args.no_cache, on_done=progress, ids=ids,
+        triage=False if args.no_triage else None,
+    ))
+    print(
+        f"Analyzed {summary['succeeded']}/{summary['total']} "
+        f"({summary['cached']} from cache, {summary['triaged_out']} below the triage threshold, "
+        f"{summary['total_tokens']} tokens) in {summary['seconds']:.1f}s"
+    )
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
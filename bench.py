@@ -0,0 +1,212 @@
+# bench.py
+"""
+End-to-end benchmark suite, run entirely offline against fake_openai.
+
+    python bench.py                      # scales 1, 100, 10000
+    python bench.py --scales 1,100 --latency-ms 20
+
+Results are appended to bench_output.txt (and echoed) so runs can be
+compared over time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+os.environ["OPENAI_FAKE"] = "1"
+
+import db  # noqa: E402
+import governor  # noqa: E402
+import llm  # noqa: E402
+from batch import analyze_new_opportunities  # noqa: E402
+from fake_openai import FakeConfig, fake_analysis  # noqa: E402
+from utils import compute_bucket  # noqa: E402
+
+OUTPUT_PATH = "bench_output.txt"
+BATCH_ERROR_RATE = 0.0
+# Every LLM path runs under these so the rows time the code, not the shared throttle
+UNTHROTTLED = {"rpm": 10**9, "tpm": 10**12}
+
+BENCH_RUBRIC = """1) Autonomy
+2) Scope/Impact
+3) Learning/Growth
+4) Manager/Team quality signals
+5) Role clarity vs ambiguity
+6) Domain fit
+7) Execution intensity (pace, cross-functional load)
+8) Comp/level alignment signals
+"""
+BENCH_PROFILE = "- 8 years product management, B2B SaaS\n- Led payments platform launch (+30% GMV)\n- SQL, Kafka, experimentation\n"
+
+_WORDS = ("platform data customers payments growth roadmap stakeholders launch metrics "
+          "experimentation kafka analytics ownership scale reliability api partners").split()
+
+def synthetic_jd(i: int, sentences: int = 60) -> str:
+    rng = random.Random(i)
+    lines = [f"Role {i}: Senior Product Manager at Company {i}."]
+    for _ in range(sentences):
+        lines.append(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 18))).capitalize() + ".")
+    return "\n".join(lines)
+
+def _timeit(fn: Callable[[], object], repeat: int = 1) -> float:
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t) / repeat
+
+def _per_op(label: str, n: int, seconds: float) -> str:
+    return f"{label:<44} n={n:<6} total {seconds * 1000:10.1f}ms  per-op {seconds / max(n, 1) * 1e6:10.1f}us"
+
+def _fresh_db(tmp: str, name: str) -> None:
+    db.close_connections()
+    db.DB_PATH = os.path.join(tmp, f"{name}.sqlite")
+    db.init_db()
+
+def _seed(n: int, analyzed: bool = False) -> List[int]:
+    ids = [db.create_opportunity(f"Company {i}", f"Role {i}", "", synthetic_jd(i)) for i in range(n)]
+    if analyzed:
+        blob = json.dumps(fake_analysis([{"content": BENCH_RUBRIC + "JOB DESCRIPTION\n" + synthetic_jd(0)}]))
+        with db.transaction():
+            for oid in ids:
+                db.update_opportunity(oid, {"analysis_json": blob, "stage": "ANALYZED"})
+    return ids
+
+def bench_llm(tmp: str, n: int) -> List[str]:
+    with governor.configure(**UNTHROTTLED):
+        return _bench_llm(tmp, n)
+
+def _bench_llm(tmp: str, n: int) -> List[str]:
+    _fresh_db(tmp, f"llm_{n}")
+    lines = []
+    if n == 1:
+        jd = synthetic_jd(0)
+        kw = dict(jd_text=jd, company="Company 0", role_title="Role 0", user_rubric=BENCH_RUBRIC, user_profile=BENCH_PROFILE)
+        lines.append(_per_op("run_day0_analysis (cache miss)", 1, _timeit(lambda: llm.run_day0_analysis(**kw))))
+        lines.append(_per_op("run_day0_analysis (cache hit)", 1, _timeit(lambda: llm.run_day0_analysis(**kw))))
+
+        t = time.perf_counter()
+        first = None
+        for kind, _, _ in llm.stream_day0_analysis(**kw, use_cache=False):
+            if first is None and kind == "field":
+                first = time.perf_counter() - t
+        total = time.perf_counter() - t
+        lines.append(f"{'stream_day0_analysis first field / full':<44} n=1      "
+                     f"{(first or 0) * 1000:10.1f}ms / {total * 1000:.1f}ms")
+        return lines
+
+    _seed(n)
+    if n <= 100:
+        opps = db.list_unanalyzed_opportunities()
+        seq = _timeit(lambda: [
+            llm.run_day0_analysis(o["jd_text"], o["company"], o["role_title"], BENCH_RUBRIC, BENCH_PROFILE, use_cache=False)
+            for o in opps
+        ])
+        lines.append(_per_op("run_day0_analysis sequential", n, seq))
+
+    # Injected 429/500s only apply to the batch path, which retries them
+    os.environ["OPENAI_FAKE_ERROR_RATE"] = str(BATCH_ERROR_RATE)
+    for concurrency in (8, 64):
+        _fresh_db(tmp, f"llm_{n}_c{concurrency}")
+        _seed(n)
+        t = time.perf_counter()
+        summary = asyncio.run(analyze_new_opportunities(
+            BENCH_RUBRIC, BENCH_PROFILE, concurrency=concurrency, use_cache=False,
+        ))
+        lines.append(_per_op(f"batch analysis concurrency={concurrency} ({summary['succeeded']} ok)", n, time.perf_counter() - t))
+    os.environ["OPENAI_FAKE_ERROR_RATE"] = "0"
+    return lines
+
+def bench_db(tmp: str, n: int) -> List[str]:
+    _fresh_db(tmp, f"crud_{n}")
+    lines = []
+    jds = [synthetic_jd(i) for i in range(n)]
+    t = time.perf_counter()
+    ids = [db.create_opportunity(f"Company {i}", f"Role {i}", "", jds[i]) for i in range(n)]
+    lines.append(_per_op("create_opportunity", n, time.perf_counter() - t))
+    lines.append(_per_op("get_opportunity", n, _timeit(lambda: [db.get_opportunity(i) for i in ids])))
+    lines.append(_per_op("update_opportunity", n, _timeit(lambda: [db.update_opportunity(i, {"next_action": "x"}) for i in ids])))
+    pages = max(1, min(n // 50, 20))
+
+    def paginate() -> None:
+        cursor = None
+        for _ in range(pages):
+            _, cursor = db.list_opportunities_page(limit=50, after=cursor)
+            if cursor is None:
+                break
+    lines.append(_per_op("list_opportunities_page (50/page)", pages, _timeit(paginate)))
+    return lines
+
+def bench_buckets(tmp: str, n: int) -> List[str]:
+    rng = random.Random(n)
+    rows = [(rng.choice(["NEW", "ANALYZED", "APPLIED", "INTERVIEWING"]), datetime.utcnow().isoformat(),
+             rng.choice(["PENDING", "QUALIFIED", "UNQUALIFIED"])) for _ in range(n)]
+    now = datetime.utcnow()
+    lines = [_per_op("compute_bucket", n, _timeit(lambda: [compute_bucket(s, d, dec, now=now) for s, d, dec in rows]))]
+    _fresh_db(tmp, f"sweep_{n}")
+    _seed(n)
+    lines.append(_per_op("sweep_buckets", n, _timeit(db.sweep_buckets)))
+    return lines
+
+def bench_render_prep(tmp: str, n: int) -> List[str]:
+    """The data work a tracker rerun does before any Streamlit drawing."""
+    _fresh_db(tmp, f"render_{n}")
+    ids = _seed(n, analyzed=True)
+    samples = []
+    for oid in ids[: min(n, 200)]:
+        t = time.perf_counter()
+        opps, _ = db.list_opportunities_page(limit=50)
+        [f"#{o['id']} — {o['company']} / {o['role_title']} ({o['stage']})" for o in opps]
+        opp = db.get_opportunity(oid)
+        json.loads(opp["analysis_json"])
+        samples.append(time.perf_counter() - t)
+    return [f"{'render-path prep (page+get+parse)':<44} n={n:<6} p50 {statistics.median(samples) * 1e6:10.1f}us  "
+            f"max {max(samples) * 1e6:10.1f}us"]
+
+def run(scales: List[int], llm_scales: List[int]) -> List[str]:
+    lines = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in scales:
+            lines.append(f"-- {n} opportunities --")
+            if n in llm_scales:
+                lines += bench_llm(tmp, n)
+            lines += bench_db(tmp, n)
+            lines += bench_buckets(tmp, n)
+            lines += bench_render_prep(tmp, n)
+        db.close_connections()
+    return lines
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--scales", default="1,100,10000")
+    p.add_argument("--llm-scales", default="1,100,10000", help="Scales at which to drive the (fake) LLM")
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--output", default=OUTPUT_PATH)
+    args = p.parse_args()
+
+    global BATCH_ERROR_RATE
+    BATCH_ERROR_RATE = args.error_rate
+    os.environ["OPENAI_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["OPENAI_FAKE_ERROR_RATE"] = "0"
+    os.environ.setdefault("OPENAI_FAKE_CHUNK_DELAY_MS", "2")
+    cfg = FakeConfig.from_env()
+
+    scales = [int(s) for s in args.scales.split(",") if s]
+    llm_scales = [int(s) for s in args.llm_scales.split(",") if s]
+    header = (f"=== bench {datetime.utcnow().isoformat(timespec='seconds')}Z "
+              f"fake latency={cfg.latency_ms}ms batch error_rate={BATCH_ERROR_RATE} ===")
+    print(header, flush=True)
+    lines = run(scales, llm_scales)
+    for line in lines:
+        print(line)
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write("\n".join([header] + lines) + "\n\n")
+
+if __name__ == "__main__":
+    main()
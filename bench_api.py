@@ -0,0 +1,237 @@
+# bench_api.py
+"""
+Load test for server.py: requests/sec and latency percentiles per endpoint.
+
+Seeds a throwaway database with N opportunities, starts server.py on it in a
+subprocess (fake OpenAI client, so analyses cost nothing) and drives it from
+`--connections` keep-alive connections for each scenario in turn:
+
+    get         GET /opportunities/{id}, full payload
+    get_304     the same with If-None-Match, answered 304 without a body
+    list        GET /opportunities?limit=50
+    search      GET /opportunities?q=...
+    patch       PATCH /opportunities/{id}
+    create      POST /opportunities
+    analyze     POST /opportunities/{id}/analysis with wait (fake model)
+
+    python bench_api.py --rows 5000 --connections 32 --seconds 5
+    python bench_api.py --url http://127.0.0.1:8765 --scenarios get,get_304,list
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import db
+from utils import jd_hash
+
+# get_304 replays ETags fetched up front, so it runs before patch / analyze change them
+SCENARIOS = ("get", "get_304", "list", "search", "patch", "create", "analyze")
+RUBRIC = "Autonomy, scope and impact, growth, team quality, role clarity, domain fit (fintech, payments)"
+PROFILE = "- 6 years as a product manager on payments and fintech platforms\n- sql, python, kafka"
+
+_WORDS = (
+    "product platform data payments growth roadmap customers stakeholders analytics experiment "
+    "launch strategy engineering design research metrics mobile api infrastructure security"
+).split()
+
+def _seed(rows: int) -> None:
+    rnd = random.Random(7)
+    ts = db.now_iso()
+    texts = [" ".join(rnd.choice(_WORDS) for _ in range(rnd.randint(150, 300))) for _ in range(rows)]
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO opportunities (created_at, updated_at, company, role_title, jd_text, jd_hash, stage, decision, day0_at)
+            VALUES (?, ?, ?, 'PM', ?, ?, 'NEW', 'PENDING', ?)
+        """, [(ts, ts, f"Company {i}", db.pack_text(t), jd_hash(t), ts) for i, t in enumerate(texts)])
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _start_server(workdir: str, port: int) -> subprocess.Popen:
+    # Unthrottled unless asked otherwise, so analyze times the server rather than the shared limiter
+    env = dict(
+        os.environ, OPENAI_FAKE="1", OPENAI_FAKE_LATENCY_MS=os.getenv("OPENAI_FAKE_LATENCY_MS", "50"),
+        OPENAI_RPM=os.getenv("OPENAI_RPM", str(10**9)), OPENAI_TPM=os.getenv("OPENAI_TPM", str(10**12)),
+    )
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    proc = subprocess.Popen(
+        [sys.executable, server, "--port", str(port), "--workers", "0"],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    # The server prints one line once it is listening
+    line = proc.stdout.readline()
+    if "Serving on" not in line:
+        proc.kill()
+        raise RuntimeError(f"server.py did not start: {line}{proc.stdout.read()}")
+    return proc
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; just enough client for JSON requests."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = b"" if body is None else json.dumps(body).encode("utf-8")
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(data)}"]
+        if data:
+            head.append("Content-Type: application/json")
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        resp_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            resp_headers[k.strip().lower()] = v.strip()
+        length = int(resp_headers.get("content-length", 0))
+        return status, resp_headers, await self.reader.readexactly(length) if length else b""
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+async def _drive(host: str, port: int, connections: int, seconds: float, make: Callable[[random.Random], Tuple], expect: Tuple[int, ...]) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(i: int) -> None:
+        nonlocal errors
+        rnd = random.Random(i)
+        conn = Connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body, headers = make(rnd)
+                t = time.perf_counter()
+                status, _, _ = await conn.request(method, path, body, headers)
+                latencies.append((time.perf_counter() - t) * 1000)
+                if status not in expect:
+                    errors += 1
+        finally:
+            await conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": _percentile(latencies, 0.50),
+        "p90": _percentile(latencies, 0.90),
+        "p99": _percentile(latencies, 0.99),
+        "max": latencies[-1],
+        "errors": errors,
+    }
+
+async def _run(host: str, port: int, scenarios: List[str], connections: int, seconds: float) -> None:
+    conn = Connection(host, port)
+    _, _, body = await conn.request("GET", "/opportunities?limit=200")
+    ids = [r["id"] for r in json.loads(body)["items"]]
+    if not ids:
+        raise SystemExit("No opportunities to load-test against.")
+    etags = {}
+    for oid in ids:
+        _, headers, _ = await conn.request("GET", f"/opportunities/{oid}")
+        etags[oid] = headers["etag"]
+    await conn.close()
+
+    def get(rnd):
+        return "GET", f"/opportunities/{rnd.choice(ids)}", None, None
+
+    def get_304(rnd):
+        oid = rnd.choice(ids)
+        return "GET", f"/opportunities/{oid}", None, {"If-None-Match": etags[oid]}
+
+    def listing(rnd):
+        return "GET", "/opportunities?limit=50", None, None
+
+    def search(rnd):
+        return "GET", f"/opportunities?q={rnd.choice(_WORDS)}&limit=20", None, None
+
+    def patch(rnd):
+        return "PATCH", f"/opportunities/{rnd.choice(ids)}", {"jd_link": f"https://example.com/{rnd.random()}"}, None
+
+    def create(rnd):
+        return "POST", "/opportunities", {"company": f"Load {rnd.random()}", "role_title": "PM", "jd_text": " ".join(rnd.sample(_WORDS, 12))}, None
+
+    def analyze(rnd):
+        return "POST", f"/opportunities/{rnd.choice(ids)}/analysis", {
+            "rubric": RUBRIC, "profile": PROFILE, "wait": True, "triage": False, "use_cache": False,
+        }, None
+
+    plans = {
+        "get": (get, (200,)),
+        "get_304": (get_304, (304,)),
+        "list": (listing, (200,)),
+        "search": (search, (200,)),
+        "patch": (patch, (200,)),
+        "create": (create, (201,)),
+        "analyze": (analyze, (200,)),
+    }
+    print(f"{connections} connections, {seconds:g}s per scenario, {len(ids)} ids")
+    print(f"{'scenario':>9} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    for name in scenarios:
+        make, expect = plans[name]
+        r = await _drive(host, port, connections, seconds, make, expect)
+        print(f"{name:>9} {r['requests']:>9} {r['rps']:>9.0f} {r['p50']:>8.1f} {r['p90']:>8.1f} {r['p99']:>8.1f} {r['max']:>8.1f} {r['errors']:>7}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--url", default=None, help="Benchmark a running server instead of starting one")
+    p.add_argument("--rows", type=int, default=5000)
+    p.add_argument("--connections", type=int, default=32)
+    p.add_argument("--seconds", type=float, default=5.0)
+    p.add_argument("--scenarios", default=",".join(SCENARIOS))
+    args = p.parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        p.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.url:
+        parts = urlsplit(args.url)
+        asyncio.run(_run(parts.hostname, parts.port or 80, scenarios, args.connections, args.seconds))
+        return
+
+    workdir = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(workdir, "data", "jd_copilot.sqlite")
+    os.makedirs(os.path.dirname(db.DB_PATH), exist_ok=True)
+    db.init_db()
+    _seed(args.rows)
+    db.close_connections()
+
+    port = _free_port()
+    proc = _start_server(workdir, port)
+    try:
+        asyncio.run(_run("127.0.0.1", port, scenarios, args.connections, args.seconds))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_compact.py
+"""
+Benchmark: JD compaction on synthetic scraped JDs.
+
+Seeds N JDs from a pool of companies; each has site navigation, its
+company's "About us" blurb (shared across that company's roles), role
+content, a benefits list and an EEO / ATS footer. Reports estimated prompt
+tokens before and after compaction, with and without learned boilerplate,
+time per JD, and the share of the fake model's evidence quotes that are
+found in the original JD text. "seen" JDs are from the seeded companies;
+"new" ones each come from a company with no other JD, so only the
+built-in and learned phrases apply to them.
+
+    python bench_compact.py --rows 2000 --companies 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List, Tuple
+
+import compact
+import db
+from fake_openai import fake_analysis
+from llm import build_day0_messages
+
+_WORDS = (
+    "product platform data payments growth roadmap customers stakeholders analytics experiment "
+    "launch strategy engineering design research metrics mobile api infrastructure security "
+    "compliance marketplace pricing onboarding retention revenue partners integrations"
+).split()
+_NAV = ["Skip to main content", "Apply now   Share this job", "Sign in", "Back to jobs"]
+_BENEFITS = ["Medical, dental and vision", "401(k) matching", "Unlimited PTO", "Home office stipend", "Parental leave"]
+_FOOTERS = [
+    "{c} is an equal opportunity employer and does not discriminate on the basis of race, religion or gender.",
+    "We provide reasonable accommodation to applicants with disabilities throughout the hiring process.",
+    "Your application will be processed through our applicant tracking system and kept for twelve months on file.",
+]
+RUBRIC = "1) Autonomy\n2) Scope/Impact\n3) Growth"
+PROFILE = "- 6 years as a product manager on payments platforms"
+
+def _sentence(rnd: random.Random, n: int) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+def _jd(rnd: random.Random, company: str, blurb: str) -> str:
+    parts = rnd.sample(_NAV, 2)
+    parts += ["", f"About {company}", blurb, ""]
+    parts += ["About the role", " ".join(_sentence(rnd, rnd.randint(12, 24)) for _ in range(rnd.randint(2, 4))), ""]
+    parts += ["Responsibilities"] + [f"- {_sentence(rnd, rnd.randint(8, 14))}" for _ in range(rnd.randint(4, 7))] + [""]
+    parts += ["Benefits"] + [f"- {b}" for b in rnd.sample(_BENEFITS, 4)] + [""]
+    parts += ["Requirements:", f"- {rnd.randint(3, 10)}+ years of product management experience"]
+    parts += [f"- {_sentence(rnd, rnd.randint(8, 12))}" for _ in range(3)] + [""]
+    parts += [f.format(c=company) for f in _FOOTERS] + ["Apply now"]
+    return "\n".join(parts)
+
+def _blurb(rnd: random.Random) -> str:
+    return " ".join(_sentence(rnd, rnd.randint(14, 22)) for _ in range(3))
+
+def _seed(rnd: random.Random, rows: int, companies: int, new: int) -> Tuple[List[int], List[int]]:
+    blurbs = {f"Company {i}": _blurb(rnd) for i in range(companies)}
+    names = list(blurbs)
+    records = []
+    for i in range(rows):
+        name = rnd.choice(names)
+        records.append({"company": name, "role_title": f"PM {i}", "jd_text": _jd(rnd, name, blurbs[name])})
+    seen, _ = db.bulk_insert_opportunities(records)
+    fresh, _ = db.bulk_insert_opportunities([
+        {"company": f"Newco {i}", "role_title": "PM", "jd_text": _jd(rnd, f"Newco {i}", _blurb(rnd))} for i in range(new)
+    ])
+    return seen, fresh
+
+def _measure(ids: List[int]) -> dict:
+    before = after = quotes = traced = 0
+    t = time.perf_counter()
+    for oid in ids:
+        opp = db.get_opportunity_header(oid)
+        text = db.get_jd_text(oid)
+        c = compact.compact_jd(text, opp["company"], opp["role_title"])
+        before += c["tokens_before"]
+        after += c["tokens_after"]
+        analysis = fake_analysis(build_day0_messages(c["text"], opp["company"], opp["role_title"], RUBRIC, PROFILE))
+        for q in analysis["scorecard"]:
+            for e in q["evidence"]:
+                quotes += 1
+                traced += compact.locate_quote(text, e["quote"]) is not None
+    ms = (time.perf_counter() - t) * 1000 / len(ids)
+    return {"before": before, "after": after, "ms": ms, "traced": traced / quotes if quotes else 1.0}
+
+def _report(label: str, r: dict) -> None:
+    saved = 1 - r["after"] / r["before"]
+    print(f"{label:>18} {r['before']:>14} {r['after']:>13} {saved:>6.0%} {r['ms']:>7.2f} {r['traced']:>14.0%}")
+
+def run(rows: int, companies: int, sample: int) -> None:
+    rnd = random.Random(7)
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_compact.sqlite")
+    db.init_db()
+    seen, fresh = _seed(rnd, rows, companies, sample)
+    seen = seen[:sample]
+
+    print(f"{rows} JDs from {companies} companies; {sample} seen and {sample} new JDs measured")
+    print(f"{'pass':>18} {'tokens before':>14} {'tokens after':>13} {'saved':>6} {'ms/JD':>7} {'quotes traced':>14}")
+    _report("seen", _measure(seen))
+    _report("new", _measure(fresh))
+
+    t = time.perf_counter()
+    learned = compact.learn_boilerplate()
+    print(f"learned {len(learned)} phrases in {time.perf_counter() - t:.2f}s")
+    _report("seen + learned", _measure(seen))
+    _report("new + learned", _measure(fresh))
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--companies", type=int, default=200)
+    p.add_argument("--sample", type=int, default=500, help="JDs measured per pass")
+    args = p.parse_args()
+    run(args.rows, args.companies, args.sample)
+
+if __name__ == "__main__":
+    main()
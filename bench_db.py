@@ -0,0 +1,119 @@
+# bench_db.py
+"""
+Micro-benchmark: connect-per-call (the old db.py pattern) vs the pooled,
+WAL-mode connection layer.
+
+    python bench_db.py --rows 1000 --calls 2000 --writers 8
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+
+import db
+
+def _legacy_get(path: str, opp_id: int):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def _legacy_update(path: str, opp_id: int, fields: Dict) -> None:
+    conn = sqlite3.connect(path)
+    fields = dict(fields, updated_at=db.now_iso())
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    conn.execute(f"UPDATE opportunities SET {cols} WHERE id = ?", list(fields.values()) + [opp_id])
+    conn.commit()
+    conn.close()
+
+def _seed(rows: int) -> None:
+    db.init_db()
+    with db.transaction() as conn:
+        ts = db.now_iso()
+        conn.executemany("""
+            INSERT INTO opportunities (created_at, updated_at, company, role_title, jd_text, stage, decision, day0_at)
+            VALUES (?, ?, ?, ?, ?, 'NEW', 'PENDING', ?)
+        """, [(ts, ts, f"Company {i}", f"Role {i}", "x" * 4000, ts) for i in range(rows)])
+
+def _latency_us(fn: Callable[[int], None], calls: int, rows: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for i in range(calls):
+        t = time.perf_counter()
+        fn(i % rows + 1)
+        samples.append((time.perf_counter() - t) * 1e6)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples),
+    }
+
+def _writer_throughput(update: Callable[[int], None], writers: int, per_writer: int, rows: int) -> Dict[str, float]:
+    errors = []
+
+    def work(w: int) -> None:
+        for i in range(per_writer):
+            try:
+                update((w * per_writer + i) % rows + 1)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=work, args=(w,)) for w in range(writers)]
+    t = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.perf_counter() - t
+    return {"writes_per_s": writers * per_writer / elapsed, "errors": len(errors)}
+
+def run(rows: int, calls: int, writers: int, per_writer: int) -> List[str]:
+    lines = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, pooled in (("per-call connect", False), ("pooled WAL", True)):
+            db.close_connections()
+            db.DB_PATH = os.path.join(tmp, f"{'pooled' if pooled else 'legacy'}.sqlite")
+            _seed(rows)
+            if not pooled:
+                # Back to the default rollback journal so the legacy run measures the old setup
+                db.close_connections()
+                conn = sqlite3.connect(db.DB_PATH)
+                conn.execute("PRAGMA journal_mode = DELETE")
+                conn.close()
+
+            path = db.DB_PATH
+            if pooled:
+                get = lambda i: db.get_opportunity(i)
+                update = lambda i: db.update_opportunity(i, {"next_action": "bench"})
+            else:
+                get = lambda i: _legacy_get(path, i)
+                update = lambda i: _legacy_update(path, i, {"next_action": "bench"})
+
+            g = _latency_us(get, calls, rows)
+            u = _latency_us(update, calls, rows)
+            w = _writer_throughput(update, writers, per_writer, rows)
+            lines.append(
+                f"{label:>17}: get p50 {g['p50']:8.1f}us p95 {g['p95']:8.1f}us | "
+                f"update p50 {u['p50']:8.1f}us p95 {u['p95']:8.1f}us | "
+                f"{writers} writers {w['writes_per_s']:8.0f} writes/s, {w['errors']} lock errors"
+            )
+        db.close_connections()
+    return lines
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=1000)
+    p.add_argument("--calls", type=int, default=2000)
+    p.add_argument("--writers", type=int, default=8)
+    p.add_argument("--per-writer", type=int, default=250)
+    args = p.parse_args()
+    for line in run(args.rows, args.calls, args.writers, args.per_writer):
+        print(line)
+
+if __name__ == "__main__":
+    main()
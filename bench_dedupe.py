@@ -0,0 +1,115 @@
+# bench_dedupe.py
+"""
+Benchmark: near-duplicate JD detection (MinHash + LSH buckets in SQLite).
+
+Seeds N synthetic JDs, then times create_opportunity + near_duplicates for
+fresh JDs and for lightly edited reposts of stored ones, against a linear
+scan over every stored signature. Run at growing sizes to check that the
+indexed lookup stays flat while the scan grows with the table.
+
+    python bench_dedupe.py --scales 1000,10000,100000 --lookups 200
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+import db
+import minhash
+
+_WORDS = (
+    "product platform data payments growth roadmap customers stakeholders analytics experiment "
+    "launch strategy engineering design research metrics mobile api infrastructure security "
+    "compliance marketplace pricing onboarding retention revenue partners integrations sql python "
+    "kafka cloud reliability latency scale ownership ambiguity cross functional collaboration "
+    "vision execution discovery prioritization backlog enterprise consumer b2b saas fintech health"
+).split()
+
+def _jd(rnd: random.Random, words: int = 250) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(words))
+
+def _repost(rnd: random.Random, text: str, edit_rate: float) -> str:
+    # Recruiter-style edits: a few words swapped, a line appended
+    words = text.split()
+    for i in range(len(words)):
+        if rnd.random() < edit_rate:
+            words[i] = rnd.choice(_WORDS)
+    return " ".join(words) + " Apply via our careers page."
+
+def _seed(rnd: random.Random, rows: int, start: int) -> List[str]:
+    texts = [_jd(rnd) for _ in range(rows)]
+    ts = db.now_iso()
+    with db.transaction() as conn:
+        cur = conn.execute("SELECT COALESCE(MAX(id), 0) FROM opportunities").fetchone()[0]
+        conn.executemany("""
+            INSERT INTO opportunities (id, created_at, updated_at, company, role_title, jd_text, stage, decision, day0_at)
+            VALUES (?, ?, ?, ?, 'PM', ?, 'NEW', 'PENDING', ?)
+        """, [(cur + 1 + i, ts, ts, f"Company {start + i}", t, ts) for i, t in enumerate(texts)])
+        for i, t in enumerate(texts):
+            db._index_signature(conn, cur + 1 + i, minhash.signature(t))
+    return texts
+
+def _linear_scan(opp_id: int, threshold: float) -> int:
+    with db.connection() as conn:
+        sig = minhash.from_blob(conn.execute("SELECT signature FROM jd_signatures WHERE opportunity_id = ?", (opp_id,)).fetchone()[0])
+        return sum(
+            1 for oid, blob in conn.execute("SELECT opportunity_id, signature FROM jd_signatures")
+            if oid != opp_id and minhash.similarity(sig, minhash.from_blob(blob)) >= threshold
+        )
+
+def _pct(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    return {"p50": statistics.median(s), "p95": s[int(0.95 * (len(s) - 1))]}
+
+def run(scales: List[int], lookups: int, threshold: float, edit_rate: float, scan_lookups: int) -> None:
+    rnd = random.Random(7)
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_dedupe.sqlite")
+    db.init_db()
+
+    stored: List[str] = []
+    print(f"threshold={threshold} edit_rate={edit_rate} bands={minhash.BANDS}x{minhash.ROWS}")
+    print(f"{'seeded':>8} {'seed s':>7} {'fresh p50/p95 ms':>18} {'repost p50/p95 ms':>19} {'recall':>7} {'false+':>7} {'scan ms':>8}")
+    for target in scales:
+        t = time.perf_counter()
+        stored += _seed(rnd, target - len(stored), len(stored))
+        seed_s = time.perf_counter() - t
+
+        fresh, repost, found, false_pos = [], [], 0, 0
+        for i in range(lookups):
+            t = time.perf_counter()
+            oid = db.create_opportunity("Fresh", "PM", "", _jd(rnd))
+            false_pos += bool(db.near_duplicates(oid, threshold))
+            fresh.append((time.perf_counter() - t) * 1000)
+
+            src = rnd.randrange(len(stored))
+            t = time.perf_counter()
+            oid = db.create_opportunity("Repost", "PM", "", _repost(rnd, stored[src], edit_rate))
+            found += any(d["company"] == f"Company {src}" for d in db.near_duplicates(oid, threshold))
+            repost.append((time.perf_counter() - t) * 1000)
+
+        t = time.perf_counter()
+        for _ in range(scan_lookups):
+            _linear_scan(oid, threshold)
+        scan_ms = (time.perf_counter() - t) * 1000 / max(1, scan_lookups)
+
+        f, r = _pct(fresh), _pct(repost)
+        print(
+            f"{target:>8} {seed_s:>7.1f} {f['p50']:>8.2f}/{f['p95']:<9.2f} {r['p50']:>9.2f}/{r['p95']:<9.2f}"
+            f" {found / lookups:>7.1%} {false_pos / lookups:>7.1%} {scan_ms:>8.1f}"
+        )
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--scales", default="1000,10000,100000")
+    p.add_argument("--lookups", type=int, default=200)
+    p.add_argument("--threshold", type=float, default=minhash.DEFAULT_THRESHOLD)
+    p.add_argument("--edit-rate", type=float, default=0.005, help="Share of words changed in a repost (0.005 ~ Jaccard 0.9)")
+    p.add_argument("--scan-lookups", type=int, default=3)
+    args = p.parse_args()
+    run([int(s) for s in args.scales.split(",")], args.lookups, args.threshold, args.edit_rate, args.scan_lookups)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bench_prescreen.py
+"""
+Benchmark: local fit pre-screen of the NEW queue.
+
+Seeds N synthetic JDs (a mix of remote / on-site, junior / senior and
+different stacks), then times vectorizing them all into jd_vectors, a cold
+rank (index built from the stored vectors), a warm rank (index cached) and a
+rank after one JD is edited (one vector rebuilt, index reloaded).
+
+    python bench_prescreen.py --scales 1000,5000,20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import db
+import prescreen
+from utils import jd_hash
+
+_WORDS = (
+    "product platform data payments growth roadmap customers stakeholders analytics experiment "
+    "launch strategy engineering design research metrics mobile api infrastructure security "
+    "compliance marketplace pricing onboarding retention revenue partners integrations "
+    "reliability latency scale ownership ambiguity cross functional collaboration "
+    "vision execution discovery prioritization backlog enterprise consumer b2b saas fintech health"
+).split()
+_TECH = ["python", "sql", "kafka", "scala", "spark", "aws", "kubernetes", "salesforce", "tableau", "react"]
+_EXTRAS = [
+    "This role is fully remote.",
+    "This role is onsite in our Austin office; relocation offered.",
+    "Requires 10 years of product experience.",
+    "Requires 3 years of product experience.",
+    "Great fit for a junior PM or new grad.",
+]
+
+PROFILE = """- 6 years as a product manager on payments and fintech platforms
+- Shipped analytics and experiment tooling; sql, python, kafka
+- Looking for remote roles with ownership and scope"""
+RUBRIC = "Autonomy, scope and impact, growth, team quality, role clarity, domain fit (fintech, payments)"
+
+def _jd(rnd: random.Random) -> str:
+    words = [rnd.choice(_WORDS) for _ in range(rnd.randint(200, 400))]
+    stack = " ".join(rnd.sample(_TECH, rnd.randint(1, 5)))
+    return " ".join(words) + f". Stack: {stack}. " + " ".join(rnd.sample(_EXTRAS, rnd.randint(0, 2)))
+
+def _seed(rnd: random.Random, rows: int) -> None:
+    ts = db.now_iso()
+    with db.transaction() as conn:
+        cur = conn.execute("SELECT COALESCE(MAX(id), 0) FROM opportunities").fetchone()[0]
+        texts = [_jd(rnd) for _ in range(rows)]
+        conn.executemany("""
+            INSERT INTO opportunities (id, created_at, updated_at, company, role_title, jd_text, jd_hash, stage, decision, day0_at)
+            VALUES (?, ?, ?, ?, 'PM', ?, ?, 'NEW', 'PENDING', ?)
+        """, [(cur + 1 + i, ts, ts, f"Company {cur + 1 + i}", db.pack_text(t), jd_hash(t), ts) for i, t in enumerate(texts)])
+
+def run(scales: List[int]) -> None:
+    rnd = random.Random(7)
+    db.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench_prescreen.sqlite")
+    db.init_db()
+
+    print(f"features=2^{prescreen.FEATURE_BITS}")
+    print(f"{'JDs':>7} {'vectorize s':>12} {'cold rank ms':>13} {'warm rank ms':>13} {'after edit ms':>14} {'flagged':>8}")
+    seeded = 0
+    for target in scales:
+        _seed(rnd, target - seeded)
+        seeded = target
+
+        t = time.perf_counter()
+        prescreen.refresh_index()
+        vectorize_s = time.perf_counter() - t
+
+        t = time.perf_counter()
+        prescreen.rank_new(PROFILE, RUBRIC)
+        cold_ms = (time.perf_counter() - t) * 1000
+
+        t = time.perf_counter()
+        ranked = prescreen.rank_new(PROFILE, RUBRIC)
+        warm_ms = (time.perf_counter() - t) * 1000
+
+        db.update_opportunity(ranked[-1]["id"], {"jd_text": _jd(rnd)})
+        t = time.perf_counter()
+        prescreen.rank_new(PROFILE, RUBRIC)
+        edit_ms = (time.perf_counter() - t) * 1000
+
+        flagged = sum(1 for r in ranked if r["flags"]) / len(ranked)
+        print(f"{target:>7} {vectorize_s:>12.2f} {cold_ms:>13.1f} {warm_ms:>13.1f} {edit_ms:>14.1f} {flagged:>8.0%}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--scales", default="1000,5000,20000")
+    args = p.parse_args()
+    run([int(s) for s in args.scales.split(",")])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench_sweep.py
+"""
+Benchmark for db.sweep_buckets: seeds N opportunities spread across stages
+and decisions, then times a cold sweep (most rows change) and a warm sweep
+(nothing left to write).
+
+    python bench_sweep.py --rows 10000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import db
+
+SEED_STAGES = ["NEW", "ANALYZED", "DECISION_PENDING", "QUALIFIED_PREP", "APPLIED", "INTERVIEWING", "CLOSED", "DQ"]
+SEED_DECISIONS = ["PENDING", "PENDING", "QUALIFIED", "UNQUALIFIED"]
+
+def _seed(rows: int) -> None:
+    rng = random.Random(7)
+    base = datetime.utcnow()
+    data = []
+    for i in range(rows):
+        day0 = (base - timedelta(days=rng.randint(0, 60))).isoformat()
+        data.append((day0, day0, f"Company {i}", f"Role {i}", rng.choice(SEED_STAGES), rng.choice(SEED_DECISIONS), day0))
+    with db.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO opportunities (created_at, updated_at, company, role_title, stage, decision, day0_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, data)
+
+def run(rows: int) -> List[str]:
+    lines = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "sweep.sqlite")
+        db.init_db()
+        _seed(rows)
+        now = datetime.utcnow()
+        for label in ("cold", "warm"):
+            t = time.perf_counter()
+            r = db.sweep_buckets(now=now)
+            lines.append(
+                f"sweep {label} ({rows} rows): {(time.perf_counter() - t) * 1000:8.1f}ms, "
+                f"scanned {r['scanned']}, updated {r['updated']}"
+            )
+        t = time.perf_counter()
+        due = db.list_due_queue(limit=200)
+        lines.append(f"due queue top {len(due)}: {(time.perf_counter() - t) * 1000:8.2f}ms")
+        db.close_connections()
+    return lines
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=10000)
+    args = p.parse_args()
+    for line in run(args.rows):
+        print(line)
+
+if __name__ == "__main__":
+    main()
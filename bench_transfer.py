@@ -0,0 +1,83 @@
+# bench_transfer.py
+"""
+Benchmark: streaming bulk import / export (transfer.py).
+
+Writes a synthetic JSONL file of N opportunities (a share with analyses),
+imports it, imports it again (every row a duplicate), then exports JSONL
+and ZIP. Peak RSS is reported after each step to show memory stays flat.
+
+    python bench_transfer.py --rows 100000
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+
+import db
+import transfer
+from bench import synthetic_jd
+from fake_openai import fake_analysis
+
+def _rss_mb() -> float:
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _write_input(path: str, rows: int, analyzed_share: float) -> None:
+    rnd = random.Random(3)
+    analysis = fake_analysis([{"role": "user", "content": "1) Autonomy\n2) Scope/Impact\nUSER PROFILE\nJOB DESCRIPTION\n" + synthetic_jd(0)}])
+    with open(path, "w", encoding="utf-8") as fp:
+        for i in range(rows):
+            rec = {
+                "company": f"Company {i}",
+                "role_title": "Senior Product Manager",
+                "jd_link": f"https://jobs.example.com/{i}",
+                "jd_text": synthetic_jd(i, sentences=rnd.randint(20, 60)),
+            }
+            if rnd.random() < analyzed_share:
+                rec["analysis"] = analysis
+            fp.write(json.dumps(rec) + "\n")
+
+def _step(name: str, fn) -> None:
+    t = time.perf_counter()
+    detail = fn()
+    print(f"{name:<22} {time.perf_counter() - t:>8.1f}s  peak RSS {_rss_mb():>7.1f} MB  {detail}")
+
+def main() -> None:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--rows", type=int, default=100000)
+    p.add_argument("--analyzed-share", type=float, default=0.1)
+    p.add_argument("--chunk-size", type=int, default=transfer.CHUNK_SIZE)
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db.DB_PATH = os.path.join(tmp, "bench_transfer.sqlite")
+    db.init_db()
+    src = os.path.join(tmp, "in.jsonl")
+
+    print(f"rows={args.rows} analyzed_share={args.analyzed_share} chunk_size={args.chunk_size}")
+    _step("write input", lambda: _write_input(src, args.rows, args.analyzed_share) or f"{os.path.getsize(src) / 1e6:.0f} MB")
+
+    def run_import():
+        with open(src, encoding="utf-8") as fp:
+            r = transfer.import_opportunities(fp, "jsonl", chunk_size=args.chunk_size)
+        return f"{r['inserted']} inserted, {r['duplicates']} duplicates, {r['read'] / r['seconds']:.0f} rows/s"
+
+    _step("import", run_import)
+    _step("re-import (all dups)", run_import)
+
+    for fmt in transfer.EXPORT_FORMATS:
+        out = os.path.join(tmp, f"out.{fmt}")
+
+        def run_export():
+            with open(out, "wb") as fp:
+                n = transfer.write_export(fp, fmt)
+            return f"{n} records, {os.path.getsize(out) / 1e6:.0f} MB"
+
+        _step(f"export {fmt}", run_export)
+    print(f"database {os.path.getsize(db.DB_PATH) / 1e6:.0f} MB")
+
+if __name__ == "__main__":
+    main()
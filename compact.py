@@ -0,0 +1,254 @@
+# compact.py
+"""
+Deterministic JD compaction, run before a JD is put into a prompt.
+
+    c = compact_jd(jd_text, company, role_title)
+    c["text"], c["tokens_before"], c["tokens_after"], c["removed"]
+
+In order:
+  1. Whitespace is normalized (utils.normalize_jd_whitespace).
+  2. Lines that are only site navigation ("Apply now", "Share this job") go.
+  3. Boilerplate goes: sentences containing a built-in phrase or one stored
+     in boilerplate_phrases (learned from the corpus by
+     `manage.py learn-boilerplate`), and whole sections under a boilerplate
+     heading (Benefits, EEO statement, ...) up to the next heading.
+  4. Repeats go: sentences the same company also uses in its JDs for other
+     roles (the "About us" blurb), looked up in the jd_units index.
+  5. If what is left is still over the token budget, the lowest-priority
+     sentences go until it fits: plain text first, then text under content
+     headings (Requirements, Responsibilities, ...), later before earlier.
+
+Only whole sentences are dropped and kept text is never rewritten, so every
+evidence quote the model takes from the compacted JD is found in the
+original by locate_quote(). A line with a sentence cut from its middle is
+split there, so no kept line joins text that wasn't adjacent. Sentences
+mentioning pay, years of experience or requirements are only ever dropped
+for the budget.
+
+Settings (Streamlit secrets or environment): JD_COMPACT=0 turns compaction
+off; JD_TOKEN_BUDGET (default DEFAULT_TOKEN_BUDGET, 0 = no budget).
+"""
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import streamlit as st
+
+import db
+from tracing import span
+from utils import estimate_tokens, jd_units, unit_key
+
+# Bump when the rules change: it is part of the analysis cache key
+COMPACT_VERSION = 1
+DEFAULT_TOKEN_BUDGET = 3000
+LEARN_MIN_COMPANIES = 5
+HEADING_MAX_WORDS = 6
+
+# All in normalize_phrase() form
+NAV_LINES = frozenset({
+    "apply", "apply now", "apply for this job", "apply for this position", "easy apply", "save", "save job",
+    "share", "share this job", "back to jobs", "back to search results", "view all jobs", "see all jobs",
+    "similar jobs", "report this job", "sign in", "log in", "sign up", "skip to main content", "show more",
+    "show less", "accept cookies", "cookie settings", "accept all cookies", "print", "email this job",
+})
+BOILERPLATE_PHRASES = (
+    "equal opportunity employer", "equal employment opportunity", "affirmative action employer",
+    "without regard to race", "regardless of race", "protected veteran status", "reasonable accommodation",
+    "reasonable accommodations", "e verify", "pay transparency nondiscrimination", "fair chance ordinance",
+    "arrest and conviction records", "unsolicited resumes", "recruitment agencies", "we use cookies",
+    "privacy notice", "privacy policy", "applicant privacy",
+)
+BOILERPLATE_HEADINGS = frozenset({
+    "benefits", "our benefits", "perks", "perks and benefits", "benefits and perks", "perks benefits",
+    "what we offer", "why you ll love working here", "eeo statement", "equal opportunity",
+    "equal employment opportunity", "equal opportunity employer", "diversity and inclusion",
+    "diversity equity and inclusion", "privacy notice", "legal disclaimer", "accommodations",
+})
+CONTENT_HEADINGS = frozenset({
+    "about the role", "the role", "role overview", "overview", "responsibilities", "key responsibilities",
+    "what you ll do", "what you will do", "what you ll be doing", "requirements", "qualifications",
+    "minimum qualifications", "basic qualifications", "preferred qualifications", "nice to have",
+    "bonus points", "about you", "who you are", "what you bring", "what we re looking for", "skills",
+    "compensation", "salary", "pay", "about the team", "the team",
+})
+# Never dropped as boilerplate or repeats
+_PROTECTED = re.compile(
+    r"[$€£]\s?\d|\b(salary|compensation|pay range|base pay|required|requirements?|qualifications?|degree|"
+    r"experience|proficien\w*|must)\b|\b\d{1,2}\s*\+?\s*(years|yrs)\b",
+    re.I,
+)
+
+PRIORITY_PLAIN, PRIORITY_CONTENT, PRIORITY_KEEP = 1, 2, 3
+
+def _setting(name: str) -> Optional[str]:
+    try:
+        value = st.secrets.get(name, None)
+    except Exception:
+        value = None
+    return value if value is not None else os.getenv(name)
+
+def enabled() -> bool:
+    return (_setting("JD_COMPACT") or "1").lower() not in ("0", "false", "no")
+
+def token_budget() -> Optional[int]:
+    raw = _setting("JD_TOKEN_BUDGET")
+    budget = int(raw) if raw not in (None, "") else DEFAULT_TOKEN_BUDGET
+    return budget or None
+
+def config_key() -> str:
+    """
+    Identifies the compaction rules; part of the analysis cache key, next to
+    the raw JD. Learned phrases and the company's other JDs are left out on
+    purpose: they only remove boilerplate, and keying on them would change
+    the key (and jobs.input_hash) of every JD whenever they change.
+    """
+    return f"compact-v{COMPACT_VERSION}:{token_budget() or 0}" if enabled() else "raw"
+
+def normalize_phrase(s: str) -> str:
+    """Lowercase words joined by single spaces: the form phrases are stored and matched in."""
+    return " ".join(re.findall(r"\w+", s.lower()))
+
+_matcher: Dict[str, Any] = {}
+_matcher_lock = threading.Lock()
+
+def _phrase_matcher() -> Callable[[str], bool]:
+    """Tests a normalized sentence against the built-in and stored phrases; rebuilt when the stored ones change."""
+    key = (db.DB_PATH, db.boilerplate_fingerprint())
+    with _matcher_lock:
+        if _matcher.get("key") != key:
+            phrases = set(BOILERPLATE_PHRASES) | {p["phrase"] for p in db.boilerplate_phrases()}
+            # Longest first so the alternation prefers the fullest match
+            alternation = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+            _matcher["search"] = re.compile(f"(?:^| )(?:{alternation})(?: |$)").search
+            _matcher["key"] = key
+        search = _matcher["search"]
+    return lambda norm: search(norm) is not None
+
+# A line made only of navigation items, e.g. "Apply now   Share this job"
+_NAVIGATION = re.compile(
+    "(?:(?:" + "|".join(re.escape(p) for p in sorted(NAV_LINES, key=len, reverse=True)) + ") )+"
+)
+
+def _heading(line: str, norm: str) -> Optional[str]:
+    """The line's normalize_phrase() form if it reads as a section heading."""
+    if not norm or len(norm.split()) > HEADING_MAX_WORDS:
+        return None
+    if line.endswith(":") or norm in BOILERPLATE_HEADINGS or norm in CONTENT_HEADINGS:
+        return norm
+    return None
+
+def compact_jd(jd_text: str, company: str = "", role_title: str = "", budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    The JD as it should go into a prompt: {text, tokens_before, tokens_after,
+    removed: {reason: sentences}}. budget defaults to token_budget(); with
+    compaction off the text comes back unchanged.
+    """
+    tokens_before = estimate_tokens(jd_text or "")
+    if not enabled():
+        return {"text": jd_text or "", "tokens_before": tokens_before, "tokens_after": tokens_before, "removed": {}}
+    budget = token_budget() if budget is None else budget
+
+    with span("compact.compact_jd", tokens_before=tokens_before) as sp:
+        lines = jd_units(jd_text)
+        is_boilerplate = _phrase_matcher()
+        keys = {u: unit_key(u) for units in lines for u in units}
+        repeated = db.repeated_units(company, role_title, sorted({k for k in keys.values() if k})) if company else set()
+
+        removed: Counter = Counter()
+        # (line number, position in line, sentence, priority) of every kept sentence
+        kept: List[Tuple[int, int, str, int]] = []
+        section = None
+        for ln, units in enumerate(lines):
+            if not units:
+                continue
+            line = " ".join(units)
+            norm = normalize_phrase(line)
+            head = _heading(line, norm)
+            if head is not None:
+                section = "boilerplate" if head in BOILERPLATE_HEADINGS else "content" if head in CONTENT_HEADINGS else None
+                if section == "boilerplate":
+                    removed["boilerplate"] += 1
+                else:
+                    kept.append((ln, 0, line, PRIORITY_KEEP))
+                continue
+            if _NAVIGATION.fullmatch(norm + " "):
+                removed["navigation"] += 1
+                continue
+            for pos, u in enumerate(units):
+                protected = bool(_PROTECTED.search(u))
+                if not protected:
+                    if section == "boilerplate" or is_boilerplate(normalize_phrase(u)):
+                        removed["boilerplate"] += 1
+                        continue
+                    if keys[u] in repeated:
+                        removed["repeated"] += 1
+                        continue
+                priority = PRIORITY_KEEP if protected else PRIORITY_CONTENT if section == "content" else PRIORITY_PLAIN
+                kept.append((ln, pos, u, priority))
+
+        if budget and sum(estimate_tokens(u) for _, _, u, _ in kept) > budget:
+            chosen, used = set(), 0
+            for i in sorted(range(len(kept)), key=lambda i: (-kept[i][3], i)):
+                t = estimate_tokens(kept[i][2])
+                if used + t <= budget:
+                    chosen.add(i)
+                    used += t
+            removed["budget"] = len(kept) - len(chosen)
+            kept = [k for i, k in enumerate(kept) if i in chosen]
+
+        text = _render(lines, kept)
+        if not text.strip():
+            # Nothing survived: better the whole JD than an empty prompt
+            text = "\n".join(" ".join(units) for units in lines)
+            removed.clear()
+        tokens_after = estimate_tokens(text)
+        sp.set(tokens_after=tokens_after)
+
+    return {"text": text, "tokens_before": tokens_before, "tokens_after": tokens_after, "removed": dict(removed)}
+
+def _render(lines: List[List[str]], kept: List[Tuple[int, int, str, int]]) -> str:
+    out: List[str] = []
+    prev: Optional[Tuple[int, int]] = None
+    for ln, pos, u, _ in kept:
+        if prev is not None and prev == (ln, pos - 1):
+            out[-1] += " " + u
+        else:
+            # Keep a paragraph break that the original had between the two
+            if prev is not None and any(not lines[j] for j in range(prev[0] + 1, ln)):
+                out.append("")
+            out.append(u)
+        prev = (ln, pos)
+    return "\n".join(out)
+
+def locate_quote(original: str, quote: str) -> Optional[Tuple[int, int]]:
+    """(start, end) of the quote in the original JD text, whitespace-insensitively; None if absent."""
+    words = (quote or "").split()
+    if not words:
+        return None
+    m = re.search(r"\s+".join(re.escape(w) for w in words), original or "")
+    return m.span() if m else None
+
+def learn_boilerplate(min_companies: int = LEARN_MIN_COMPANIES, dry_run: bool = False) -> List[Tuple[str, int]]:
+    """
+    Sentences found in the JDs of at least min_companies different companies
+    (EEO statements, ATS footers, agency templates), as (phrase, companies).
+    Unless dry_run they are stored as learned boilerplate phrases. Sentences
+    that mention pay, experience or requirements are never learned.
+    """
+    common = db.common_units(min_companies)
+    found: Dict[str, Tuple[str, int]] = {}
+    if common:
+        for opp in db.iter_opportunities():
+            for units in jd_units(opp["jd_text"] or ""):
+                for u in units:
+                    k = unit_key(u)
+                    if k in common and k not in found and not _PROTECTED.search(u):
+                        found[k] = (normalize_phrase(u), common[k])
+            if len(found) == len(common):
+                break
+    phrases = sorted(found.values())
+    if phrases and not dry_run:
+        db.add_boilerplate_phrases(phrases, "learned")
+    return phrases
@@ -1,116 +1,1512 @@
 import os
+import re
+import json
+import functools
+import zlib
+import queue
 import sqlite3
-from typing import Any, Dict, List, Optional
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from migrations import SCHEMA_VERSION, migrate, schema_version
+from utils import compute_bucket, jd_hash, jd_unit_keys
+from tracing import traced
+import jsondelta
+import minhash
 
 DB_PATH = "data/jd_copilot.sqlite"
 os.makedirs("data", exist_ok=True)
 
-def _conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# --- compressed text columns ---
 
-def ensure_column(conn, table: str, column: str, col_type: str) -> None:
-    cur = conn.cursor()
-    cols = cur.execute(f"PRAGMA table_info({table})").fetchall()
-    existing = {c[1] for c in cols}  # column name is index 1
-    if column not in existing:
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
-        conn.commit()
+# jd_text, analysis_json and analysis_jd_text are stored as PACK_MARKER +
+# zlib data once they reach PACK_MIN_BYTES. The marker keeps plain TEXT rows
+# written before compression (or by tools) readable, and leaves room for
+# another codec later.
+PACK_MARKER = b"zl1:"
+PACK_MIN_BYTES = 512
+PACKED_COLUMNS = ("jd_text", "analysis_json", "analysis_jd_text")
 
-def init_db():
-    conn = _conn()
-    cur = conn.cursor()
+def pack_text(text: Optional[str]):
+    if text is None:
+        return None
+    raw = text.encode("utf-8")
+    if len(raw) < PACK_MIN_BYTES:
+        return text
+    packed = PACK_MARKER + zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else text
+
+def unpack_text(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        if value.startswith(PACK_MARKER):
+            return zlib.decompress(value[len(PACK_MARKER):]).decode("utf-8")
+        return value.decode("utf-8")
+    return value
 
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS opportunities (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        created_at TEXT NOT NULL,
-        updated_at TEXT NOT NULL,
+def _unpack_row(row) -> Dict[str, Any]:
+    d = dict(row)
+    for col in PACKED_COLUMNS:
+        if col in d:
+            d[col] = unpack_text(d[col])
+    return d
 
-        company TEXT NOT NULL,
-        role_title TEXT NOT NULL,
-        jd_link TEXT,
-        jd_text TEXT,
+# --- connection pool ---
+# Streamlit runs each rerun on a fresh thread, so connections are pooled per
+# DB_PATH and lent to a thread for the duration of a call or transaction.
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16000
+STATEMENT_CACHE_SIZE = 256
 
-        stage TEXT NOT NULL DEFAULT 'NEW',              -- NEW, ANALYZED, DECISION_PENDING, QUALIFIED_PREP, APPLIED, INTERVIEWING, CLOSED, DQ
-        decision TEXT DEFAULT 'PENDING',                -- PENDING, QUALIFIED, UNQUALIFIED
+_pools: Dict[str, "queue.LifoQueue[sqlite3.Connection]"] = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
 
-        day0_at TEXT,                                   -- when JD dropped
-        bucket_due TEXT,                                -- next SLA due date
-        next_action TEXT,
-        next_action_due TEXT,
+def _open_connection(path: str) -> sqlite3.Connection:
+    # isolation_level=None: single statements autocommit; multi-step writes
+    # go through transaction(), which issues BEGIN/COMMIT itself.
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # Used by the search-index triggers to read compressed columns
+    conn.create_function("unpack_text", 1, unpack_text, deterministic=True)
+    return conn
 
-        dq_reasons_json TEXT,                            -- JSON list of codes + notes
+def _pool() -> "queue.LifoQueue[sqlite3.Connection]":
+    with _pools_lock:
+        pool = _pools.get(DB_PATH)
+        if pool is None:
+            pool = _pools[DB_PATH] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return pool
 
-        analysis_json TEXT,                              -- full analysis JSON
-        analysis_model TEXT
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """Lends a pooled connection; re-entrant within a thread."""
+    held = getattr(_local, "conn", None)
+    if held is not None:
+        yield held
+        return
 
-        prompt_tokens INTEGER,
-        completion_tokens INTEGER,
-        total_tokens INTEGER,
-        estimated_cost_usd REAL
+    pool = _pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection(DB_PATH)
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
-    )
-    """)
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Groups writes into one commit. Nested calls join the outer transaction,
+    so db helpers can be composed inside a caller's transaction.
+    """
+    with connection() as conn:
+        if getattr(_local, "tx_depth", 0):
+            _local.tx_depth += 1
+            try:
+                yield conn
+            finally:
+                _local.tx_depth -= 1
+            return
 
-    # --- lightweight schema migration for MVP ---
-    ensure_column(conn, "opportunities", "prompt_tokens", "INTEGER")
-    ensure_column(conn, "opportunities", "completion_tokens", "INTEGER")
-    ensure_column(conn, "opportunities", "total_tokens", "INTEGER")
-    ensure_column(conn, "opportunities", "estimated_cost_usd", "REAL")
+        # IMMEDIATE takes the write lock up front instead of failing on upgrade
+        conn.execute("BEGIN IMMEDIATE")
+        _local.tx_depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            _local.tx_depth = 0
 
-    conn.commit()
-    conn.close()
+def close_connections() -> None:
+    """Closes idle pooled connections (tests, benchmarks, shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+_migrated: set = set()
+
+def init_db():
+    """
+    Brings DB_PATH up to migrations.SCHEMA_VERSION. Runs the migrations once
+    per process and path; later calls (every Streamlit rerun) are a set lookup.
+    """
+    if DB_PATH in _migrated:
+        return
+    with connection() as conn:
+        if schema_version(conn) < SCHEMA_VERSION:
+            migrate(conn)
+    _migrated.add(DB_PATH)
 
 def now_iso() -> str:
     return datetime.utcnow().isoformat()
 
+@traced("db.list_opportunities")
 def list_opportunities() -> List[Dict[str, Any]]:
-    conn = _conn()
-    rows = conn.execute("""
-        SELECT id, company, role_title, stage, decision, bucket_due, updated_at
-        FROM opportunities
-        ORDER BY updated_at DESC
-    """).fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT id, company, role_title, stage, decision, bucket_due, updated_at
+            FROM opportunities
+            ORDER BY updated_at DESC
+        """).fetchall()
     return [dict(r) for r in rows]
 
+@traced("db.list_opportunities_page")
+def list_opportunities_page(
+    limit: int = 50,
+    after: Optional[Tuple[str, int]] = None,
+    stage: Optional[str] = None,
+    decision: Optional[str] = None,
+    company_prefix: Optional[str] = None,
+    due_from: Optional[str] = None,
+    due_to: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+    """
+    One page of opportunities, newest first, using keyset pagination on
+    (updated_at, id). Pass the returned cursor back as `after` for the next
+    page; it is None on the last page.
+    """
+    where, params = [], []
+    if after is not None:
+        where.append("(updated_at, id) < (?, ?)")
+        params += list(after)
+    if stage:
+        where.append("stage = ?")
+        params.append(stage)
+    if decision:
+        where.append("decision = ?")
+        params.append(decision)
+    if company_prefix and company_prefix.strip():
+        # Range scan on the NOCASE company index instead of LIKE
+        prefix = company_prefix.strip()
+        where.append("company >= ? COLLATE NOCASE AND company < ? COLLATE NOCASE")
+        params += [prefix, prefix + "\U0010ffff"]
+    if due_from:
+        where.append("bucket_due >= ?")
+        params.append(due_from)
+    if due_to:
+        where.append("bucket_due <= ?")
+        params.append(due_to)
+
+    sql = "SELECT id, company, role_title, stage, decision, bucket_due, updated_at FROM opportunities"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with connection() as conn:
+        rows = [dict(r) for r in conn.execute(sql, params).fetchall()]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1]["updated_at"], rows[-1]["id"])
+    return rows, None
+
+# bm25 weights per indexed column: company, role_title, jd_text, analysis
+_SEARCH_WEIGHTS = (8.0, 6.0, 1.0, 0.5)
+
+def _fts_query(text: str) -> str:
+    """
+    Turns free text into a safe FTS5 query: "quoted phrases" and words are
+    ANDed, a trailing * is kept as a prefix match, and the last word is
+    always a prefix so results update while typing.
+    """
+    terms = re.findall(r'"([^"]+)"|(\w+)(\*?)', text)
+    out = []
+    for i, (phrase, word, star) in enumerate(terms):
+        if phrase:
+            out.append('"' + phrase.replace('"', "") + '"')
+        else:
+            out.append(f'"{word}"' + ("*" if star or i == len(terms) - 1 else ""))
+    return " ".join(out)
+
+@traced("db.search_opportunities")
+def search_opportunities(
+    text: str,
+    limit: int = 25,
+    stage: Optional[str] = None,
+    decision: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Full-text search over company, role title, JD and analysis text, best
+    BM25 match first. Each row carries a `snippet` with hits in **bold**.
+    """
+    query = _fts_query(text)
+    if not query:
+        return []
+    weights = ", ".join(str(w) for w in _SEARCH_WEIGHTS)
+    cols = "o.id, o.company, o.role_title, o.stage, o.decision, o.bucket_due, o.updated_at"
+
+    where, params = [], [query]
+    if stage:
+        where.append("o.stage = ?")
+        params.append(stage)
+    if decision:
+        where.append("o.decision = ?")
+        params.append(decision)
+    params.append(limit)
+    if where:
+        sql = f"""
+            SELECT {cols}, bm25(opportunities_fts, {weights}) AS rank
+            FROM opportunities_fts
+            JOIN opportunities o ON o.id = opportunities_fts.rowid
+            WHERE opportunities_fts MATCH ? AND {" AND ".join(where)}
+            ORDER BY rank
+            LIMIT ?
+        """
+    else:
+        # Rank inside FTS and join only the page: about half the cost of the join above
+        sql = f"""
+            SELECT {cols}, f.rank
+            FROM (
+                SELECT rowid, bm25(opportunities_fts, {weights}) AS rank
+                FROM opportunities_fts
+                WHERE opportunities_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ) f
+            JOIN opportunities o ON o.id = f.rowid
+            ORDER BY f.rank
+        """
+
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+        # Snippets for the page only: snippet() is far costlier than bm25()
+        if not rows:
+            return []
+        ids = [r["id"] for r in rows]
+        snippets = dict(conn.execute(f"""
+            SELECT rowid, snippet(opportunities_fts, -1, '**', '**', '…', 12)
+            FROM opportunities_fts
+            WHERE opportunities_fts MATCH ? AND rowid IN ({", ".join("?" * len(ids))})
+        """, [query] + ids).fetchall())
+    return [dict(r, snippet=snippets.get(r["id"], "")) for r in rows]
+
+@traced("db.list_unanalyzed_opportunities")
+def list_unanalyzed_opportunities() -> List[Dict[str, Any]]:
+    """NEW opportunities that have JD text to analyze, oldest first, with their stored triage."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT id, company, role_title, jd_text, jd_hash, triage_model, triage_score, triage_jd_hash
+            FROM opportunities
+            WHERE stage = 'NEW' AND jd_text IS NOT NULL AND length(jd_text) > 0
+            ORDER BY created_at ASC
+        """).fetchall()
+    opps = [_unpack_row(r) for r in rows]
+    return [o for o in opps if o["jd_text"].strip()]
+
+def count_unanalyzed_opportunities() -> int:
+    """Number of rows list_unanalyzed_opportunities() would return, without loading the JDs."""
+    with connection() as conn:
+        return conn.execute("""
+            SELECT COUNT(*) FROM opportunities
+            WHERE stage = 'NEW' AND jd_text IS NOT NULL AND (typeof(jd_text) = 'blob' OR trim(jd_text, ' ' || char(9, 10, 13)) != '')
+        """).fetchone()[0]
+
+@traced("db.create_opportunity")
 def create_opportunity(company: str, role_title: str, jd_link: str = "", jd_text: str = "") -> int:
-    conn = _conn()
-    cur = conn.cursor()
+    """Inserts a NEW opportunity and indexes its JD for near_duplicates()."""
     ts = now_iso()
-    cur.execute("""
-        INSERT INTO opportunities (
-            created_at, updated_at, company, role_title, jd_link, jd_text,
-            stage, decision, day0_at
-        ) VALUES (?, ?, ?, ?, ?, ?, 'NEW', 'PENDING', ?)
-    """, (ts, ts, company.strip(), role_title.strip(), jd_link.strip(), jd_text, ts))
-    conn.commit()
-    oid = cur.lastrowid
-    conn.close()
+    sig = minhash.signature(jd_text)
+    units = jd_unit_keys(jd_text)
+    with transaction() as conn:
+        cur = conn.execute("""
+            INSERT INTO opportunities (
+                created_at, updated_at, company, role_title, jd_link, jd_text, jd_hash,
+                stage, decision, day0_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, 'NEW', 'PENDING', ?)
+        """, (ts, ts, company.strip(), role_title.strip(), jd_link.strip(), pack_text(jd_text), jd_hash(jd_text), ts))
+        oid = cur.lastrowid
+        _index_signature(conn, oid, sig)
+        _index_units(conn, oid, company, role_title, units)
     return int(oid)
 
+@traced("db.get_opportunity")
 def get_opportunity(opp_id: int) -> Optional[Dict[str, Any]]:
-    conn = _conn()
-    row = conn.execute("SELECT * FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
-    conn.close()
+    """The full row, text columns decompressed. Prefer get_opportunity_header on hot paths."""
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
+    return _unpack_row(row) if row else None
+
+# Everything but the large text blobs
+HEADER_COLUMNS = (
+    "id", "created_at", "updated_at", "company", "role_title", "jd_link", "stage", "decision",
+    "day0_at", "bucket_due", "next_action", "next_action_due", "dq_reasons_json", "analysis_model",
+    "prompt_tokens", "completion_tokens", "total_tokens", "cached_prompt_tokens", "estimated_cost_usd",
+    "section_usage_json", "duplicate_of", "triage_json", "triage_model", "triage_score",
+    "triage_prompt_tokens", "triage_completion_tokens", "triage_cached_prompt_tokens", "triage_cost_usd", "triage_at",
+    "jd_tokens_raw", "jd_tokens_compact",
+)
+
+@traced("db.get_opportunity_header")
+def get_opportunity_header(opp_id: int) -> Optional[Dict[str, Any]]:
+    """
+    The opportunity without jd_text / analysis_json / analysis_jd_text, plus
+    has_jd, has_analysis and jd_changed (JD edited since the analysis ran).
+    Load the blobs with get_jd_text / get_analysis when they are shown.
+    """
+    with connection() as conn:
+        row = conn.execute(f"""
+            SELECT {", ".join(HEADER_COLUMNS)},
+                   length(jd_text) > 0 AS has_jd,
+                   analysis_json IS NOT NULL AS has_analysis,
+                   analysis_jd_text IS NOT NULL AND analysis_jd_text IS NOT COALESCE(jd_text, '')
+                       AND unpack_text(analysis_jd_text) IS NOT COALESCE(unpack_text(jd_text), '') AS jd_changed
+            FROM opportunities WHERE id = ?
+        """, (opp_id,)).fetchone()
     return dict(row) if row else None
 
+@traced("db.get_jd_text")
+def get_jd_text(opp_id: int, column: str = "jd_text") -> Optional[str]:
+    """One decompressed text column: jd_text (default) or analysis_jd_text."""
+    if column not in ("jd_text", "analysis_jd_text"):
+        raise ValueError(f"Not a JD text column: {column}")
+    with connection() as conn:
+        row = conn.execute(f"SELECT {column} FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
+    return unpack_text(row[0]) if row else None
+
+@functools.lru_cache(maxsize=128)
+def _parsed_analysis(path: str, opp_id: int, updated_at: str) -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        row = conn.execute("SELECT analysis_json FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
+    if not row or row[0] is None:
+        return None
+    return json.loads(unpack_text(row[0]))
+
+@traced("db.get_analysis")
+def get_analysis(opp_id: int, updated_at: str) -> Optional[Dict[str, Any]]:
+    """
+    The parsed analysis, memoized per (id, updated_at): every write bumps
+    updated_at, so reruns that change nothing skip the fetch and parse.
+    The returned dict is shared; treat it as read-only.
+    """
+    return _parsed_analysis(DB_PATH, opp_id, updated_at)
+
+@traced("db.update_opportunity")
 def update_opportunity(opp_id: int, fields: Dict[str, Any]) -> None:
     if not fields:
         return
-    conn = _conn()
-    cur = conn.cursor()
     fields = dict(fields)
     fields["updated_at"] = now_iso()
+    if "jd_text" in fields:
+        fields["jd_hash"] = jd_hash(fields["jd_text"])
 
     cols = ", ".join([f"{k} = ?" for k in fields.keys()])
-    vals = list(fields.values()) + [opp_id]
-    cur.execute(f"UPDATE opportunities SET {cols} WHERE id = ?", vals)
-    conn.commit()
+    vals = [pack_text(v) if k in PACKED_COLUMNS else v for k, v in fields.items()] + [opp_id]
+    # Hashed before taking the write lock
+    sig = minhash.signature(fields["jd_text"]) if "jd_text" in fields else None
+    units = jd_unit_keys(fields["jd_text"]) if "jd_text" in fields else None
+    with transaction() as conn:
+        prev = None
+        if "analysis_json" in fields:
+            prev = conn.execute(
+                "SELECT analysis_json, analysis_model FROM opportunities WHERE id = ?", (opp_id,)
+            ).fetchone()
+            prev = prev and _unpack_row(prev)
+        conn.execute(f"UPDATE opportunities SET {cols} WHERE id = ?", vals)
+        if "jd_text" in fields:
+            _index_signature(conn, opp_id, sig)
+        if units is not None or "company" in fields or "role_title" in fields:
+            row = conn.execute("SELECT company, role_title FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
+            if units is not None:
+                _index_units(conn, opp_id, row["company"], row["role_title"], units)
+            elif row:
+                conn.execute(
+                    "UPDATE jd_units SET company_key = ?, role_key = ? WHERE opportunity_id = ?",
+                    (_name_key(row["company"]), _name_key(row["role_title"]), opp_id),
+                )
+        if "analysis_json" in fields:
+            _index_analysis(conn, opp_id, fields["analysis_json"])
+            if prev and prev["analysis_json"] and prev["analysis_json"] != fields["analysis_json"]:
+                _record_history(conn, opp_id, prev["analysis_json"], prev["analysis_model"], fields["analysis_json"])
+
+# --- bulk import / export ---
+
+# Columns a bulk-imported record may set; everything else is derived
+IMPORT_COLUMNS = (
+    "created_at", "company", "role_title", "jd_link", "jd_text", "stage", "decision", "day0_at",
+    "dq_reasons_json", "analysis_json", "analysis_model",
+)
+
+@traced("db.bulk_insert_opportunities")
+def bulk_insert_opportunities(records: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+    """
+    Inserts one chunk of import records in a single transaction. A record is
+    skipped as a duplicate if its jd_link or JD content hash already exists,
+    in the table or earlier in the chunk. Returns (new ids, indexes of the
+    skipped records).
+    """
+    ts = now_iso()
+    now = datetime.utcnow()
+    prepared = []
+    for rec in records:
+        row = {c: rec.get(c) for c in IMPORT_COLUMNS}
+        row["created_at"] = row["created_at"] or ts
+        row["day0_at"] = row["day0_at"] or row["created_at"]
+        row["stage"] = row["stage"] or ("ANALYZED" if row["analysis_json"] else "NEW")
+        row["decision"] = row["decision"] or "PENDING"
+        row["jd_link"] = (row["jd_link"] or "").strip()
+        row["jd_hash"] = jd_hash(row["jd_text"])
+        prepared.append(row)
+
+    def existing_keys(conn, rows):
+        links = sorted({row["jd_link"] for row in rows if row["jd_link"]})
+        hashes = sorted({row["jd_hash"] for row in rows if row["jd_hash"]})
+        seen_links = {r[0] for r in conn.execute(
+            f"SELECT jd_link FROM opportunities WHERE jd_link IN ({', '.join('?' * len(links))})", links,
+        )} if links else set()
+        seen_hashes = {r[0] for r in conn.execute(
+            f"SELECT jd_hash FROM opportunities WHERE jd_hash IN ({', '.join('?' * len(hashes))})", hashes,
+        )} if hashes else set()
+        return seen_links, seen_hashes
+
+    with connection() as conn:
+        seen_links, seen_hashes = existing_keys(conn, prepared)
+    kept, skipped = [], []
+    for i, row in enumerate(prepared):
+        link, h = row["jd_link"], row["jd_hash"]
+        if (link and link in seen_links) or (h and h in seen_hashes):
+            skipped.append(i)
+            continue
+        seen_links.add(link)
+        seen_hashes.add(h)
+        kept.append(i)
+    if not kept:
+        return [], skipped
+
+    # Hashing, compression and SLA fields only for rows that will be written,
+    # and before taking the write lock
+    rows, hashed = [], []
+    for i in kept:
+        row = prepared[i]
+        b = compute_bucket(row["stage"], row["day0_at"], row["decision"], now=now)
+        out = dict(row, stage=b["stage"], bucket_due=b["bucket_due"], next_action=b["next_action"],
+                   next_action_due=b["next_action_due"], updated_at=ts)
+        for c in PACKED_COLUMNS:
+            if c in out:
+                out[c] = pack_text(out[c])
+        rows.append(out)
+        hashed.append((minhash.signature(row["jd_text"]), jd_unit_keys(row["jd_text"])))
+    cols = list(rows[0])
+
+    with transaction() as conn:
+        # Re-checked under the write lock in case another writer added a key since
+        raced_links, raced_hashes = existing_keys(conn, rows)
+        fresh = []
+        for i, row, h in zip(kept, rows, hashed):
+            if (row["jd_link"] and row["jd_link"] in raced_links) or (row["jd_hash"] and row["jd_hash"] in raced_hashes):
+                skipped.append(i)
+            else:
+                fresh.append((i, row, h))
+
+        next_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM opportunities").fetchone()[0]
+        new_ids = list(range(next_id, next_id + len(fresh)))
+        conn.executemany(
+            f"INSERT INTO opportunities (id, {', '.join(cols)}) VALUES (?, {', '.join('?' * len(cols))})",
+            [[oid] + [row[c] for c in cols] for oid, (_, row, _) in zip(new_ids, fresh)],
+        )
+        signed = [(oid, sig) for oid, (_, _, (sig, _)) in zip(new_ids, fresh) if sig is not None]
+        conn.executemany("INSERT INTO jd_signatures VALUES (?, ?)", [(oid, minhash.to_blob(sig)) for oid, sig in signed])
+        conn.executemany("INSERT INTO jd_lsh VALUES (?, ?, ?)", [
+            (b, k, oid) for oid, sig in signed for b, k in minhash.band_keys(sig)
+        ])
+        conn.executemany("INSERT INTO jd_units VALUES (?, ?, ?, ?)", [
+            (_name_key(row["company"]), key, oid, _name_key(row["role_title"]))
+            for oid, (_, row, (_, units)) in zip(new_ids, fresh) for key in units
+        ])
+        for oid, (i, _, _) in zip(new_ids, fresh):
+            if prepared[i]["analysis_json"]:
+                _index_analysis(conn, oid, prepared[i]["analysis_json"])
+    return new_ids, sorted(skipped)
+
+def iter_opportunities(batch_size: int = 500, stage: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Every opportunity (optionally one stage) as a full, decompressed row, in
+    id order. Reads in keyset batches and holds no connection between them,
+    so it is safe to stream from and to abandon midway.
+    """
+    last_id = 0
+    while True:
+        sql = "SELECT * FROM opportunities WHERE id > ?"
+        params: List[Any] = [last_id]
+        if stage:
+            sql += " AND stage = ?"
+            params.append(stage)
+        with connection() as conn:
+            rows = conn.execute(sql + " ORDER BY id LIMIT ?", params + [batch_size]).fetchall()
+        if not rows:
+            return
+        for r in rows:
+            yield _unpack_row(r)
+        last_id = rows[-1]["id"]
+
+# --- analysis history ---
+
+def _record_history(conn, opp_id: int, old_json: str, old_model: Optional[str], new_json: Optional[str]) -> None:
+    old = json.loads(old_json)
+    new = json.loads(new_json) if new_json else {}
+    delta = zlib.compress(json.dumps(jsondelta.diff(new, old), separators=(",", ":")).encode("utf-8"))
+    conn.execute("""
+        INSERT INTO analysis_history (opportunity_id, superseded_at, analysis_model, delta, delta_bytes, full_bytes)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (opp_id, now_iso(), old_model, delta, len(delta), len(old_json.encode("utf-8"))))
+
+def analysis_history(opp_id: int) -> List[Dict[str, Any]]:
+    """Superseded versions, newest first (without the deltas)."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT id, superseded_at, analysis_model, delta_bytes, full_bytes
+            FROM analysis_history
+            WHERE opportunity_id = ?
+            ORDER BY id DESC
+        """, (opp_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+def analysis_version(opp_id: int, history_id: int) -> Optional[Dict[str, Any]]:
+    """Rebuilds a superseded analysis by walking reverse deltas back from the current one."""
+    with connection() as conn:
+        cur = conn.execute("SELECT analysis_json FROM opportunities WHERE id = ?", (opp_id,)).fetchone()
+        rows = conn.execute("""
+            SELECT id, delta FROM analysis_history
+            WHERE opportunity_id = ? AND id >= ?
+            ORDER BY id DESC
+        """, (opp_id, history_id)).fetchall()
+    if not cur or not rows or rows[-1]["id"] != history_id:
+        return None
+    a = json.loads(unpack_text(cur["analysis_json"])) if cur["analysis_json"] else {}
+    for r in rows:
+        a = jsondelta.apply(a, json.loads(zlib.decompress(r["delta"])))
+    return a
+
+def pack_text_columns(batch_size: int = 500) -> Dict[str, int]:
+    """
+    Rewrites plain-text jd_text / analysis_json / analysis_jd_text values in
+    packed form. Only those columns are written: updated_at, the signatures
+    and the analysis index are left alone (the search trigger re-indexes the
+    same text). Returns rows rewritten and bytes saved.
+    """
+    rewritten = saved = 0
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute(f"""
+                SELECT id, {", ".join(PACKED_COLUMNS)} FROM opportunities
+                WHERE id > ? ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return {"rows": rewritten, "bytes_saved": saved}
+        updates = []
+        for r in rows:
+            changed = {}
+            for col in PACKED_COLUMNS:
+                if isinstance(r[col], str):
+                    packed = pack_text(r[col])
+                    if isinstance(packed, bytes):
+                        changed[col] = packed
+                        saved += len(r[col].encode("utf-8")) - len(packed)
+            if changed:
+                updates.append((r["id"], changed))
+        with transaction() as conn:
+            for oid, changed in updates:
+                conn.execute(
+                    f"UPDATE opportunities SET {', '.join(f'{c} = ?' for c in changed)} WHERE id = ?",
+                    list(changed.values()) + [oid],
+                )
+        rewritten += len(updates)
+        last_id = rows[-1]["id"]
+
+# --- near-duplicate JDs ---
+
+def _index_signature(conn, opp_id: int, sig) -> None:
+    """Replaces the stored MinHash signature and LSH buckets for one opportunity."""
+    old = conn.execute("SELECT signature FROM jd_signatures WHERE opportunity_id = ?", (opp_id,)).fetchone()
+    if old:
+        # Buckets are recomputed from the old signature: deletes stay on the primary key
+        conn.executemany(
+            "DELETE FROM jd_lsh WHERE band = ? AND bucket = ? AND opportunity_id = ?",
+            [(b, k, opp_id) for b, k in minhash.band_keys(minhash.from_blob(old["signature"]))],
+        )
+        conn.execute("DELETE FROM jd_signatures WHERE opportunity_id = ?", (opp_id,))
+    if sig is None:
+        return
+    conn.execute("INSERT INTO jd_signatures VALUES (?, ?)", (opp_id, minhash.to_blob(sig)))
+    conn.executemany("INSERT INTO jd_lsh VALUES (?, ?, ?)", [(b, k, opp_id) for b, k in minhash.band_keys(sig)])
+
+@traced("db.near_duplicates")
+def near_duplicates(opp_id: int, threshold: Optional[float] = None, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Other opportunities whose JD is estimated to be at least `threshold`
+    Jaccard-similar (default minhash.DEFAULT_THRESHOLD), most similar first.
+    Only LSH bucket matches are compared, so cost follows the number of
+    candidates rather than the table size.
+    """
+    threshold = minhash.DEFAULT_THRESHOLD if threshold is None else threshold
+    with connection() as conn:
+        row = conn.execute("SELECT signature FROM jd_signatures WHERE opportunity_id = ?", (opp_id,)).fetchone()
+        if not row:
+            return []
+        sig = minhash.from_blob(row["signature"])
+        keys = minhash.band_keys(sig)
+        candidates = conn.execute(f"""
+            WITH k(band, bucket) AS (VALUES {", ".join(["(?, ?)"] * len(keys))})
+            SELECT DISTINCT s.opportunity_id, s.signature
+            FROM k
+            JOIN jd_lsh l ON l.band = k.band AND l.bucket = k.bucket
+            JOIN jd_signatures s ON s.opportunity_id = l.opportunity_id
+            WHERE l.opportunity_id != ?
+        """, [v for key in keys for v in key] + [opp_id]).fetchall()
+
+        scored = sorted(
+            (
+                (minhash.similarity(sig, minhash.from_blob(c["signature"])), c["opportunity_id"])
+                for c in candidates
+            ),
+            reverse=True,
+        )
+        scored = [(sim, cid) for sim, cid in scored if sim >= threshold][:limit]
+        if not scored:
+            return []
+        rows = conn.execute(f"""
+            SELECT id, company, role_title, stage, jd_link, analysis_json IS NOT NULL AS has_analysis
+            FROM opportunities
+            WHERE id IN ({", ".join("?" * len(scored))})
+        """, [cid for _, cid in scored]).fetchall()
+    by_id = {r["id"]: dict(r) for r in rows}
+    return [dict(by_id[cid], similarity=sim) for sim, cid in scored if cid in by_id]
+
+def reindex_signatures(batch_size: int = 500) -> int:
+    """Backfills MinHash signatures for every opportunity with JD text. Returns rows indexed."""
+    done = 0
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute("""
+                SELECT id, jd_text FROM opportunities
+                WHERE id > ? AND jd_text IS NOT NULL
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return done
+        sigs = [(r["id"], minhash.signature(unpack_text(r["jd_text"]))) for r in rows]
+        with transaction() as conn:
+            for oid, sig in sigs:
+                _index_signature(conn, oid, sig)
+        done += len(rows)
+        last_id = rows[-1]["id"]
+
+# --- pre-screen vectors ---
+
+def jd_vectors_to_refresh(rules_version: int, limit: int = 500) -> List[Dict[str, Any]]:
+    """Opportunities whose JD has no stored vector, or changed (or the rules did) since it was built."""
+    with connection() as conn:
+        ids = [r[0] for r in conn.execute("""
+            SELECT o.id
+            FROM opportunities o
+            LEFT JOIN jd_vectors v INDEXED BY idx_jd_vectors_hash ON v.opportunity_id = o.id
+            WHERE o.jd_hash IS NOT NULL AND (v.jd_hash IS NULL OR v.jd_hash != o.jd_hash OR v.rules_version != ?)
+            LIMIT ?
+        """, (rules_version, limit))]
+        if not ids:
+            return []
+        rows = conn.execute(
+            f"SELECT id, jd_hash, jd_text FROM opportunities WHERE id IN ({', '.join('?' * len(ids))})", ids,
+        ).fetchall()
+    return [_unpack_row(r) for r in rows]
+
+def put_jd_vectors(rows: List[Tuple[int, str, bytes, bytes, str, int]]) -> None:
+    """Upserts (opportunity_id, jd_hash, indices, counts, signals, rules_version) rows."""
+    ts = now_iso()
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO jd_vectors (opportunity_id, jd_hash, indices, counts, signals, rules_version, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(opportunity_id) DO UPDATE SET
+                jd_hash = excluded.jd_hash, indices = excluded.indices, counts = excluded.counts,
+                signals = excluded.signals, rules_version = excluded.rules_version, updated_at = excluded.updated_at
+        """, [(*r, ts) for r in rows])
+
+def prune_jd_vectors() -> int:
+    """Drops vectors of opportunities that no longer have JD text."""
+    orphaned = "opportunity_id NOT IN (SELECT id FROM opportunities WHERE jd_hash IS NOT NULL)"
+    with connection() as conn:
+        # Checked first so the usual no-op doesn't take the write lock
+        if not conn.execute(f"SELECT 1 FROM jd_vectors WHERE {orphaned} LIMIT 1").fetchone():
+            return 0
+    with transaction() as conn:
+        return conn.execute(f"DELETE FROM jd_vectors WHERE {orphaned}").rowcount
+
+def jd_vectors_fingerprint() -> Tuple[int, Optional[str]]:
+    """Changes whenever a vector is added, rebuilt or dropped."""
+    with connection() as conn:
+        row = conn.execute("SELECT COUNT(*), MAX(updated_at) FROM jd_vectors").fetchone()
+    return row[0], row[1]
+
+def load_jd_vectors() -> List[Tuple[int, bytes, bytes, str]]:
+    with connection() as conn:
+        return [tuple(r) for r in conn.execute("SELECT opportunity_id, indices, counts, signals FROM jd_vectors ORDER BY opportunity_id")]
+
+def new_opportunity_ids() -> List[int]:
+    with connection() as conn:
+        return [r[0] for r in conn.execute("SELECT id FROM opportunities WHERE stage = 'NEW'")]
+
+def opportunity_titles(ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """id -> {id, company, role_title} for the given ids."""
+    out: Dict[int, Dict[str, Any]] = {}
+    with connection() as conn:
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for r in conn.execute(
+                f"SELECT id, company, role_title FROM opportunities WHERE id IN ({', '.join('?' * len(chunk))})", chunk,
+            ):
+                out[r["id"]] = dict(r)
+    return out
+
+# --- JD compaction ---
+
+def _name_key(s: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", s or "").strip().lower()
+
+def _index_units(conn, opp_id: int, company: str, role_title: str, units: List[str]) -> None:
+    """Replaces the stored sentence hashes (utils.jd_unit_keys) for one opportunity."""
+    conn.execute("DELETE FROM jd_units WHERE opportunity_id = ?", (opp_id,))
+    company_key, role_key = _name_key(company), _name_key(role_title)
+    conn.executemany("INSERT INTO jd_units VALUES (?, ?, ?, ?)", [(company_key, k, opp_id, role_key) for k in units])
+
+def repeated_units(company: str, role_title: str, units: List[str]) -> set:
+    """The units that also appear in the same company's JDs for a different role."""
+    if not units:
+        return set()
+    out = set()
+    with connection() as conn:
+        for i in range(0, len(units), 500):
+            chunk = units[i:i + 500]
+            out.update(r[0] for r in conn.execute(f"""
+                SELECT DISTINCT unit_key FROM jd_units
+                WHERE company_key = ? AND unit_key IN ({", ".join("?" * len(chunk))}) AND role_key != ?
+            """, [_name_key(company), *chunk, _name_key(role_title)]))
+    return out
+
+def reindex_units(batch_size: int = 500) -> int:
+    """Backfills the sentence-hash index for every opportunity with JD text. Returns rows indexed."""
+    done = 0
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute("""
+                SELECT id, company, role_title, jd_text FROM opportunities
+                WHERE id > ? AND jd_text IS NOT NULL
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+        if not rows:
+            return done
+        units = [(r["id"], r["company"], r["role_title"], jd_unit_keys(unpack_text(r["jd_text"]))) for r in rows]
+        with transaction() as conn:
+            for oid, company, role_title, keys in units:
+                _index_units(conn, oid, company, role_title, keys)
+        done += len(rows)
+        last_id = rows[-1]["id"]
+
+def common_units(min_companies: int) -> Dict[str, int]:
+    """unit_key -> number of companies, for units found in at least min_companies companies' JDs."""
+    with connection() as conn:
+        return dict(conn.execute("""
+            SELECT unit_key, COUNT(DISTINCT company_key) AS companies
+            FROM jd_units
+            GROUP BY unit_key
+            HAVING companies >= ?
+        """, (min_companies,)).fetchall())
+
+def boilerplate_phrases() -> List[Dict[str, Any]]:
+    with connection() as conn:
+        return [dict(r) for r in conn.execute("SELECT * FROM boilerplate_phrases ORDER BY phrase")]
+
+def boilerplate_fingerprint() -> Tuple[int, Optional[str]]:
+    """Changes whenever a phrase is added or removed."""
+    with connection() as conn:
+        row = conn.execute("SELECT COUNT(*), MAX(created_at) FROM boilerplate_phrases").fetchone()
+    return row[0], row[1]
+
+def add_boilerplate_phrases(phrases: List[Tuple[str, Optional[int]]], source: str) -> int:
+    """Adds (phrase, companies) pairs; phrases already stored are kept as they are. Returns how many were new."""
+    ts = now_iso()
+    with transaction() as conn:
+        before = conn.execute("SELECT COUNT(*) FROM boilerplate_phrases").fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO boilerplate_phrases (phrase, source, companies, created_at) VALUES (?, ?, ?, ?)",
+            [(p, source, n, ts) for p, n in phrases],
+        )
+        return conn.execute("SELECT COUNT(*) FROM boilerplate_phrases").fetchone()[0] - before
+
+def remove_boilerplate_phrases(phrases: List[str]) -> int:
+    if not phrases:
+        return 0
+    with transaction() as conn:
+        return conn.execute(
+            f"DELETE FROM boilerplate_phrases WHERE phrase IN ({', '.join('?' * len(phrases))})", phrases,
+        ).rowcount
+
+# --- SLA sweep ---
+
+SLA_FIELDS = ("stage", "bucket_due", "next_action", "next_action_due")
+# compute_bucket dates these from `now`; once set they only move when the row is edited
+ROLLING_DUE_STAGES = ("APPLIED", "INTERVIEWING")
+
+@traced("db.sweep_buckets")
+def sweep_buckets(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Recomputes compute_bucket for every active opportunity against one clock
+    reading and writes only the rows whose SLA fields changed, in one
+    transaction. updated_at is left alone so a sweep doesn't reorder the
+    recently-updated listing. APPLIED / INTERVIEWING rows keep the due date
+    they already have, otherwise every sweep would push it to `now`.
+    """
+    now = now or datetime.utcnow()
+    with transaction() as conn:
+        rows = conn.execute("""
+            SELECT id, stage, decision, day0_at, bucket_due, next_action, next_action_due
+            FROM opportunities
+            WHERE stage NOT IN ('CLOSED', 'DQ') AND day0_at IS NOT NULL
+        """).fetchall()
+
+        changed = []
+        for r in rows:
+            b = compute_bucket(r["stage"], r["day0_at"], r["decision"], now=now)
+            if r["stage"] in ROLLING_DUE_STAGES and b["stage"] == r["stage"] and r["next_action_due"]:
+                b["bucket_due"], b["next_action_due"] = r["bucket_due"], r["next_action_due"]
+            if any(b[f] != (r[f] if f != "next_action" else (r[f] or "")) for f in SLA_FIELDS):
+                changed.append((b["stage"], b["bucket_due"], b["next_action"], b["next_action_due"], r["id"]))
+
+        conn.executemany("""
+            UPDATE opportunities
+            SET stage = ?, bucket_due = ?, next_action = ?, next_action_due = ?
+            WHERE id = ?
+        """, changed)
+    return {"scanned": len(rows), "updated": len(changed)}
+
+@traced("db.list_due_queue")
+def list_due_queue(due_before: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """Opportunities with a pending next action, soonest first."""
+    sql = """
+        SELECT id, company, role_title, stage, decision, next_action, next_action_due
+        FROM opportunities
+        WHERE next_action_due IS NOT NULL
+    """
+    params: List[Any] = []
+    if due_before:
+        sql += " AND next_action_due <= ?"
+        params.append(due_before)
+    sql += " ORDER BY next_action_due LIMIT ?"
+    params.append(limit)
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(r) for r in rows]
+
+# --- normalized analysis index ---
+
+def _norm_key(s: str) -> str:
+    # "3) Learning/Growth " -> "learning/growth"
+    s = re.sub(r"^\s*\d+\s*[\).:-]\s*", "", s or "")
+    return re.sub(r"\s+", " ", s).strip().lower()
+
+def _index_analysis(conn, opp_id: int, analysis_json: Optional[str]) -> None:
+    """Rewrites the child rows for one opportunity from its analysis blob."""
+    conn.execute("DELETE FROM analysis_scores WHERE opportunity_id = ?", (opp_id,))
+    conn.execute("DELETE FROM analysis_evidence WHERE opportunity_id = ?", (opp_id,))
+    conn.execute("DELETE FROM analysis_items WHERE opportunity_id = ?", (opp_id,))
+    if not analysis_json:
+        return
+    a = json.loads(analysis_json)
+
+    scores, evidence, items = [], [], []
+    for pos, item in enumerate(a.get("scorecard", [])):
+        scores.append((opp_id, pos, item["quality"], _norm_key(item["quality"]), item["score"], item.get("rationale")))
+        for e in item.get("evidence", []):
+            evidence.append((opp_id, pos, e.get("quote", ""), e.get("note")))
+        for u in item.get("unknowns", []):
+            items.append((opp_id, "unknown", u, _norm_key(u)))
+    for g in a.get("strengths_and_gaps", {}).get("gaps", []):
+        items.append((opp_id, "gap", g, _norm_key(g)))
+    for r in a.get("downside_case", {}).get("top_risks", []):
+        items.append((opp_id, "risk", r, _norm_key(r)))
+
+    conn.executemany("INSERT INTO analysis_scores VALUES (?, ?, ?, ?, ?, ?)", scores)
+    conn.executemany("INSERT INTO analysis_evidence VALUES (?, ?, ?, ?)", evidence)
+    conn.executemany("INSERT INTO analysis_items VALUES (?, ?, ?, ?)", items)
+
+def reindex_analyses(batch_size: int = 500) -> int:
+    """Backfills the analysis tables from every stored analysis_json. Returns rows indexed."""
+    done = 0
+    last_id = 0
+    while True:
+        with transaction() as conn:
+            rows = conn.execute("""
+                SELECT id, analysis_json FROM opportunities
+                WHERE id > ? AND analysis_json IS NOT NULL
+                ORDER BY id LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            for r in rows:
+                _index_analysis(conn, r["id"], unpack_text(r["analysis_json"]))
+        if not rows:
+            return done
+        done += len(rows)
+        last_id = rows[-1]["id"]
+
+def opportunities_with_score(quality: str, min_score: int = 1, max_score: int = 5) -> List[Dict[str, Any]]:
+    """e.g. opportunities_with_score("Autonomy", 4) -> every role where Autonomy scored >= 4."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT o.id, o.company, o.role_title, o.stage, o.decision, s.quality, s.score
+            FROM analysis_scores s
+            JOIN opportunities o ON o.id = s.opportunity_id
+            WHERE s.quality_key = ? AND s.score BETWEEN ? AND ?
+            ORDER BY s.score DESC, o.updated_at DESC
+        """, (_norm_key(quality), min_score, max_score)).fetchall()
+    return [dict(r) for r in rows]
+
+def score_averages() -> List[Dict[str, Any]]:
+    """Average score per rubric quality across all analyzed opportunities."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT MIN(quality) AS quality, quality_key, AVG(score) AS avg_score,
+                   MIN(score) AS min_score, MAX(score) AS max_score, COUNT(*) AS n
+            FROM analysis_scores
+            GROUP BY quality_key
+            ORDER BY avg_score DESC
+        """).fetchall()
+    return [dict(r) for r in rows]
+
+def common_items(kind: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most frequent gaps / risks / unknowns, e.g. common_items("gap")."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT MIN(text) AS text, COUNT(DISTINCT opportunity_id) AS opportunities
+            FROM analysis_items
+            WHERE kind = ?
+            GROUP BY text_key
+            ORDER BY opportunities DESC
+            LIMIT ?
+        """, (kind, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+# --- performance metrics ---
+
+def record_spans(rows: List[tuple]) -> None:
+    """rows: (trace_id, parent_name, name, started_at, duration_ms, tokens, attrs_json)"""
+    with transaction() as conn:
+        conn.executemany("""
+            INSERT INTO metrics_spans (trace_id, parent_name, name, started_at, duration_ms, tokens, attrs_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+def span_percentiles(since: str) -> List[Dict[str, Any]]:
+    """p50/p95/p99 duration per span name for spans started at or after `since`."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT name, duration_ms FROM metrics_spans
+            WHERE started_at >= ?
+            ORDER BY name, duration_ms
+        """, (since,)).fetchall()
+    by_name: Dict[str, List[float]] = {}
+    for r in rows:
+        by_name.setdefault(r["name"], []).append(r["duration_ms"])
+    out = []
+    for name, vals in by_name.items():
+        out.append({
+            "stage": name,
+            "count": len(vals),
+            "p50_ms": _percentile(vals, 0.50),
+            "p95_ms": _percentile(vals, 0.95),
+            "p99_ms": _percentile(vals, 0.99),
+            "mean_ms": sum(vals) / len(vals),
+        })
+    out.sort(key=lambda d: d["p95_ms"], reverse=True)
+    return out
+
+def token_throughput(since: str, span_name: str = "llm.completion") -> List[Dict[str, Any]]:
+    """Tokens billed and tokens/sec of model time, bucketed by hour."""
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT substr(started_at, 1, 13) || ':00' AS hour,
+                   SUM(tokens) AS tokens,
+                   SUM(duration_ms) AS duration_ms,
+                   COUNT(*) AS calls
+            FROM metrics_spans
+            WHERE name = ? AND started_at >= ? AND tokens IS NOT NULL
+            GROUP BY hour
+            ORDER BY hour
+        """, (span_name, since)).fetchall()
+    return [
+        dict(r, tokens_per_s=(r["tokens"] / (r["duration_ms"] / 1000)) if r["duration_ms"] else 0.0)
+        for r in rows
+    ]
+
+def slowest_traces(since: str, limit: int = 20) -> List[Dict[str, Any]]:
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT trace_id, name, started_at, duration_ms, tokens, attrs_json
+            FROM metrics_spans
+            WHERE parent_name IS NULL AND started_at >= ?
+            ORDER BY duration_ms DESC
+            LIMIT ?
+        """, (since, limit)).fetchall()
+    return [dict(r) for r in rows]
+
+def trace_spans(trace_id: str) -> List[Dict[str, Any]]:
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT name, parent_name, started_at, duration_ms, tokens, attrs_json
+            FROM metrics_spans
+            WHERE trace_id = ?
+            ORDER BY started_at, id
+        """, (trace_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+def prune_spans(older_than: str) -> int:
+    with connection() as conn:
+        return conn.execute("DELETE FROM metrics_spans WHERE started_at < ?", (older_than,)).rowcount
+
+# --- schema repairs ---
+
+def record_repair(model: str, scope: str, report: Dict[str, Any], ok: bool) -> None:
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO analysis_repairs (
+                created_at, model, scope, ok, local_fixes, remote_attempts,
+                extra_tokens, tokens_saved, seconds_saved, report_json
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            now_iso(), model, scope, int(ok), len(report["local_fixes"]), report["remote_attempts"],
+            report["extra_prompt_tokens"] + report["extra_completion_tokens"],
+            report["tokens_saved"] if ok else 0, report.get("seconds_saved") if ok else None,
+            json.dumps(report),
+        ))
+
+def repair_stats(since: str) -> Dict[str, Any]:
+    with connection() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*) AS outputs,
+                   COALESCE(SUM(ok), 0) AS salvaged,
+                   COALESCE(SUM(remote_attempts = 0 AND ok), 0) AS fixed_locally,
+                   COALESCE(SUM(remote_attempts), 0) AS remote_attempts,
+                   COALESCE(SUM(extra_tokens), 0) AS extra_tokens,
+                   COALESCE(SUM(tokens_saved), 0) AS tokens_saved,
+                   COALESCE(SUM(seconds_saved), 0) AS seconds_saved
+            FROM analysis_repairs
+            WHERE created_at >= ?
+        """, (since,)).fetchone()
+    return dict(row)
+
+# --- analysis job queue ---
+
+def _job_row(row) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job.pop("params_json"))
+    job["result"] = json.loads(job.pop("result_json")) if job["result_json"] else None
+    job["partial"] = json.loads(job.pop("partial_json")) if job["partial_json"] else None
+    return job
+
+def enqueue_job(opp_id: int, kind: str, input_hash: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Queues a job unless one for the same (opportunity, input hash) is already
+    queued or running, in which case that job is returned. A finished or
+    failed job with the same key is reset and queued again.
+    """
+    with transaction() as conn:
+        conn.execute("""
+            INSERT INTO jobs (opportunity_id, kind, input_hash, params_json, status, created_at)
+            VALUES (?, ?, ?, ?, 'queued', ?)
+            ON CONFLICT(opportunity_id, input_hash) DO UPDATE SET
+                params_json = excluded.params_json, status = 'queued', progress = 0, progress_text = NULL,
+                partial_json = NULL, attempts = 0, worker_id = NULL, error = NULL, result_json = NULL,
+                created_at = excluded.created_at, started_at = NULL, heartbeat_at = NULL, finished_at = NULL
+            WHERE jobs.status IN ('done', 'failed')
+        """, (opp_id, kind, input_hash, json.dumps(params), now_iso()))
+        row = conn.execute("SELECT * FROM jobs WHERE opportunity_id = ? AND input_hash = ?", (opp_id, input_hash)).fetchone()
+    return _job_row(row)
+
+def claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """Marks the oldest queued job running for worker_id and returns it, or None."""
+    with connection() as conn:
+        # Idle workers poll; check without the write lock first
+        if conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+            return None
+    ts = now_iso()
+    with transaction() as conn:
+        row = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        if row is None:
+            return None
+        conn.execute("""
+            UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1,
+                            started_at = ?, heartbeat_at = ?, progress = 0, progress_text = NULL, partial_json = NULL
+            WHERE id = ?
+        """, (worker_id, ts, ts, row["id"]))
+        return _job_row(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+def requeue_stale_jobs(stale_before: str, max_attempts: int) -> int:
+    """
+    Running jobs whose worker stopped heartbeating (crash, restart) go back to
+    the queue, or fail once they have used max_attempts. Returns the count.
+    """
+    with transaction() as conn:
+        cur = conn.execute("""
+            UPDATE jobs SET
+                status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= ? THEN 'Worker stopped responding' ELSE NULL END,
+                finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END,
+                worker_id = NULL
+            WHERE status = 'running' AND heartbeat_at < ?
+        """, (max_attempts, max_attempts, max_attempts, now_iso(), stale_before))
+        return cur.rowcount
+
+def heartbeat_jobs(worker_ids: List[str]) -> None:
+    if not worker_ids:
+        return
+    with connection() as conn:
+        conn.execute(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND worker_id IN ({', '.join('?' * len(worker_ids))})",
+            [now_iso(), *worker_ids],
+        )
+
+def update_job_progress(
+    job_id: int, worker_id: str, progress: float, text: str, partial: Optional[Dict[str, Any]] = None,
+) -> None:
+    """partial, if given, replaces the job's partial analysis (the fields streamed so far)."""
+    with connection() as conn:
+        conn.execute("""
+            UPDATE jobs SET progress = ?, progress_text = ?, heartbeat_at = ?, partial_json = COALESCE(?, partial_json)
+            WHERE id = ? AND worker_id = ? AND status = 'running'
+        """, (progress, text, now_iso(), json.dumps(partial) if partial is not None else None, job_id, worker_id))
+
+def finish_job(job_id: int, worker_id: str, fields: Dict[str, Any], result: Dict[str, Any]) -> bool:
+    """
+    Saves the analysis fields and marks the job done in one commit. Returns
+    False (and writes nothing) if the job was taken away from worker_id.
+    """
+    with transaction() as conn:
+        cur = conn.execute("""
+            UPDATE jobs SET status = 'done', progress = 1, progress_text = NULL, partial_json = NULL,
+                            result_json = ?, finished_at = ?
+            WHERE id = ? AND worker_id = ? AND status = 'running'
+        """, (json.dumps(result), now_iso(), job_id, worker_id))
+        if not cur.rowcount:
+            return False
+        opp_id = conn.execute("SELECT opportunity_id FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        update_opportunity(opp_id, fields)
+    return True
+
+def fail_job(job_id: int, worker_id: str, error: str) -> None:
+    with connection() as conn:
+        conn.execute("""
+            UPDATE jobs SET status = 'failed', error = ?, finished_at = ?
+            WHERE id = ? AND worker_id = ? AND status = 'running'
+        """, (error, now_iso(), job_id, worker_id))
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        return _job_row(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+def latest_job(opp_id: int, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Most recently queued job for the opportunity."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE opportunity_id = ? AND kind = COALESCE(?, kind) ORDER BY created_at DESC, id DESC LIMIT 1",
+            (opp_id, kind),
+        ).fetchone()
+    return _job_row(row)
+
+def queue_position(job_id: int) -> int:
+    """Queued jobs ahead of job_id (0 = next to run)."""
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND id < ?", (job_id,)).fetchone()[0]
+
+def job_counts() -> Dict[str, int]:
+    with connection() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status").fetchall()
+    return {"queued": 0, "running": 0, **{r[0]: r[1] for r in rows}}
+
+# --- OpenAI rate limiter and spend ledger ---
+# Token buckets are rows in rate_buckets (level + epoch seconds of the last
+# refill) so every process shares them. Callers wait in rate_waiters and are
+# served strictly oldest first; a waiter that stops polling is dropped.
+
+def rate_leave(ticket: int) -> None:
+    with connection() as conn:
+        conn.execute("DELETE FROM rate_waiters WHERE id = ?", (ticket,))
+
+def rate_queue_head(live_after: float) -> Optional[int]:
+    """Ticket of the oldest waiter that polled since live_after (epoch seconds)."""
+    with connection() as conn:
+        return conn.execute("SELECT MIN(id) FROM rate_waiters WHERE seen_at >= ?", (live_after,)).fetchone()[0]
+
+def _bucket_level(conn, name: str, capacity: float, now: float) -> float:
+    row = conn.execute("SELECT level, updated_at FROM rate_buckets WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        return capacity
+    # Refills at capacity per minute
+    return min(capacity, row["level"] + (now - row["updated_at"]) * capacity / 60.0)
+
+def _set_bucket(conn, name: str, level: float, now: float) -> None:
+    conn.execute("""
+        INSERT INTO rate_buckets (name, level, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET level = excluded.level, updated_at = excluded.updated_at
+    """, (name, level, now))
+
+def rate_try_acquire(
+    ticket: Optional[int],
+    tokens: int,
+    rpm: int,
+    tpm: int,
+    live_after: float,
+    reservation: Dict[str, Any],
+    budgets: List[Tuple[str, str, Optional[float]]],
+) -> Dict[str, Any]:
+    """
+    One attempt to take a request and `tokens` from the shared buckets. A new
+    caller passes ticket=None and is served at once if nobody is waiting and
+    the buckets allow; otherwise it joins the queue. Only the oldest live
+    waiter may take. Returns one of:
+      {"spend_id": id}    granted; the caller is out of the queue and
+                          `reservation` (model, scope, prompt/completion
+                          tokens, cost_usd) is in the spend ledger
+      {"wait": seconds}   head of the queue, but the buckets need time to refill
+      {"wait": None}      others are ahead
+      {"over_budget": period, "spent": usd, "limit": usd}
+                          the reservation would exceed a (period, since, limit)
+                          budget; the caller is out of the queue
+    Waiting results carry "ticket" (and "ahead" on joining) for the next attempt.
+    """
+    now = time.time()
+    with transaction() as conn:
+        conn.execute("DELETE FROM rate_waiters WHERE seen_at < ?", (live_after,))
+
+        def queued(result: Dict[str, Any], ahead: int = 0) -> Dict[str, Any]:
+            if ticket is not None:
+                return {**result, "ticket": ticket}
+            new = conn.execute(
+                "INSERT INTO rate_waiters (tokens, enqueued_at, seen_at) VALUES (?, ?, ?)", (tokens, now, now),
+            ).lastrowid
+            return {**result, "ticket": new, "ahead": ahead}
+
+        if ticket is None:
+            ahead = conn.execute("SELECT COUNT(*) FROM rate_waiters").fetchone()[0]
+            if ahead:
+                return queued({"wait": None}, ahead)
+        else:
+            # Upsert: a waiter dropped as stale gets its place back
+            conn.execute("""
+                INSERT INTO rate_waiters (id, tokens, enqueued_at, seen_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET seen_at = excluded.seen_at
+            """, (ticket, tokens, now, now))
+            if conn.execute("SELECT MIN(id) FROM rate_waiters").fetchone()[0] != ticket:
+                return {"wait": None, "ticket": ticket}
+
+        blocked = conn.execute("SELECT level FROM rate_buckets WHERE name = 'blocked_until'").fetchone()
+        if blocked and blocked[0] > now:
+            return queued({"wait": blocked[0] - now})
+
+        for period, since, limit in budgets:
+            if limit is None:
+                continue
+            spent = conn.execute("SELECT COALESCE(SUM(cost_usd), 0) FROM llm_spend WHERE created_at >= ?", (since,)).fetchone()[0]
+            if spent + reservation["cost_usd"] > limit:
+                conn.execute("DELETE FROM rate_waiters WHERE id = ?", (ticket,))
+                return {"over_budget": period, "spent": spent, "limit": limit}
+
+        need = min(tokens, tpm)
+        req = _bucket_level(conn, "requests", rpm, now)
+        tok = _bucket_level(conn, "tokens", tpm, now)
+        if req < 1 or tok < need:
+            _set_bucket(conn, "requests", req, now)
+            _set_bucket(conn, "tokens", tok, now)
+            return queued({"wait": max((1 - req) * 60.0 / rpm, (need - tok) * 60.0 / tpm, 0.0)})
+
+        _set_bucket(conn, "requests", req - 1, now)
+        _set_bucket(conn, "tokens", tok - need, now)
+        conn.execute("DELETE FROM rate_waiters WHERE id = ?", (ticket,))
+        spend_id = conn.execute("""
+            INSERT INTO llm_spend (created_at, model, scope, prompt_tokens, completion_tokens, cost_usd)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            now_iso(), reservation["model"], reservation.get("scope"),
+            reservation["prompt_tokens"], reservation["completion_tokens"], reservation["cost_usd"],
+        )).lastrowid
+    return {"spend_id": spend_id}
+
+def rate_settle(spend_id: int, prompt_tokens: int, completion_tokens: int, cost_usd: float, refund_tokens: int) -> None:
+    """Swaps a reservation for the billed usage and returns unused tokens (negative: takes more)."""
+    with transaction() as conn:
+        conn.execute("""
+            UPDATE llm_spend SET prompt_tokens = ?, completion_tokens = ?, cost_usd = ?, settled = 1 WHERE id = ?
+        """, (prompt_tokens, completion_tokens, cost_usd, spend_id))
+        if refund_tokens:
+            conn.execute("UPDATE rate_buckets SET level = level + ? WHERE name = 'tokens'", (refund_tokens,))
+
+def rate_penalize(until: float) -> None:
+    """Holds every waiter until `until` (epoch seconds), e.g. after a 429."""
+    with connection() as conn:
+        conn.execute("""
+            INSERT INTO rate_buckets (name, level, updated_at) VALUES ('blocked_until', ?, ?)
+            ON CONFLICT(name) DO UPDATE SET level = MAX(level, excluded.level), updated_at = excluded.updated_at
+        """, (until, time.time()))
+
+def spend_totals(day_start: str, month_start: str) -> Dict[str, Any]:
+    with connection() as conn:
+        row = conn.execute("""
+            SELECT COALESCE(SUM(cost_usd), 0) AS month_usd,
+                   COALESCE(SUM(CASE WHEN created_at >= ? THEN cost_usd END), 0) AS today_usd,
+                   COUNT(CASE WHEN created_at >= ? THEN 1 END) AS today_calls,
+                   COALESCE(SUM(settled = 0), 0) AS unsettled
+            FROM llm_spend
+            WHERE created_at >= ?
+        """, (day_start, day_start, month_start)).fetchone()
+        waiting = conn.execute("SELECT COUNT(*) FROM rate_waiters").fetchone()[0]
+    return {**dict(row), "waiting": waiting}
+
+# --- Day 0 analysis cache ---
+
+def _bump_cache_counter(conn, name: str, n: int = 1) -> None:
+    conn.execute("""
+        INSERT INTO analysis_cache_counters (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    """, (name, n))
+
+@traced("db.cache_get")
+def cache_get(cache_key: str) -> Optional[Dict[str, Any]]:
+    # Plain read; the write lock is only taken for the hit/miss bookkeeping
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM analysis_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+    with transaction() as conn:
+        if row:
+            conn.execute(
+                "UPDATE analysis_cache SET hit_count = hit_count + 1, last_hit_at = ? WHERE cache_key = ?",
+                (now_iso(), cache_key),
+            )
+            _bump_cache_counter(conn, "hits")
+        else:
+            _bump_cache_counter(conn, "misses")
+    return dict(row) if row else None
+
+@traced("db.cache_put")
+def cache_put(
+    cache_key: str,
+    analysis_json: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    total_tokens: int,
+) -> None:
+    with connection() as conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO analysis_cache (
+                cache_key, created_at, last_hit_at, hit_count, model, analysis_json,
+                prompt_tokens, completion_tokens, total_tokens, size_bytes
+            ) VALUES (?, ?, NULL, 0, ?, ?, ?, ?, ?, ?)
+        """, (cache_key, now_iso(), model, analysis_json,
+              prompt_tokens, completion_tokens, total_tokens, len(analysis_json.encode("utf-8"))))
+
+def cache_record_bypass() -> None:
+    with connection() as conn:
+        _bump_cache_counter(conn, "bypasses")
+
+def cache_evict(max_entries: int, max_age_days: int, max_bytes: Optional[int] = None) -> int:
+    """
+    Drops entries older than max_age_days (by last use), then least recently
+    used entries until at most max_entries / max_bytes remain. Returns rows removed.
+    """
+    with transaction() as conn:
+        cur = conn.cursor()
+        cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+        removed = cur.execute(
+            "DELETE FROM analysis_cache WHERE COALESCE(last_hit_at, created_at) < ?", (cutoff,)
+        ).rowcount
+
+        removed += cur.execute("""
+            DELETE FROM analysis_cache WHERE cache_key IN (
+                SELECT cache_key FROM analysis_cache
+                ORDER BY COALESCE(last_hit_at, created_at) DESC
+                LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+
+        if max_bytes is not None:
+            rows = cur.execute("""
+                SELECT cache_key, size_bytes FROM analysis_cache
+                ORDER BY COALESCE(last_hit_at, created_at) DESC
+            """).fetchall()
+            total = 0
+            over = []
+            for r in rows:
+                total += r["size_bytes"]
+                if total > max_bytes:
+                    over.append((r["cache_key"],))
+            if over:
+                cur.executemany("DELETE FROM analysis_cache WHERE cache_key = ?", over)
+                removed += len(over)
+
+        if removed:
+            _bump_cache_counter(conn, "evictions", removed)
+    return removed
 
-    conn.close()
+def cache_stats() -> Dict[str, Any]:
+    with connection() as conn:
+        counters = {r["name"]: r["value"] for r in conn.execute("SELECT name, value FROM analysis_cache_counters")}
+        row = conn.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS size_bytes FROM analysis_cache").fetchone()
+    stats = {k: counters.get(k, 0) for k in ("hits", "misses", "bypasses", "evictions")}
+    stats.update(dict(row))
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] / lookups) if lookups else 0.0
+    return stats
 
+def prompt_cache_usage() -> Dict[str, Any]:
+    """Share of billed prompt tokens the provider served from its prefix cache."""
+    with connection() as conn:
+        row = conn.execute("""
+            SELECT COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                   COALESCE(SUM(cached_prompt_tokens), 0) AS cached_prompt_tokens
+            FROM opportunities
+            WHERE prompt_tokens > 0
+        """).fetchone()
+    usage = dict(row)
+    usage["cached_share"] = (usage["cached_prompt_tokens"] / usage["prompt_tokens"]) if usage["prompt_tokens"] else 0.0
+    return usage
 
+def cache_clear() -> None:
+    with connection() as conn:
+        conn.execute("DELETE FROM analysis_cache")
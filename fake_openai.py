@@ -0,0 +1,237 @@
+# fake_openai.py
+"""
+Offline stand-in for the OpenAI client, for benchmarks and local runs
+without a key or spend.
+
+llm.get_client / get_async_client return these when OPENAI_FAKE=1. Behaviour
+is configured by FakeConfig, or from the environment via FakeConfig.from_env:
+
+    OPENAI_FAKE_LATENCY_MS      round-trip latency before the first byte (default 50)
+    OPENAI_FAKE_ERROR_RATE      share of calls failing with 429/500 (default 0)
+    OPENAI_FAKE_INVALID_RATE    share of analyses returned schema-invalid (default 0)
+    OPENAI_FAKE_COMPLETION_TOKENS  reported completion size; 0 = estimate from output
+    OPENAI_FAKE_CACHED_RATIO    share of prompt tokens reported as prefix-cache hits
+    OPENAI_FAKE_STREAM_CHUNKS   chunks per streamed response (default 40)
+    OPENAI_FAKE_CHUNK_DELAY_MS  delay between streamed chunks (default 5)
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import openai
+
+_RUBRIC_LINE = re.compile(r"^\s*\d+[\).]\s*(.+?)\s*$", re.M)
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 50.0
+    error_rate: float = 0.0
+    invalid_rate: float = 0.0
+    completion_tokens: int = 0
+    cached_ratio: float = 0.0
+    stream_chunks: int = 40
+    chunk_delay_ms: float = 5.0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeConfig":
+        return cls(
+            latency_ms=float(os.getenv("OPENAI_FAKE_LATENCY_MS", 50)),
+            error_rate=float(os.getenv("OPENAI_FAKE_ERROR_RATE", 0)),
+            invalid_rate=float(os.getenv("OPENAI_FAKE_INVALID_RATE", 0)),
+            completion_tokens=int(os.getenv("OPENAI_FAKE_COMPLETION_TOKENS", 0)),
+            cached_ratio=float(os.getenv("OPENAI_FAKE_CACHED_RATIO", 0)),
+            stream_chunks=int(os.getenv("OPENAI_FAKE_STREAM_CHUNKS", 40)),
+            chunk_delay_ms=float(os.getenv("OPENAI_FAKE_CHUNK_DELAY_MS", 5)),
+        )
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def fake_analysis(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """A JDAnalysis-valid object built from the prompt, with quotes taken from the JD."""
+    text = "\n".join(m["content"] for m in messages)
+    qualities = _RUBRIC_LINE.findall(text.split("USER PROFILE")[0]) or ["Autonomy", "Scope/Impact"]
+    jd = text.split("JOB DESCRIPTION", 1)[-1]
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", jd) if len(s.strip()) > 20] or ["Not specified."]
+
+    def quote(i: int) -> str:
+        return sentences[i % len(sentences)][:160]
+
+    return {
+        "role_summary": quote(0),
+        "extracted_requirements": [quote(i) for i in range(1, 5)],
+        "extracted_responsibilities": [quote(i) for i in range(5, 9)],
+        "scorecard": [
+            {
+                "quality": q,
+                "score": 1 + (sum(map(ord, q)) % 5),
+                "rationale": f"Fake rationale for {q}.",
+                "evidence": [{"quote": quote(i), "note": "Synthetic evidence."}],
+                "unknowns": [f"How {q.lower()} is measured"],
+            }
+            for i, q in enumerate(qualities)
+        ],
+        "strengths_and_gaps": {
+            "strengths": ["Relevant domain experience"],
+            "gaps": ["No direct experience with the listed stack"],
+            "bridging_language": ["Adjacent experience transfers quickly"],
+        },
+        "storyline": {
+            "why_company": ["Mission fit"],
+            "why_role": ["Scope matches recent work"],
+            "why_me": ["Track record shipping similar products"],
+            "closing": ["Excited to discuss next steps"],
+        },
+        "interview_prep": {
+            "likely_questions": ["Walk me through a recent launch."],
+            "questions_to_ask": ["How is success measured in the first 90 days?"],
+        },
+        "downside_case": {
+            "top_risks": ["Ambiguous ownership"],
+            "what_to_verify": ["Team size and reporting line"],
+        },
+    }
+
+def _fake_triage(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """The triage-only fields, consistent with the fake scorecard."""
+    return {
+        "provisional_scores": [
+            {"quality": s["quality"], "score": s["score"], "rationale": s["rationale"]} for s in analysis["scorecard"]
+        ],
+    }
+
+def _requested_schema(messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    for m in messages:
+        if m.get("role") == "system" and "JSON Schema:" in m["content"]:
+            try:
+                return json.loads(m["content"].split("JSON Schema:", 1)[1].strip())
+            except ValueError:
+                return None
+    return None
+
+def _corrupt(analysis: Dict[str, Any], needs_model: bool) -> Dict[str, Any]:
+    """Typical model slips: out-of-range scores, a scalar for a list, a stray key."""
+    analysis = json.loads(json.dumps(analysis))
+    analysis["confidence"] = "high"
+    for item in analysis.get("scorecard", []):
+        item["score"] = 7
+    if analysis.get("extracted_requirements"):
+        analysis["extracted_requirements"] = analysis["extracted_requirements"][0]
+    if needs_model and analysis.get("scorecard"):
+        # Can't be invented locally: forces a follow-up repair request
+        del analysis["scorecard"][0]["score"]
+    return analysis
+
+def _error(status: int) -> openai.APIStatusError:
+    # Duck-typed response: the error classes only read these attributes, and
+    # this avoids depending on whichever HTTP library the SDK version ships.
+    request = SimpleNamespace(method="POST", url="http://fake-openai.local/v1/chat/completions")
+    response = SimpleNamespace(status_code=status, request=request, headers={"retry-after": "0.05"})
+    if status == 429:
+        return openai.RateLimitError("Fake rate limit", response=response, body=None)
+    return openai.InternalServerError("Fake server error", response=response, body=None)
+
+class _Completions:
+    def __init__(self, config: FakeConfig):
+        self._config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _prepare(self, messages: List[Dict[str, str]]):
+        with self._lock:
+            self.calls += 1
+            roll = self._rng.random()
+        if roll < self._config.error_rate:
+            raise _error(429 if roll < self._config.error_rate / 2 else 500)
+
+        analysis = fake_analysis(messages)
+        fragment = messages[-1]["content"].split("FRAGMENT:", 1)
+        if len(fragment) == 2:
+            # Schema-repair follow-up: answer with the same top-level keys
+            keys = json.loads(fragment[1])
+            analysis = {k: v for k, v in analysis.items() if k in keys}
+        elif "JD CHANGES:" in messages[-1]["content"]:
+            # Diff-aware re-analysis: a partial object with just the fields the edit touches
+            analysis = {"extracted_requirements": analysis["extracted_requirements"]}
+        else:
+            # Answer only what the requested schema asks for (e.g. a single section)
+            schema = _requested_schema(messages)
+            if schema and schema.get("properties"):
+                analysis = {k: v for k, v in {**analysis, **_fake_triage(analysis)}.items() if k in schema["properties"]}
+            if roll >= self._config.error_rate and self._rng.random() < self._config.invalid_rate:
+                analysis = _corrupt(analysis, needs_model=self._rng.random() < 0.5)
+        content = json.dumps(analysis)
+        prompt_tokens = sum(_estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = self._config.completion_tokens or _estimate_tokens(content)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=int(prompt_tokens * self._config.cached_ratio)),
+        )
+        return content, usage
+
+    def _chunks(self, content: str, usage) -> List[Any]:
+        n = max(1, self._config.stream_chunks)
+        step = max(1, -(-len(content) // n))
+        chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + step]))], usage=None)
+            for i in range(0, len(content), step)
+        ]
+        chunks.append(SimpleNamespace(choices=[], usage=usage))
+        return chunks
+
+    @staticmethod
+    def _response(content: str, usage):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+class _SyncCompletions(_Completions):
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        time.sleep(self._config.latency_ms / 1000)
+        content, usage = self._prepare(messages)
+        if not stream:
+            return self._response(content, usage)
+        return self._stream(self._chunks(content, usage))
+
+    def _stream(self, chunks):
+        for c in chunks:
+            yield c
+            time.sleep(self._config.chunk_delay_ms / 1000)
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs):
+        await asyncio.sleep(self._config.latency_ms / 1000)
+        content, usage = self._prepare(messages)
+        if not stream:
+            return self._response(content, usage)
+        return self._stream(self._chunks(content, usage))
+
+    async def _stream(self, chunks):
+        for c in chunks:
+            yield c
+            await asyncio.sleep(self._config.chunk_delay_ms / 1000)
+
+class FakeOpenAI:
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig.from_env()
+        self.chat = SimpleNamespace(completions=_SyncCompletions(self.config))
+
+    def close(self) -> None:
+        pass
+
+class FakeAsyncOpenAI:
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig.from_env()
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self.config))
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,248 @@
+# governor.py
+"""
+Process-wide rate limiting and spend control for OpenAI calls.
+
+Every model call goes through reserve() / areserve():
+
+    with governor.reserve(model, messages, scope="day0") as grant:
+        resp = client.chat.completions.create(model=model, messages=messages, ...)
+        grant.settle(resp.usage)
+
+Before the call, the prompt's tokens are estimated and one request plus
+(prompt + expected completion) tokens are taken from token buckets kept in
+SQLite, so all sessions, workers and processes share one RPM/TPM allowance.
+Callers that have to wait are served in arrival order. The estimated cost is
+reserved against the daily and monthly USD budgets; a call that would exceed
+one raises BudgetExceededError instead of waiting. settle() swaps the
+reservation for the billed usage.
+
+Settings (Streamlit secrets or environment): OPENAI_RPM, OPENAI_TPM,
+OPENAI_DAILY_BUDGET_USD, OPENAI_MONTHLY_BUDGET_USD (unset = no budget).
+Time spent waiting is recorded as "llm.rate_wait" spans.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import openai
+import streamlit as st
+
+import db
+from tracing import record
+from utils import estimate_message_tokens, estimate_openai_cost
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+# Completion size reserved before the real usage is known
+DEFAULT_COMPLETION_TOKENS = 2_000
+# Waiters poll this often; the head of the queue never sleeps longer than
+# WAITER_BEAT_S, and a waiter silent for WAITER_TTL_S loses its place
+POLL_S = 0.05
+WAITER_BEAT_S = 1.0
+WAITER_TTL_S = 10.0
+DEFAULT_PENALTY_S = 1.0
+
+_overrides: Dict[str, Any] = {}
+
+class BudgetExceededError(RuntimeError):
+    pass
+
+def _setting(name: str) -> Optional[str]:
+    try:
+        value = st.secrets.get(name, None)
+    except Exception:
+        value = None
+    return value if value is not None else os.getenv(name)
+
+@contextmanager
+def configure(**settings: Any) -> Iterator[None]:
+    """
+    Overrides rpm / tpm / daily_usd / monthly_usd for this process while the
+    block runs, then restores what was there before. None leaves a setting as is.
+    """
+    previous = {k: _overrides.get(k) for k, v in settings.items() if v is not None}
+    _overrides.update({k: v for k, v in settings.items() if v is not None})
+    try:
+        yield
+    finally:
+        for k, v in previous.items():
+            if v is None:
+                _overrides.pop(k, None)
+            else:
+                _overrides[k] = v
+
+def limits() -> Dict[str, Any]:
+    def num(key: str, name: str, default, cast):
+        if key in _overrides:
+            return _overrides[key]
+        raw = _setting(name)
+        return cast(raw) if raw not in (None, "") else default
+
+    return {
+        "rpm": num("rpm", "OPENAI_RPM", DEFAULT_RPM, int),
+        "tpm": num("tpm", "OPENAI_TPM", DEFAULT_TPM, int),
+        "daily_usd": num("daily_usd", "OPENAI_DAILY_BUDGET_USD", None, float),
+        "monthly_usd": num("monthly_usd", "OPENAI_MONTHLY_BUDGET_USD", None, float),
+    }
+
+def _budget_windows(lim: Dict[str, Any], now: datetime) -> List[tuple]:
+    return [
+        ("daily", now.date().isoformat(), lim["daily_usd"]),
+        ("monthly", now.replace(day=1).date().isoformat(), lim["monthly_usd"]),
+    ]
+
+def spend_summary() -> Dict[str, Any]:
+    """Spend so far today and this month (UTC) against the configured budgets."""
+    now = datetime.utcnow()
+    lim = limits()
+    return {**db.spend_totals(now.date().isoformat(), now.replace(day=1).date().isoformat()), **lim}
+
+class Grant:
+    """One admitted call. settle() or release() exactly once; the context managers do it for you."""
+
+    def __init__(self, spend_id: int, model: str, prompt_tokens: int, completion_tokens: int):
+        self.spend_id = spend_id
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.settled = False
+
+    def settle(self, usage: Any = None) -> None:
+        """Records the billed usage; without usage the estimate stands."""
+        if self.settled:
+            return
+        self.settled = True
+        if usage is None:
+            db.rate_settle(self.spend_id, self.prompt_tokens, self.completion_tokens,
+                           estimate_openai_cost(self.prompt_tokens, self.completion_tokens, self.model), 0)
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        cost = estimate_openai_cost(prompt, completion, self.model, getattr(details, "cached_tokens", 0) or 0)
+        db.rate_settle(self.spend_id, prompt, completion, cost, self.prompt_tokens + self.completion_tokens - prompt - completion)
+
+    def release(self, error: BaseException) -> None:
+        """
+        The call failed. A request the API rejected with a 4xx bills
+        nothing, so its tokens and cost are returned; a 429 also pauses every
+        caller. Any other failure (5xx, connection or timeout errors, a stream
+        abandoned midway) may have been billed and keeps the estimate.
+        """
+        if self.settled:
+            return
+        if not (isinstance(error, openai.APIStatusError) and 400 <= error.status_code < 500):
+            self.settle()
+            return
+        self.settled = True
+        db.rate_settle(self.spend_id, 0, 0, 0.0, self.prompt_tokens + self.completion_tokens)
+        if isinstance(error, openai.RateLimitError):
+            db.rate_penalize(time.time() + (_retry_after(error) or DEFAULT_PENALTY_S))
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _admission(model: str, prompt_tokens: int, completion_tokens: int, scope: str) -> Iterator[Any]:
+    """
+    Waits for a turn. Yields seconds to sleep until admitted, then the Grant;
+    shared by the sync and async entry points.
+    """
+    lim = limits()
+    reservation = {
+        "model": model,
+        "scope": scope,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost_usd": estimate_openai_cost(prompt_tokens, completion_tokens, model),
+    }
+    tokens = prompt_tokens + completion_tokens
+    started_at = datetime.utcnow().isoformat()
+    t0 = time.perf_counter()
+    ticket: Optional[int] = None
+    ahead = 0
+    try:
+        last_try = 0.0
+        while True:
+            now = time.time()
+            # Cheap read while others are ahead; a write only to stay alive
+            if ticket is not None and now - last_try < WAITER_BEAT_S and db.rate_queue_head(now - WAITER_TTL_S) not in (ticket, None):
+                yield POLL_S
+                continue
+            last_try = now
+            r = db.rate_try_acquire(
+                ticket, tokens, lim["rpm"], lim["tpm"], now - WAITER_TTL_S,
+                reservation, _budget_windows(lim, datetime.utcnow()),
+            )
+            if "spend_id" in r or "over_budget" in r:
+                # Either way, out of the queue
+                ticket = None
+            if "over_budget" in r:
+                raise BudgetExceededError(
+                    f"The {r['over_budget']} OpenAI budget of ${r['limit']:.2f} would be exceeded "
+                    f"(${r['spent']:.4f} spent, this call ~${reservation['cost_usd']:.4f})."
+                )
+            if "spend_id" in r:
+                break
+            ticket = r["ticket"]
+            ahead = r.get("ahead", ahead)
+            yield POLL_S if r["wait"] is None else min(max(r["wait"], POLL_S), WAITER_BEAT_S)
+    finally:
+        if ticket is not None:
+            db.rate_leave(ticket)
+
+    wait_ms = (time.perf_counter() - t0) * 1000
+    record("llm.rate_wait", started_at, wait_ms, model=model, scope=scope, queued_behind=ahead)
+    yield Grant(r["spend_id"], model, prompt_tokens, completion_tokens)
+
+def acquire(model: str, prompt_tokens: int, completion_tokens: int = DEFAULT_COMPLETION_TOKENS, scope: str = "") -> Grant:
+    steps = _admission(model, prompt_tokens, completion_tokens, scope)
+    try:
+        for step in steps:
+            if isinstance(step, Grant):
+                return step
+            time.sleep(step)
+    finally:
+        # Interrupted while waiting: leave the queue
+        steps.close()
+    raise RuntimeError("Admission ended without a grant")
+
+async def acquire_async(model: str, prompt_tokens: int, completion_tokens: int = DEFAULT_COMPLETION_TOKENS, scope: str = "") -> Grant:
+    steps = _admission(model, prompt_tokens, completion_tokens, scope)
+    try:
+        while True:
+            # Each step is a short SQLite call; keep it off the event loop
+            step = await asyncio.to_thread(next, steps)
+            if isinstance(step, Grant):
+                return step
+            await asyncio.sleep(step)
+    except BaseException:
+        # Cancelled while waiting: leave the queue
+        await asyncio.to_thread(steps.close)
+        raise
+
+@contextmanager
+def reserve(model: str, messages: List[Dict[str, str]], completion_tokens: int = DEFAULT_COMPLETION_TOKENS, scope: str = "") -> Iterator[Grant]:
+    grant = acquire(model, estimate_message_tokens(messages), completion_tokens, scope)
+    try:
+        yield grant
+    except BaseException as e:
+        grant.release(e)
+        raise
+    grant.settle()
+
+@asynccontextmanager
+async def areserve(model: str, messages: List[Dict[str, str]], completion_tokens: int = DEFAULT_COMPLETION_TOKENS, scope: str = "") -> AsyncIterator[Grant]:
+    grant = await acquire_async(model, estimate_message_tokens(messages), completion_tokens, scope)
+    try:
+        yield grant
+    except BaseException as e:
+        await asyncio.to_thread(grant.release, e)
+        raise
+    await asyncio.to_thread(grant.settle)
@@ -0,0 +1,261 @@
+# jobs.py
+"""
+Persistent background queue for Day 0 analyses.
+
+The app enqueues a job and returns at once; worker threads claim queued jobs
+from the jobs table, run the analysis, report progress and save the result.
+Because the queue lives in SQLite, jobs survive app restarts and any number
+of sessions, tabs or worker processes can share it:
+
+    python jobs.py --workers 4        # standalone workers (set JOB_WORKERS=0 for the app)
+
+A job is keyed on (opportunity, input hash), so queueing the same analysis
+while it is pending returns the existing job. With triage, a cheap model
+scores the JD first and the full analysis runs only if it passes. Workers
+heartbeat while a job runs; a running job whose heartbeat goes stale (its
+process died) is queued again, up to MAX_ATTEMPTS.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import db
+from llm import (
+    analysis_cache_key,
+    analysis_update_fields,
+    default_model,
+    run_day0_analysis,
+    run_day0_analysis_sectioned,
+    run_day0_triage,
+    stream_day0_analysis,
+    triage_model,
+    triage_passed,
+    triage_threshold,
+    triage_update_fields,
+)
+from schemas import JD_SECTIONS, JDAnalysis
+from tracing import span
+
+log = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+MAX_ATTEMPTS = 3
+POLL_INTERVAL_S = 1.0
+HEARTBEAT_S = 10.0
+STALE_AFTER_S = 60.0
+
+MODES = ("single", "stream", "sectioned")
+ACTIVE = ("queued", "running")
+
+_FIELD_COUNT = len(JDAnalysis.model_fields)
+
+def input_hash(
+    jd_text: str, company: str, role_title: str, rubric: str, profile: str, model: str, mode: str, triage: str = "",
+) -> str:
+    key = analysis_cache_key(jd_text, company, role_title, rubric, profile, model)
+    return hashlib.sha256(f"{key}:{mode}:{triage}".encode("utf-8")).hexdigest()
+
+def enqueue_day0(
+    opp: Dict[str, Any],
+    jd_text: str,
+    rubric: str,
+    profile: str,
+    mode: str = "single",
+    use_cache: bool = True,
+    model: Optional[str] = None,
+    triage: bool = False,
+) -> Dict[str, Any]:
+    """
+    Queues a Day 0 analysis of opp. Returns the job; if an identical one is
+    already queued or running, that job is returned instead. With triage, the
+    full analysis runs only if the triage tier passes triage_threshold().
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown analysis mode: {mode}")
+    model = model or default_model()
+    tier = {"triage_model": triage_model(), "triage_threshold": triage_threshold()} if triage else {}
+    params = {
+        "company": opp["company"],
+        "role_title": opp["role_title"],
+        "rubric": rubric,
+        "profile": profile,
+        "model": model,
+        "mode": mode,
+        "use_cache": use_cache,
+        **tier,
+    }
+    triage_key = f"{tier['triage_model']}:{tier['triage_threshold']}" if triage else ""
+    h = input_hash(jd_text, opp["company"], opp["role_title"], rubric, profile, model, mode, triage_key)
+    return db.enqueue_job(opp["id"], "day0", h, params)
+
+def run_job(job: Dict[str, Any], progress) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Runs one day0 job; progress(fraction, text, partial=None) reports as it
+    goes, partial being the analysis fields streamed so far. Returns
+    (opportunity fields to save, result summary).
+    """
+    p = job["params"]
+    # The JD is read when the job runs, so edits made while it waited are included
+    jd_text = db.get_jd_text(job["opportunity_id"]) or ""
+    if not jd_text.strip():
+        raise ValueError("The opportunity has no JD text.")
+    kwargs = dict(
+        jd_text=jd_text,
+        company=p["company"],
+        role_title=p["role_title"],
+        user_rubric=p["rubric"],
+        user_profile=p["profile"],
+        use_cache=p["use_cache"],
+    )
+
+    fields: Dict[str, Any] = {}
+    summary: Dict[str, Any] = {"cached": True, "total_tokens": 0}
+    if p.get("triage_model"):
+        progress(0.05, "Triage")
+        triage = run_day0_triage(**kwargs, model=p["triage_model"])
+        fields.update(triage_update_fields(triage, jd_text))
+        summary.update(cached=triage["cached"], total_tokens=triage["total_tokens"], triage_score=triage["score"])
+        if not triage_passed(triage, p["triage_threshold"]):
+            return fields, {**summary, "model": triage["model"], "triage_only": True}
+
+    result = _run_full(p["mode"], dict(kwargs, model=p["model"]), progress)
+    fields.update(analysis_update_fields(result))
+    summary.update(
+        cached=summary["cached"] and result["cached"],
+        model=result["model"],
+        total_tokens=summary["total_tokens"] + result["total_tokens"],
+    )
+    return fields, summary
+
+def _run_full(mode: str, kwargs: Dict[str, Any], progress) -> Dict[str, Any]:
+    if mode == "stream":
+        # Saved on the job as it grows, so the app can draw sections as they arrive
+        partial: Dict[str, Any] = {}
+        fields = set()
+        for kind, key, value in stream_day0_analysis(**kwargs):
+            if kind == "result":
+                return value
+            if kind == "item":
+                partial.setdefault(key, []).append(value)
+            else:
+                partial[key] = value
+                fields.add(key)
+            progress(len(fields) / _FIELD_COUNT, f"{len(fields)}/{_FIELD_COUNT} fields received", partial)
+        raise RuntimeError("Analysis stream ended without a result.")
+
+    if mode == "sectioned":
+        done: List[str] = []
+
+        def on_section(name: str) -> None:
+            done.append(name)
+            progress(len(done) / len(JD_SECTIONS), f"{len(done)}/{len(JD_SECTIONS)} sections done")
+
+        return run_day0_analysis_sectioned(**kwargs, on_section=on_section)
+
+    progress(0.1, "Waiting for the model")
+    return run_day0_analysis(**kwargs)
+
+class WorkerPool:
+    """
+    Worker threads that claim and run jobs, plus one thread that heartbeats
+    their running jobs and requeues jobs abandoned by dead workers.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS):
+        prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.worker_ids = [f"{prefix}:{i}" for i in range(workers)]
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> "WorkerPool":
+        for wid in self.worker_ids:
+            self._threads.append(threading.Thread(target=self._work, args=(wid,), name=f"job-worker-{wid}", daemon=True))
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _work(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                job = db.claim_job(worker_id)
+            except Exception as e:
+                # e.g. database locked past busy_timeout; try again next poll
+                log.warning("%s claim failed: %s", worker_id, e)
+                job = None
+            if job is None:
+                self._stop.wait(POLL_INTERVAL_S)
+                continue
+            try:
+                self.process(job, worker_id)
+            except Exception:
+                # Could not even record the failure; the heartbeat sweep requeues it
+                log.exception("%s job #%s could not be recorded", worker_id, job["id"])
+
+    @staticmethod
+    def process(job: Dict[str, Any], worker_id: str) -> None:
+        def progress(fraction: float, text: str, partial: Optional[Dict[str, Any]] = None) -> None:
+            db.update_job_progress(job["id"], worker_id, fraction, text, partial)
+
+        started = time.monotonic()
+        with span("jobs.run", kind=job["kind"], mode=job["params"]["mode"]) as sp:
+            try:
+                fields, summary = run_job(job, progress)
+                summary["seconds"] = time.monotonic() - started
+                db.finish_job(job["id"], worker_id, fields, summary)
+                sp.set(tokens=summary["total_tokens"])
+            except Exception as e:
+                db.fail_job(job["id"], worker_id, str(e) or type(e).__name__)
+                sp.set(error=type(e).__name__)
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(HEARTBEAT_S):
+            try:
+                db.heartbeat_jobs(self.worker_ids)
+                stale_before = (datetime.utcnow() - timedelta(seconds=STALE_AFTER_S)).isoformat()
+                db.requeue_stale_jobs(stale_before, MAX_ATTEMPTS)
+            except Exception as e:
+                log.warning("heartbeat failed: %s", e)
+
+_pool: Optional[WorkerPool] = None
+_pool_lock = threading.Lock()
+
+def start_workers(workers: int = DEFAULT_WORKERS) -> Optional[WorkerPool]:
+    """Starts the process-wide worker pool once; later calls return it. 0 workers starts none."""
+    global _pool
+    with _pool_lock:
+        if _pool is None and workers > 0:
+            _pool = WorkerPool(workers).start()
+        return _pool
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Run Day 0 analysis jobs from the queue.")
+    p.add_argument("--workers", type=int, default=max(1, DEFAULT_WORKERS))
+    args = p.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    db.init_db()
+    pool = start_workers(args.workers)
+    print(f"{args.workers} workers polling the job queue (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop(timeout=5)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# jsondelta.py
+"""
+Minimal structural delta between two JSON values.
+
+diff(a, b) returns a delta d such that apply(a, d) == b. Objects are
+diffed key by key (recursively); anything else, lists included, is
+replaced whole, which suits JDAnalysis where edits touch a few fields.
+
+    {"role_summary": {"=": "new text"},      # set
+     "storyline": {"~": {...nested delta}},  # descend
+     "old_key": {"-": 1}}                    # delete
+"""
+import copy
+from typing import Any, Dict
+
+def diff(a: Any, b: Any) -> Dict[str, Any]:
+    if not isinstance(a, dict) or not isinstance(b, dict):
+        raise TypeError("diff() works on JSON objects")
+    out: Dict[str, Any] = {}
+    for k, v in b.items():
+        if k not in a:
+            out[k] = {"=": v}
+        elif a[k] != v:
+            if isinstance(a[k], dict) and isinstance(v, dict):
+                out[k] = {"~": diff(a[k], v)}
+            else:
+                out[k] = {"=": v}
+    for k in a:
+        if k not in b:
+            out[k] = {"-": 1}
+    return out
+
+def apply(a: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    out = copy.deepcopy(a)
+    for k, op in delta.items():
+        if "=" in op:
+            out[k] = copy.deepcopy(op["="])
+        elif "-" in op:
+            out.pop(k, None)
+        else:
+            out[k] = apply(out.get(k) or {}, op["~"])
+    return out
@@ -0,0 +1,91 @@
+# jsonstream.py
+"""
+Incremental parser for a streamed JSON object.
+
+Feed it text chunks as they arrive; it reports each top-level member as soon
+as its value is complete, plus each element of selected top-level arrays
+(e.g. scorecard items) as soon as that element is complete.
+"""
+import json
+import re
+from typing import Any, Iterable, List, Optional, Tuple
+
+_KEY_RE = re.compile(r'^\s*"((?:[^"\\]|\\.)*)"\s*:\s*$', re.S)
+
+Event = Tuple[str, str, Any]  # ("field" | "item", key, value)
+
+class TopLevelJSONStream:
+    def __init__(self, array_keys: Iterable[str] = ()):
+        self.text = ""
+        self._array_keys = set(array_keys)
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._member_start: Optional[int] = None
+        self._array_key: Optional[str] = None
+        self._elem_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Event]:
+        self.text += chunk
+        text = self.text
+        events: List[Event] = []
+
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+
+            if ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 1 and ch == "{":
+                    self._member_start = i + 1
+                elif self._depth == 2 and ch == "[" and self._member_start is not None:
+                    m = _KEY_RE.match(text[self._member_start:i])
+                    if m and json.loads(f'"{m.group(1)}"') in self._array_keys:
+                        self._array_key = json.loads(f'"{m.group(1)}"')
+                        self._elem_start = i + 1
+            elif ch in "}]":
+                if self._depth == 2 and ch == "]" and self._elem_start is not None:
+                    self._emit_item(text[self._elem_start:i], events)
+                    self._elem_start = None
+                self._depth -= 1
+                if self._depth == 0 and self._member_start is not None:
+                    self._emit_member(text[self._member_start:i], events)
+                    self._member_start = None
+            elif ch == ",":
+                if self._depth == 1:
+                    self._emit_member(text[self._member_start:i], events)
+                    self._member_start = i + 1
+                elif self._depth == 2 and self._elem_start is not None:
+                    self._emit_item(text[self._elem_start:i], events)
+                    self._elem_start = i + 1
+
+        self._pos = len(text)
+        return events
+
+    def _emit_member(self, fragment: str, events: List[Event]) -> None:
+        if not fragment.strip():
+            return
+        try:
+            member = json.loads("{" + fragment + "}")
+        except json.JSONDecodeError:
+            return  # the final full parse will report it
+        for k, v in member.items():
+            events.append(("field", k, v))
+
+    def _emit_item(self, fragment: str, events: List[Event]) -> None:
+        if not fragment.strip():
+            return
+        try:
+            events.append(("item", self._array_key, json.loads(fragment)))
+        except json.JSONDecodeError:
+            return
@@ -1,15 +1,27 @@
 # llm.py
 import os
+import re
+import asyncio
 import json
-from typing import Optional, Dict, Any
+import time
+import hashlib
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Callable, get_args
 
 import streamlit as st
-from openai import OpenAI
-from pydantic import ValidationError
+from openai import OpenAI, AsyncOpenAI
+from pydantic import TypeAdapter, ValidationError
 
-from schemas import JDAnalysis
+from schemas import JDAnalysis, JDTriage, JD_SECTIONS, SECTION_MODELS
+from jsonstream import TopLevelJSONStream
+from repair import SchemaRepairError, merge_reports, strict_response_format, validate_with_repair
+import compact
+import db
+import governor
+from tracing import record, span, traced
+from utils import MODEL_TIERS, estimate_openai_cost, jd_changes, jd_hash
 
-def get_client() -> OpenAI:
+def _api_key() -> str:
     # Prefer Streamlit secrets in deployment, fallback to env var locally
     api_key = None
     try:
@@ -22,7 +34,24 @@ def get_client() -> OpenAI:
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY is not set in Streamlit Secrets or environment variables.")
 
-    return OpenAI(api_key=api_key)
+    return api_key
+
+def _use_fake() -> bool:
+    return os.getenv("OPENAI_FAKE", "").lower() in ("1", "true", "yes")
+
+@traced("llm.get_client")
+def get_client() -> OpenAI:
+    if _use_fake():
+        # Offline stand-in for benchmarks / local runs (see fake_openai.py)
+        from fake_openai import FakeOpenAI
+        return FakeOpenAI()
+    return OpenAI(api_key=_api_key())
+
+def get_async_client(max_retries: int = 2) -> AsyncOpenAI:
+    if _use_fake():
+        from fake_openai import FakeAsyncOpenAI
+        return FakeAsyncOpenAI()
+    return AsyncOpenAI(api_key=_api_key(), max_retries=max_retries)
 
 def default_model() -> str:
     try:
@@ -30,6 +59,75 @@ def default_model() -> str:
     except Exception:
         return os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
 
+def _setting(name: str) -> Optional[str]:
+    try:
+        value = st.secrets.get(name, None)
+    except Exception:
+        value = None
+    return value if value is not None else os.getenv(name)
+
+def triage_model() -> str:
+    return _setting("OPENAI_TRIAGE_MODEL") or MODEL_TIERS["triage"]
+
+def triage_threshold() -> float:
+    """Mean provisional score (1-5) a triaged JD needs before the full analysis runs."""
+    return float(_setting("OPENAI_TRIAGE_THRESHOLD") or DEFAULT_TRIAGE_THRESHOLD)
+
+def triage_enabled() -> bool:
+    return str(_setting("OPENAI_TRIAGE") or "1").lower() in ("1", "true", "yes")
+
+def strict_outputs() -> bool:
+    # Structured outputs (strict json_schema) need a model that supports them
+    try:
+        flag = st.secrets.get("OPENAI_STRICT_SCHEMA", None)
+    except Exception:
+        flag = None
+    flag = flag if flag is not None else os.getenv("OPENAI_STRICT_SCHEMA", "")
+    return str(flag).lower() in ("1", "true", "yes")
+
+def _response_format(model_cls) -> Dict[str, Any]:
+    if strict_outputs():
+        return strict_response_format(model_cls)
+    return {"type": "json_object"}
+
+# Bump whenever DAY0_SYSTEM, the user prompt layout or JDAnalysis changes so
+# cached analyses produced by the old prompt are no longer served.
+PROMPT_VERSION = "day0-v2"
+
+CACHE_MAX_ENTRIES = 500
+CACHE_MAX_AGE_DAYS = 30
+
+# Completion sizes reserved against the rate limiter for the smaller calls
+SECTION_COMPLETION_TOKENS = 800
+PATCH_COMPLETION_TOKENS = 1_000
+TRIAGE_COMPLETION_TOKENS = 600
+
+TRIAGE_PROMPT_VERSION = "triage-v1"
+DEFAULT_TRIAGE_THRESHOLD = 3.0
+
+def _normalize(s: str) -> str:
+    return re.sub(r"\s+", " ", (s or "")).strip()
+
+def analysis_cache_key(
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: str,
+) -> str:
+    parts = [
+        PROMPT_VERSION,
+        compact.config_key(),
+        model,
+        _normalize(company).lower(),
+        _normalize(role_title).lower(),
+        _normalize(user_rubric),
+        _normalize(user_profile),
+        _normalize(jd_text),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
 DAY0_SYSTEM = (
     "You are an assistant that analyzes job descriptions for fit, risks, and interview prep.\n"
     "You must return valid JSON that matches the provided schema. No markdown. No extra keys.\n"
@@ -37,60 +135,757 @@ DAY0_SYSTEM = (
     "If information is missing, put it in unknowns / what_to_verify rather than guessing.\n"
 )
 
+# Serialized once: the schema text must be byte-identical on every call for
+# the provider's prompt-prefix cache to match.
+DAY0_SCHEMA_JSON = json.dumps(JDAnalysis.model_json_schema(), sort_keys=True, separators=(",", ":"))
+
+DAY0_SYSTEM_WITH_SCHEMA = f"""{DAY0_SYSTEM}
+Return JSON ONLY matching this JSON Schema:
+{DAY0_SCHEMA_JSON}
+"""
+
+# Diff-aware re-analysis asks for a partial object, so it can't share the
+# full-run prompt's "return a complete analysis" instruction
+PATCH_SYSTEM = f"""{DAY0_SYSTEM}
+This is a revision of an existing analysis after the job description was edited. Return a JSON
+object containing ONLY the top-level analysis fields that must change because of the edits, each
+with its complete new value. Leave out every field that stays the same; return {{}} if nothing
+changes. Each value must match that field's definition in this JSON Schema of the full analysis:
+{DAY0_SCHEMA_JSON}
+"""
+
+# One fixed system prompt per section, for the same prefix-cache reason
+SECTION_SYSTEMS = {
+    name: (
+        f"{DAY0_SYSTEM}"
+        f"Produce ONLY the {name} part of the analysis: {', '.join(fields)}.\n"
+        f"\nReturn JSON ONLY matching this JSON Schema:\n"
+        f"{json.dumps(SECTION_MODELS[name].model_json_schema(), sort_keys=True, separators=(',', ':'))}\n"
+    )
+    for name, fields in JD_SECTIONS.items()
+}
+
+TRIAGE_SYSTEM = f"""{DAY0_SYSTEM}
+This is a quick triage pass: summarize the role, list its key requirements and give each
+rubric quality a provisional 1-5 score with a one-sentence rationale. Keep it brief.
+
+Return JSON ONLY matching this JSON Schema:
+{json.dumps(JDTriage.model_json_schema(), sort_keys=True, separators=(",", ":"))}
+"""
+
+def build_day0_messages(
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    system: str = DAY0_SYSTEM_WITH_SCHEMA,
+) -> List[Dict[str, str]]:
+    """
+    Layout is most-stable first so consecutive calls share a cacheable prefix:
+    system + schema (fixed), then rubric + profile (fixed per user), then the
+    per-JD suffix.
+    """
+    user_context = f"""USER RUBRIC (core qualities to score 1-5):
+{user_rubric}
+
+USER PROFILE (resume summary, strengths, story bank):
+{user_profile}
+"""
+
+    jd_prompt = f"""Company: {company}
+Role Title: {role_title}
+
+JOB DESCRIPTION:
+{jd_text}
+"""
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user_context},
+        {"role": "user", "content": jd_prompt},
+    ]
+
+def _cached_result(cache_key: str, model: str, use_cache: bool, jd_text: str) -> Optional[Dict[str, Any]]:
+    if not use_cache:
+        db.cache_record_bypass()
+        return None
+    hit = db.cache_get(cache_key)
+    if not hit:
+        return None
+    # Served locally: nothing is billed for this run
+    return {
+        "analysis": json.loads(hit["analysis_json"]),
+        "model": model,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "cached": True,
+        "source_jd_text": jd_text,
+    }
+
+def _compact_jd(jd_text: str, company: str, role_title: str) -> Tuple[str, Dict[str, Any]]:
+    """The JD text to prompt with, and the token counts to record for the run."""
+    c = compact.compact_jd(jd_text, company, role_title)
+    return c["text"], {"jd_tokens_raw": c["tokens_before"], "jd_tokens_compact": c["tokens_after"]}
+
+def _validate(
+    data: Dict[str, Any],
+    model_cls,
+    model: str,
+    scope: str,
+    completion_seconds: Optional[float],
+    original_tokens: int,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """validate_with_repair, logging every repair attempt to analysis_repairs."""
+    try:
+        data, report = validate_with_repair(data, model_cls, model, get_client, completion_seconds, original_tokens)
+    except SchemaRepairError as e:
+        db.record_repair(model, scope, e.report, ok=False)
+        raise
+    if report:
+        db.record_repair(model, scope, report, ok=True)
+    return data, report
+
+def _finish_day0_response(resp, model: str, cache_key: str, jd_text: str, completion_seconds: Optional[float] = None) -> Dict[str, Any]:
+    return _finish_day0_content(resp.choices[0].message.content, resp.usage, model, cache_key, jd_text, completion_seconds)
+
+def _finish_day0_content(
+    content: str,
+    usage,
+    model: str,
+    cache_key: str,
+    jd_text: str,
+    completion_seconds: Optional[float] = None,
+) -> Dict[str, Any]:
+    with span("llm.parse", chars=len(content)):
+        data = json.loads(content)
+
+    prompt_tokens = getattr(usage, "prompt_tokens", 0)
+    completion_tokens = getattr(usage, "completion_tokens", 0)
+    total_tokens = getattr(usage, "total_tokens", 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_prompt_tokens = getattr(details, "cached_tokens", 0) or 0
+
+    # Validate to ensure it matches schema, repairing rather than re-running
+    with span("llm.validate"):
+        data, repair = _validate(data, JDAnalysis, model, "full", completion_seconds, total_tokens)
+    if repair:
+        prompt_tokens += repair["extra_prompt_tokens"]
+        completion_tokens += repair["extra_completion_tokens"]
+        total_tokens += repair["extra_prompt_tokens"] + repair["extra_completion_tokens"]
+
+    db.cache_put(cache_key, json.dumps(data), model, prompt_tokens, completion_tokens, total_tokens)
+    db.cache_evict(CACHE_MAX_ENTRIES, CACHE_MAX_AGE_DAYS)
+
+    return {
+        "analysis": data,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens,
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "cached": False,
+        "repair": repair,
+        "source_jd_text": jd_text,
+    }
+
+def analysis_update_fields(result: Dict[str, Any], prior: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Columns to persist on the opportunity for a finished Day 0 run.
+    Pass the stored opportunity as `prior` when the run revised its existing
+    analysis (a patch or regenerated sections): the stage is kept, the run's
+    usage is added to the recorded totals and sections that weren't
+    regenerated keep their recorded usage.
+    """
+    fields = {
+        "analysis_json": json.dumps(result["analysis"]),
+        "analysis_model": result["model"],
+        "prompt_tokens": result["prompt_tokens"],
+        "completion_tokens": result["completion_tokens"],
+        "total_tokens": result["total_tokens"],
+        "cached_prompt_tokens": result["cached_prompt_tokens"],
+        "estimated_cost_usd": estimate_openai_cost(
+            result["prompt_tokens"],
+            result["completion_tokens"],
+            result["model"],
+            cached_tokens=result["cached_prompt_tokens"],
+        ),
+    }
+    if prior is None:
+        fields["stage"] = "ANALYZED"
+    else:
+        for k in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_prompt_tokens", "estimated_cost_usd"):
+            fields[k] += prior.get(k) or 0
+    if "source_jd_text" in result:
+        fields["analysis_jd_text"] = result["source_jd_text"]
+    if "jd_tokens_raw" in result:
+        fields["jd_tokens_raw"] = result["jd_tokens_raw"]
+        fields["jd_tokens_compact"] = result["jd_tokens_compact"]
+    if result.get("section_usage"):
+        usage = json.loads((prior or {}).get("section_usage_json") or "{}")
+        usage.update(result["section_usage"])
+        fields["section_usage_json"] = json.dumps(usage)
+    elif not result.get("cached"):
+        # A monolithic run replaces every section
+        fields["section_usage_json"] = None
+    return fields
+
+@traced("llm.run_day0_analysis")
 def run_day0_analysis(
     jd_text: str,
     company: str,
     role_title: str,
     user_rubric: str,
     user_profile: str,
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    use_cache: bool = True,
 ) -> Dict[str, Any]:
+    model = model or default_model()
+
+    cache_key = analysis_cache_key(jd_text, company, role_title, user_rubric, user_profile, model)
+    cached = _cached_result(cache_key, model, use_cache, jd_text)
+    if cached:
+        return cached
+
     client = get_client()
+    prompt_jd, jd_tokens = _compact_jd(jd_text, company, role_title)
+    messages = build_day0_messages(prompt_jd, company, role_title, user_rubric, user_profile)
+
+    with governor.reserve(model, messages, scope="day0") as grant:
+        t0 = time.perf_counter()
+        with span("llm.completion", model=model) as sp:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                response_format=_response_format(JDAnalysis),
+            )
+            sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+        grant.settle(resp.usage)
+
+    return {**_finish_day0_response(resp, model, cache_key, jd_text, time.perf_counter() - t0), **jd_tokens}
+
+@traced("llm.run_day0_analysis_async")
+async def run_day0_analysis_async(
+    client: AsyncOpenAI,
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Async twin of run_day0_analysis for batch use. The caller owns the client
+    (and its retry policy) so many calls can share one connection pool.
+    """
     model = model or default_model()
 
-    schema_hint = JDAnalysis.model_json_schema()
+    # The cache key and lookup read SQLite: keep them off the event loop
+    def lookup():
+        key = analysis_cache_key(jd_text, company, role_title, user_rubric, user_profile, model)
+        return key, _cached_result(key, model, use_cache, jd_text)
 
-    user_prompt = f"""
-Company: {company}
-Role Title: {role_title}
+    cache_key, cached = await asyncio.to_thread(lookup)
+    if cached:
+        return cached
 
-USER RUBRIC (core qualities to score 1-5):
-{user_rubric}
+    prompt_jd, jd_tokens = await asyncio.to_thread(_compact_jd, jd_text, company, role_title)
+    messages = build_day0_messages(prompt_jd, company, role_title, user_rubric, user_profile)
+    async with governor.areserve(model, messages, scope="day0") as grant:
+        t0 = time.perf_counter()
+        with span("llm.completion", model=model) as sp:
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                response_format=_response_format(JDAnalysis),
+            )
+            sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+        await asyncio.to_thread(grant.settle, resp.usage)
 
-USER PROFILE (resume summary, strengths, story bank):
-{user_profile}
+    # A repair may make a (blocking) follow-up call; keep it off the event loop
+    result = await asyncio.to_thread(_finish_day0_response, resp, model, cache_key, jd_text, time.perf_counter() - t0)
+    return {**result, **jd_tokens}
 
-JOB DESCRIPTION (raw):
-{jd_text}
 
-Return JSON ONLY matching this JSON Schema:
-{json.dumps(schema_hint)}
-"""
+def triage_cache_key(*args: str) -> str:
+    """Cache key of a triage run; takes the same arguments as analysis_cache_key."""
+    return hashlib.sha256(f"{TRIAGE_PROMPT_VERSION}:{analysis_cache_key(*args)}".encode("utf-8")).hexdigest()
+
+def triage_score(triage: Dict[str, Any]) -> Optional[float]:
+    scores = [s["score"] for s in triage.get("provisional_scores") or []]
+    return sum(scores) / len(scores) if scores else None
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": DAY0_SYSTEM},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.2,
-        response_format={"type": "json_object"},
+def triage_is_current(opp: Dict[str, Any], model: Optional[str] = None) -> bool:
+    """Whether opp's stored triage scored its current JD text with the triage model in use."""
+    return (
+        opp.get("triage_jd_hash") is not None
+        and opp["triage_jd_hash"] == opp.get("jd_hash")
+        and opp.get("triage_model") == (model or triage_model())
     )
 
-    content = resp.choices[0].message.content
-    data = json.loads(content)
+def triage_passed(result: Dict[str, Any], threshold: Optional[float] = None) -> bool:
+    """Whether the full analysis is warranted. A triage without scores passes."""
+    score = result["score"]
+    return score is None or score >= (triage_threshold() if threshold is None else threshold)
+
+def _finish_triage_response(resp, model: str, cache_key: str, completion_seconds: float) -> Dict[str, Any]:
+    with span("llm.parse"):
+        data = json.loads(resp.choices[0].message.content)
+    usage = resp.usage
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0)
+    completion_tokens = getattr(usage, "completion_tokens", 0)
+    with span("llm.validate"):
+        data, repair = _validate(data, JDTriage, model, "triage", completion_seconds, prompt_tokens + completion_tokens)
+    if repair:
+        prompt_tokens += repair["extra_prompt_tokens"]
+        completion_tokens += repair["extra_completion_tokens"]
+
+    db.cache_put(cache_key, json.dumps(data), model, prompt_tokens, completion_tokens, prompt_tokens + completion_tokens)
+    db.cache_evict(CACHE_MAX_ENTRIES, CACHE_MAX_AGE_DAYS)
+    return {
+        "triage": data,
+        "score": triage_score(data),
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "cached": False,
+        "repair": repair,
+    }
+
+def _cached_triage(cache_key: str, model: str, use_cache: bool) -> Optional[Dict[str, Any]]:
+    cached = _cached_result(cache_key, model, use_cache, "")
+    if not cached:
+        return None
+    triage = cached.pop("analysis")
+    cached.pop("source_jd_text")
+    return {**cached, "triage": triage, "score": triage_score(triage)}
+
+@traced("llm.run_day0_triage")
+def run_day0_triage(
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Cheap first tier: role summary, requirements and a provisional score per
+    rubric quality, from triage_model(). Use triage_passed() to decide
+    whether the full analysis is worth running.
+    """
+    model = model or triage_model()
+    cache_key = triage_cache_key(jd_text, company, role_title, user_rubric, user_profile, model)
+    cached = _cached_triage(cache_key, model, use_cache)
+    if cached:
+        return cached
+
+    client = get_client()
+    prompt_jd, _ = _compact_jd(jd_text, company, role_title)
+    messages = build_day0_messages(prompt_jd, company, role_title, user_rubric, user_profile, system=TRIAGE_SYSTEM)
+    with governor.reserve(model, messages, TRIAGE_COMPLETION_TOKENS, scope="triage") as grant:
+        t0 = time.perf_counter()
+        with span("llm.completion", model=model, mode="triage") as sp:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                response_format=_response_format(JDTriage),
+            )
+            sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+        grant.settle(resp.usage)
+
+    return _finish_triage_response(resp, model, cache_key, time.perf_counter() - t0)
+
+@traced("llm.run_day0_triage_async")
+async def run_day0_triage_async(
+    client: AsyncOpenAI,
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """Async twin of run_day0_triage for batch use."""
+    model = model or triage_model()
+
+    def lookup():
+        key = triage_cache_key(jd_text, company, role_title, user_rubric, user_profile, model)
+        return key, _cached_triage(key, model, use_cache)
 
-    # Validate to ensure it matches schema
+    cache_key, cached = await asyncio.to_thread(lookup)
+    if cached:
+        return cached
+
+    prompt_jd, _ = await asyncio.to_thread(_compact_jd, jd_text, company, role_title)
+    messages = build_day0_messages(prompt_jd, company, role_title, user_rubric, user_profile, system=TRIAGE_SYSTEM)
+    async with governor.areserve(model, messages, TRIAGE_COMPLETION_TOKENS, scope="triage") as grant:
+        t0 = time.perf_counter()
+        with span("llm.completion", model=model, mode="triage") as sp:
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                response_format=_response_format(JDTriage),
+            )
+            sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+        await asyncio.to_thread(grant.settle, resp.usage)
+
+    return await asyncio.to_thread(_finish_triage_response, resp, model, cache_key, time.perf_counter() - t0)
+
+def triage_update_fields(result: Dict[str, Any], jd_text: str) -> Dict[str, Any]:
+    """Columns to persist on the opportunity for a finished triage run of jd_text."""
+    return {
+        "triage_json": json.dumps(result["triage"]),
+        "triage_jd_hash": jd_hash(jd_text),
+        "triage_model": result["model"],
+        "triage_score": result["score"],
+        "triage_prompt_tokens": result["prompt_tokens"],
+        "triage_completion_tokens": result["completion_tokens"],
+        "triage_cached_prompt_tokens": result["cached_prompt_tokens"],
+        "triage_cost_usd": estimate_openai_cost(
+            result["prompt_tokens"],
+            result["completion_tokens"],
+            result["model"],
+            cached_tokens=result["cached_prompt_tokens"],
+        ),
+        "triage_at": datetime.utcnow().isoformat(),
+    }
+
+# Per-field validators for streamed output, built once from the JDAnalysis model
+_FIELD_ADAPTERS = {name: TypeAdapter(f.annotation) for name, f in JDAnalysis.model_fields.items()}
+_ITEM_ADAPTERS = {
+    name: TypeAdapter(get_args(f.annotation)[0])
+    for name, f in JDAnalysis.model_fields.items()
+    if get_args(f.annotation)
+}
+STREAMED_ARRAY_KEYS = ("scorecard",)
+
+def _valid_fragment(adapters: Dict[str, TypeAdapter], key: str, value: Any) -> bool:
+    adapter = adapters.get(key)
+    if adapter is None:
+        return False
     try:
-        JDAnalysis.model_validate(data)
-    except ValidationError as e:
-        raise RuntimeError(f"Model returned invalid schema: {e}")
+        adapter.validate_python(value)
+    except ValidationError:
+        return False
+    return True
+
+def stream_day0_analysis(
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+) -> Iterator[Tuple[str, Optional[str], Any]]:
+    """
+    Streaming variant of run_day0_analysis. Yields:
+      ("field", name, value)  a complete, validated top-level JDAnalysis field
+      ("item", name, value)   a complete, validated element of a streamed array (scorecard)
+      ("result", None, dict)  the same dict run_day0_analysis returns, after full validation
+    """
+    model = model or default_model()
+
+    cache_key = analysis_cache_key(jd_text, company, role_title, user_rubric, user_profile, model)
+    cached = _cached_result(cache_key, model, use_cache, jd_text)
+    if cached:
+        for k, v in cached["analysis"].items():
+            yield ("field", k, v)
+        yield ("result", None, cached)
+        return
+
+    client = get_client()
+    prompt_jd, jd_tokens = _compact_jd(jd_text, company, role_title)
+    messages = build_day0_messages(prompt_jd, company, role_title, user_rubric, user_profile)
+
+    # Held until the stream ends; an abandoned stream keeps its estimated cost
+    with governor.reserve(model, messages, scope="day0") as grant:
+        # The stream spans generator yields, so it is timed by hand rather than
+        # holding a span open while the caller renders.
+        started_at = datetime.utcnow().isoformat()
+        t0 = time.perf_counter()
+        first_token_ms = None
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.2,
+            response_format=_response_format(JDAnalysis),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        parser = TopLevelJSONStream(STREAMED_ARRAY_KEYS)
+        usage = None
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - t0) * 1000
+            for kind, key, value in parser.feed(delta):
+                adapters = _FIELD_ADAPTERS if kind == "field" else _ITEM_ADAPTERS
+                if _valid_fragment(adapters, key, value):
+                    yield (kind, key, value)
+        grant.settle(usage)
+
+    completion_seconds = time.perf_counter() - t0
+    record(
+        "llm.completion", started_at, completion_seconds * 1000,
+        tokens=getattr(usage, "total_tokens", None), model=model, stream=True, first_token_ms=first_token_ms,
+    )
+
+    # The whole object is still validated before anyone persists it
+    yield ("result", None, {**_finish_day0_content(parser.text, usage, model, cache_key, jd_text, completion_seconds), **jd_tokens})
+
+
+async def _run_section(
+    client: AsyncOpenAI,
+    section: str,
+    messages: List[Dict[str, str]],
+    model: str,
+) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    async with governor.areserve(model, messages, SECTION_COMPLETION_TOKENS, scope=f"section:{section}") as grant:
+        t0 = time.perf_counter()
+        with span("llm.section_completion", section=section, model=model) as sp:
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                response_format=_response_format(SECTION_MODELS[section]),
+            )
+            sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+        await asyncio.to_thread(grant.settle, resp.usage)
+    completion_seconds = time.perf_counter() - t0
 
     usage = resp.usage
-    return {
-        "analysis": data,
+    details = getattr(usage, "prompt_tokens_details", None)
+    section_usage = {
         "model": model,
         "prompt_tokens": getattr(usage, "prompt_tokens", 0),
         "completion_tokens": getattr(usage, "completion_tokens", 0),
         "total_tokens": getattr(usage, "total_tokens", 0),
+        "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "generated_at": datetime.utcnow().isoformat(),
+    }
+
+    data = json.loads(resp.choices[0].message.content)
+    try:
+        data, repair = await asyncio.to_thread(
+            _validate, data, SECTION_MODELS[section], model, section, completion_seconds, section_usage["total_tokens"],
+        )
+    except SchemaRepairError as e:
+        raise RuntimeError(f"Model returned invalid schema for section {section}: {e}")
+    parsed = SECTION_MODELS[section].model_validate(data)
+    if repair:
+        section_usage["prompt_tokens"] += repair["extra_prompt_tokens"]
+        section_usage["completion_tokens"] += repair["extra_completion_tokens"]
+        section_usage["total_tokens"] += repair["extra_prompt_tokens"] + repair["extra_completion_tokens"]
+        section_usage["repair"] = repair
+    # Only this section's fields; extra keys from the model are dropped
+    return section, parsed.model_dump(include=set(JD_SECTIONS[section])), section_usage
+
+@traced("llm.run_day0_analysis_sectioned")
+def run_day0_analysis_sectioned(
+    jd_text: str,
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: Optional[str] = None,
+    sections: Optional[List[str]] = None,
+    prior_analysis: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    on_section: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Generates the JD_SECTIONS concurrently and merges them into one validated
+    JDAnalysis. With `sections` (plus the stored `prior_analysis`) only those
+    sections are regenerated, and only their tokens are billed.
+    on_section(name) is called as each section's completion arrives.
+    """
+    model = model or default_model()
+    sections = list(sections or JD_SECTIONS)
+    unknown = set(sections) - set(JD_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown sections: {sorted(unknown)}")
+    full_run = set(sections) == set(JD_SECTIONS)
+    if not full_run and not prior_analysis:
+        raise ValueError("Regenerating a subset of sections needs the prior analysis.")
+
+    cache_key = analysis_cache_key(jd_text, company, role_title, user_rubric, user_profile, model)
+    if full_run:
+        cached = _cached_result(cache_key, model, use_cache, jd_text)
+        if cached:
+            return cached
+
+    prompt_jd, jd_tokens = _compact_jd(jd_text, company, role_title)
+
+    async def one(client, name):
+        out = await _run_section(
+            client, name,
+            build_day0_messages(prompt_jd, company, role_title, user_rubric, user_profile, system=SECTION_SYSTEMS[name]),
+            model,
+        )
+        if on_section:
+            on_section(name)
+        return out
+
+    async def generate():
+        client = get_async_client()
+        try:
+            return await asyncio.gather(*[one(client, name) for name in sections])
+        finally:
+            await client.close()
+
+    merged = dict(prior_analysis or {})
+    section_usage = {}
+    for name, data, usage in asyncio.run(generate()):
+        merged.update(data)
+        section_usage[name] = usage
+
+    with span("llm.validate"):
+        try:
+            merged = JDAnalysis.model_validate(merged).model_dump()
+        except ValidationError as e:
+            raise RuntimeError(f"Merged sections do not form a valid analysis: {e}")
+
+    totals = {
+        k: sum(u[k] for u in section_usage.values())
+        for k in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_prompt_tokens")
+    }
+    if full_run:
+        # A partial run's tokens don't describe the merged analysis, and the
+        # kept sections may come from another prompt; only cache full runs
+        db.cache_put(cache_key, json.dumps(merged), model, totals["prompt_tokens"], totals["completion_tokens"], totals["total_tokens"])
+        db.cache_evict(CACHE_MAX_ENTRIES, CACHE_MAX_AGE_DAYS)
+
+    return {
+        "analysis": merged,
+        "model": model,
+        **totals,
+        "section_usage": section_usage,
+        "cached": False,
+        "repair": merge_reports([u["repair"] for u in section_usage.values() if u.get("repair")]),
+        "source_jd_text": jd_text,
+        **jd_tokens,
+    }
+
+
+def _format_jd_changes(changes: List[Dict[str, List[str]]]) -> str:
+    out = []
+    for i, c in enumerate(changes, 1):
+        out.append(f"Change {i}:")
+        out += [f"- REMOVED: {p}" for p in c["removed"]]
+        out += [f"+ ADDED: {p}" for p in c["added"]]
+    return "\n".join(out)
+
+@traced("llm.run_day0_reanalysis")
+def run_day0_reanalysis(
+    old_jd_text: str,
+    new_jd_text: str,
+    prior_analysis: Dict[str, Any],
+    company: str,
+    role_title: str,
+    user_rubric: str,
+    user_profile: str,
+    model: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Diff-aware re-analysis after a JD edit. Sends only the changed passages
+    and the prior analysis, asks for the top-level fields that need to change,
+    and validates the merged result. Returns with skipped=True (nothing
+    billed) when the edit is immaterial.
+    """
+    model = model or default_model()
+    changes = jd_changes(old_jd_text or "", new_jd_text or "")
+    if not changes:
+        return {
+            "analysis": prior_analysis,
+            "model": model,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "cached": False,
+            "skipped": True,
+            "patched_fields": [],
+            "source_jd_text": new_jd_text,
+        }
+
+    patch_prompt = f"""Company: {company}
+Role Title: {role_title}
+
+The job description was edited after the analysis below was produced.
+
+PRIOR ANALYSIS (JSON):
+{json.dumps(prior_analysis)}
+
+JD CHANGES:
+{_format_jd_changes(changes)}
+"""
+    # Fixed system prompt + rubric/profile prefix, so it stays cacheable across patches
+    messages = build_day0_messages("", company, role_title, user_rubric, user_profile, system=PATCH_SYSTEM)[:2]
+    messages.append({"role": "user", "content": patch_prompt})
+
+    client = get_client()
+    with governor.reserve(model, messages, PATCH_COMPLETION_TOKENS, scope="patch") as grant:
+        t0 = time.perf_counter()
+        with span("llm.completion", model=model, mode="patch") as sp:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0.2,
+                response_format={"type": "json_object"},
+            )
+            sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+        grant.settle(resp.usage)
+
+    with span("llm.parse"):
+        patch = json.loads(resp.choices[0].message.content)
+    patch = {k: v for k, v in patch.items() if k in JDAnalysis.model_fields}
+    completion_seconds = time.perf_counter() - t0
+    usage = resp.usage
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0)
+    completion_tokens = getattr(usage, "completion_tokens", 0)
+
+    merged = {**prior_analysis, **patch}
+    with span("llm.validate"):
+        try:
+            merged, repair = _validate(merged, JDAnalysis, model, "patch", completion_seconds, getattr(usage, "total_tokens", 0))
+        except SchemaRepairError as e:
+            raise RuntimeError(f"Patched analysis is invalid: {e}")
+        merged = JDAnalysis.model_validate(merged).model_dump()
+    if repair:
+        prompt_tokens += repair["extra_prompt_tokens"]
+        completion_tokens += repair["extra_completion_tokens"]
+
+    return {
+        "analysis": merged,
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "cached": False,
+        "repair": repair,
+        "skipped": False,
+        "patched_fields": sorted(patch),
+        "source_jd_text": new_jd_text,
     }
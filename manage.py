@@ -0,0 +1,158 @@
+# manage.py
+"""
+Maintenance commands for the tracker database.
+
+    python manage.py reindex-analyses
+    python manage.py reindex-signatures
+    python manage.py reindex-units
+    python manage.py learn-boilerplate --min-companies 5
+    python manage.py boilerplate add "phrase to strip" | remove ... | list
+    python manage.py pack-text
+    python manage.py sweep
+    python manage.py import jobs.jsonl            # or .csv; - reads JSONL from stdin
+    python manage.py export out.zip               # or .jsonl; - writes JSONL to stdout
+"""
+import argparse
+import io
+import sys
+import time
+from typing import List, Optional
+
+import compact
+import db
+import transfer
+
+def cmd_reindex_analyses(args) -> int:
+    t = time.perf_counter()
+    n = db.reindex_analyses(batch_size=args.batch_size)
+    print(f"Indexed {n} analyses in {time.perf_counter() - t:.2f}s")
+    return 0
+
+def cmd_reindex_signatures(args) -> int:
+    t = time.perf_counter()
+    n = db.reindex_signatures(batch_size=args.batch_size)
+    print(f"Signed {n} JDs in {time.perf_counter() - t:.2f}s")
+    return 0
+
+def cmd_reindex_units(args) -> int:
+    t = time.perf_counter()
+    n = db.reindex_units(batch_size=args.batch_size)
+    print(f"Indexed sentences of {n} JDs in {time.perf_counter() - t:.2f}s")
+    return 0
+
+def cmd_learn_boilerplate(args) -> int:
+    t = time.perf_counter()
+    phrases = compact.learn_boilerplate(args.min_companies, dry_run=args.dry_run)
+    for phrase, companies in phrases:
+        print(f"{companies:>5}  {phrase}")
+    verb = "Found" if args.dry_run else "Learned"
+    print(f"{verb} {len(phrases)} boilerplate phrases in {time.perf_counter() - t:.2f}s")
+    return 0
+
+def cmd_boilerplate(args) -> int:
+    phrases = [compact.normalize_phrase(p) for p in args.phrases]
+    if args.action == "add":
+        n = db.add_boilerplate_phrases([(p, None) for p in phrases], "manual")
+        print(f"Added {n} phrases")
+    elif args.action == "remove":
+        n = db.remove_boilerplate_phrases(phrases)
+        print(f"Removed {n} phrases")
+    else:
+        for p in db.boilerplate_phrases():
+            print(f"{p['source']:>8}  {p['phrase']}")
+    return 0
+
+def cmd_pack_text(args) -> int:
+    t = time.perf_counter()
+    r = db.pack_text_columns(batch_size=args.batch_size)
+    print(f"Compressed {r['rows']} opportunities, saved {r['bytes_saved'] / 1024:.1f} KB in {time.perf_counter() - t:.2f}s")
+    return 0
+
+def cmd_import(args) -> int:
+    fmt = args.format or transfer.detect_format(args.path)
+
+    def progress(s):
+        print(f"  {s['read']} read, {s['inserted']} inserted, {s['duplicates']} duplicates, {s['errors']} errors", file=sys.stderr)
+
+    if args.path == "-":
+        fp = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig")
+        r = transfer.import_opportunities(fp, fmt, chunk_size=args.chunk_size, on_progress=progress)
+    else:
+        with open(args.path, encoding="utf-8-sig", newline="") as fp:
+            r = transfer.import_opportunities(fp, fmt, chunk_size=args.chunk_size, on_progress=progress)
+    for e in r["error_rows"]:
+        print(f"line {e['line']}: {e['error']}", file=sys.stderr)
+    print(f"Imported {r['inserted']} of {r['read']} records ({r['duplicates']} duplicates, {r['errors']} errors) in {r['seconds']:.2f}s")
+    return 1 if r["errors"] else 0
+
+def cmd_export(args) -> int:
+    t = time.perf_counter()
+    fmt = args.format or ("zip" if args.path.lower().endswith(".zip") else "jsonl")
+    if args.path == "-":
+        if fmt != "jsonl":
+            print("Only JSONL can be written to stdout", file=sys.stderr)
+            return 2
+        n = transfer.write_export(sys.stdout.buffer, "jsonl", stage=args.stage)
+    else:
+        with open(args.path, "wb") as fp:
+            n = transfer.write_export(fp, fmt, stage=args.stage)
+    print(f"Exported {n} opportunities in {time.perf_counter() - t:.2f}s", file=sys.stderr)
+    return 0
+
+def cmd_sweep(args) -> int:
+    t = time.perf_counter()
+    r = db.sweep_buckets()
+    print(f"Swept {r['scanned']} opportunities, updated {r['updated']} in {time.perf_counter() - t:.3f}s")
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="JD Copilot maintenance commands.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("reindex-analyses", help="Backfill the normalized analysis tables from analysis_json")
+    s.add_argument("--batch-size", type=int, default=500)
+    s.set_defaults(func=cmd_reindex_analyses)
+
+    s = sub.add_parser("reindex-signatures", help="Backfill the near-duplicate JD index (MinHash/LSH)")
+    s.add_argument("--batch-size", type=int, default=500)
+    s.set_defaults(func=cmd_reindex_signatures)
+
+    s = sub.add_parser("reindex-units", help="Backfill the per-company sentence index used to drop repeated JD blurbs")
+    s.add_argument("--batch-size", type=int, default=500)
+    s.set_defaults(func=cmd_reindex_units)
+
+    s = sub.add_parser("learn-boilerplate", help="Store sentences shared by many companies' JDs as boilerplate")
+    s.add_argument("--min-companies", type=int, default=compact.LEARN_MIN_COMPANIES)
+    s.add_argument("--dry-run", action="store_true", help="List them without storing")
+    s.set_defaults(func=cmd_learn_boilerplate)
+
+    s = sub.add_parser("boilerplate", help="List, add or remove stored boilerplate phrases")
+    s.add_argument("action", choices=("list", "add", "remove"))
+    s.add_argument("phrases", nargs="*")
+    s.set_defaults(func=cmd_boilerplate)
+
+    s = sub.add_parser("pack-text", help="Compress JD and analysis text stored before compression was enabled")
+    s.add_argument("--batch-size", type=int, default=500)
+    s.set_defaults(func=cmd_pack_text)
+
+    s = sub.add_parser("sweep", help="Recompute SLA buckets for every active opportunity")
+    s.set_defaults(func=cmd_sweep)
+
+    s = sub.add_parser("import", help="Bulk import opportunities from JSONL or CSV")
+    s.add_argument("path", help="File to read, or - for stdin")
+    s.add_argument("--format", choices=transfer.IMPORT_FORMATS, help="Default: from the file extension")
+    s.add_argument("--chunk-size", type=int, default=transfer.CHUNK_SIZE)
+    s.set_defaults(func=cmd_import)
+
+    s = sub.add_parser("export", help="Export opportunities and analyses as JSONL or a ZIP of JSON files")
+    s.add_argument("path", help="File to write, or - for stdout (JSONL)")
+    s.add_argument("--format", choices=transfer.EXPORT_FORMATS, help="Default: zip for .zip paths, else jsonl")
+    s.add_argument("--stage", help="Only opportunities in this stage")
+    s.set_defaults(func=cmd_export)
+
+    args = p.parse_args(argv)
+    db.init_db()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+# migrations.py
+"""
+Ordered schema migrations keyed on PRAGMA user_version.
+
+MIGRATIONS[i] moves a database from user_version i to i + 1. Steps that
+touch tables which may predate versioning (user_version 0) are written to
+be idempotent, since those databases were built by the old init_db.
+Append new steps; never edit or reorder shipped ones.
+"""
+import sqlite3
+from typing import Callable, List
+
+from utils import jd_hash
+
+OPPORTUNITIES_COLUMNS = """
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+
+        company TEXT NOT NULL,
+        role_title TEXT NOT NULL,
+        jd_link TEXT,
+        jd_text TEXT,
+
+        stage TEXT NOT NULL DEFAULT 'NEW',              -- NEW, ANALYZED, DECISION_PENDING, QUALIFIED_PREP, APPLIED, INTERVIEWING, CLOSED, DQ
+        decision TEXT DEFAULT 'PENDING',                -- PENDING, QUALIFIED, UNQUALIFIED
+
+        day0_at TEXT,                                   -- when JD dropped
+        bucket_due TEXT,                                -- next SLA due date
+        next_action TEXT,
+        next_action_due TEXT,
+
+        dq_reasons_json TEXT,                            -- JSON list of codes + notes
+
+        analysis_json TEXT,                              -- full analysis JSON
+        analysis_model TEXT,
+
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        estimated_cost_usd REAL
+"""
+
+def _columns(conn: sqlite3.Connection, table: str) -> dict:
+    # name -> declared type
+    return {c[1]: c[2] for c in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+def _ensure_column(conn: sqlite3.Connection, table: str, column: str, col_type: str) -> None:
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
+
+def _m001_opportunities(conn: sqlite3.Connection) -> None:
+    # Fresh databases get the full table; MVP databases created before the
+    # token columns existed get them added.
+    conn.execute(f"CREATE TABLE IF NOT EXISTS opportunities ({OPPORTUNITIES_COLUMNS})")
+    _ensure_column(conn, "opportunities", "prompt_tokens", "INTEGER")
+    _ensure_column(conn, "opportunities", "completion_tokens", "INTEGER")
+    _ensure_column(conn, "opportunities", "total_tokens", "INTEGER")
+    _ensure_column(conn, "opportunities", "estimated_cost_usd", "REAL")
+
+def _m002_fix_analysis_model_type(conn: sqlite3.Connection) -> None:
+    # The original CREATE was missing a comma after analysis_model, so that
+    # column was declared as "TEXT prompt_tokens INTEGER" (INTEGER affinity).
+    # SQLite cannot retype a column in place: rebuild the table.
+    cols = _columns(conn, "opportunities")
+    if cols.get("analysis_model", "TEXT").upper() == "TEXT":
+        return
+    conn.execute(f"CREATE TABLE opportunities_new ({OPPORTUNITIES_COLUMNS})")
+    keep = ", ".join(c for c in _columns(conn, "opportunities_new") if c in cols)
+    conn.execute(f"INSERT INTO opportunities_new ({keep}) SELECT {keep} FROM opportunities")
+    conn.execute("DROP TABLE opportunities")
+    conn.execute("ALTER TABLE opportunities_new RENAME TO opportunities")
+
+def _m003_analysis_cache(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_cache (
+        cache_key TEXT PRIMARY KEY,                      -- sha256 of normalized inputs + model + prompt version
+        created_at TEXT NOT NULL,
+        last_hit_at TEXT,
+        hit_count INTEGER NOT NULL DEFAULT 0,
+        model TEXT,
+        analysis_json TEXT NOT NULL,
+        prompt_tokens INTEGER,
+        completion_tokens INTEGER,
+        total_tokens INTEGER,
+        size_bytes INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_cache_counters (
+        name TEXT PRIMARY KEY,                           -- hits, misses, bypasses, evictions
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+def _m004_analysis_index(conn: sqlite3.Connection) -> None:
+    # Queryable copy of each opportunity's analysis_json (which stays the
+    # source of truth); rewritten whenever analysis_json is saved.
+    conn.execute("""
+    CREATE TABLE analysis_scores (
+        opportunity_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,                       -- index in scorecard
+        quality TEXT NOT NULL,                           -- as written by the model
+        quality_key TEXT NOT NULL,                       -- normalized for grouping
+        score INTEGER NOT NULL,
+        rationale TEXT,
+        PRIMARY KEY (opportunity_id, position)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_analysis_scores_quality ON analysis_scores (quality_key, score)")
+    conn.execute("""
+    CREATE TABLE analysis_evidence (
+        opportunity_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,                       -- scorecard position the evidence backs
+        quote TEXT NOT NULL,
+        note TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX idx_analysis_evidence_opp ON analysis_evidence (opportunity_id, position)")
+    conn.execute("""
+    CREATE TABLE analysis_items (
+        opportunity_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,                              -- gap, risk, unknown
+        text TEXT NOT NULL,
+        text_key TEXT NOT NULL                           -- normalized for counting
+    )
+    """)
+    conn.execute("CREATE INDEX idx_analysis_items_kind ON analysis_items (kind, text_key)")
+    conn.execute("CREATE INDEX idx_analysis_items_opp ON analysis_items (opportunity_id)")
+
+def _m005_listing_indexes(conn: sqlite3.Connection) -> None:
+    # Keyset pagination seeks on (updated_at, id), optionally under a filter
+    conn.execute("CREATE INDEX idx_opportunities_updated ON opportunities (updated_at, id)")
+    conn.execute("CREATE INDEX idx_opportunities_stage_updated ON opportunities (stage, updated_at, id)")
+    conn.execute("CREATE INDEX idx_opportunities_decision_updated ON opportunities (decision, updated_at, id)")
+    conn.execute("CREATE INDEX idx_opportunities_company ON opportunities (company COLLATE NOCASE)")
+    conn.execute("CREATE INDEX idx_opportunities_bucket_due ON opportunities (bucket_due)")
+
+def _m006_due_queue_index(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+    CREATE INDEX idx_opportunities_next_action_due ON opportunities (next_action_due)
+    WHERE next_action_due IS NOT NULL
+    """)
+
+def _m007_cached_prompt_tokens(conn: sqlite3.Connection) -> None:
+    # Prompt tokens the provider served from its prefix cache on the last run
+    conn.execute("ALTER TABLE opportunities ADD COLUMN cached_prompt_tokens INTEGER")
+
+def _m008_metrics_spans(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+    CREATE TABLE metrics_spans (
+        id INTEGER PRIMARY KEY,
+        trace_id TEXT NOT NULL,
+        parent_name TEXT,                                -- NULL for root spans
+        name TEXT NOT NULL,                              -- e.g. llm.completion, db.get_opportunity
+        started_at TEXT NOT NULL,
+        duration_ms REAL NOT NULL,
+        tokens INTEGER,                                  -- tokens billed within this span, if any
+        attrs_json TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX idx_metrics_spans_name_started ON metrics_spans (name, started_at)")
+    conn.execute("CREATE INDEX idx_metrics_spans_trace ON metrics_spans (trace_id)")
+    conn.execute("CREATE INDEX idx_metrics_spans_root ON metrics_spans (started_at) WHERE parent_name IS NULL")
+
+def _m009_section_usage(conn: sqlite3.Connection) -> None:
+    # {section: {model, prompt_tokens, completion_tokens, ..., generated_at}} for sectioned runs
+    conn.execute("ALTER TABLE opportunities ADD COLUMN section_usage_json TEXT")
+
+def _m010_analysis_history(conn: sqlite3.Connection) -> None:
+    # JD text the stored analysis was produced from, for diff-aware re-analysis
+    conn.execute("ALTER TABLE opportunities ADD COLUMN analysis_jd_text TEXT")
+    # Superseded analyses as zlib-compressed reverse deltas (see jsondelta):
+    # applying a row's delta to the analysis that replaced it restores it.
+    conn.execute("""
+    CREATE TABLE analysis_history (
+        id INTEGER PRIMARY KEY,
+        opportunity_id INTEGER NOT NULL,
+        superseded_at TEXT NOT NULL,
+        analysis_model TEXT,                             -- model of the superseded version
+        delta BLOB NOT NULL,
+        delta_bytes INTEGER NOT NULL,
+        full_bytes INTEGER NOT NULL                      -- size the version would take stored whole
+    )
+    """)
+    conn.execute("CREATE INDEX idx_analysis_history_opp ON analysis_history (opportunity_id, id)")
+
+def _m011_analysis_repairs(conn: sqlite3.Connection) -> None:
+    # One row per model output that failed validation (see repair.py)
+    conn.execute("""
+    CREATE TABLE analysis_repairs (
+        id INTEGER PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        model TEXT,
+        scope TEXT NOT NULL,                             -- full, patch, or a section name
+        ok INTEGER NOT NULL,                             -- 1 if the output was salvaged
+        local_fixes INTEGER NOT NULL,
+        remote_attempts INTEGER NOT NULL,
+        extra_tokens INTEGER NOT NULL,                   -- billed by the follow-up request(s)
+        tokens_saved INTEGER NOT NULL,                   -- vs. re-running the original call
+        seconds_saved REAL,
+        report_json TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX idx_analysis_repairs_created ON analysis_repairs (created_at)")
+
+# Text of every string leaf in an analysis, for the search index. Guarded by
+# json_valid so a malformed analysis can never make an opportunity write fail.
+_FLAT_ANALYSIS = """
+    CASE WHEN json_valid({col}) THEN
+        (SELECT group_concat(value, ' ') FROM json_tree({col}) WHERE type = 'text')
+    END
+"""
+
+def _m012_search_index(conn: sqlite3.Connection) -> None:
+    # Full-text index keyed by opportunity id; prefix indexes make "kaf*" cheap
+    conn.execute("""
+    CREATE VIRTUAL TABLE opportunities_fts USING fts5(
+        company, role_title, jd_text, analysis,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """)
+    insert = f"""
+        INSERT INTO opportunities_fts (rowid, company, role_title, jd_text, analysis)
+        VALUES (new.id, new.company, new.role_title, new.jd_text, {_FLAT_ANALYSIS.format(col="new.analysis_json")});
+    """
+    conn.execute(f"CREATE TRIGGER opportunities_fts_ai AFTER INSERT ON opportunities BEGIN {insert} END")
+    conn.execute("""
+    CREATE TRIGGER opportunities_fts_ad AFTER DELETE ON opportunities BEGIN
+        DELETE FROM opportunities_fts WHERE rowid = old.id;
+    END
+    """)
+    # Only fires for the indexed columns, so stage/SLA updates don't touch the index
+    conn.execute(f"""
+    CREATE TRIGGER opportunities_fts_au AFTER UPDATE OF company, role_title, jd_text, analysis_json ON opportunities BEGIN
+        DELETE FROM opportunities_fts WHERE rowid = old.id;
+        {insert}
+    END
+    """)
+    conn.execute(f"""
+    INSERT INTO opportunities_fts (rowid, company, role_title, jd_text, analysis)
+    SELECT id, company, role_title, jd_text, {_FLAT_ANALYSIS.format(col="analysis_json")}
+    FROM opportunities
+    """)
+    conn.execute("INSERT INTO opportunities_fts (opportunities_fts) VALUES ('optimize')")
+
+def _m013_near_duplicates(conn: sqlite3.Connection) -> None:
+    # Set when the user links an opportunity to an earlier posting of the same JD
+    conn.execute("ALTER TABLE opportunities ADD COLUMN duplicate_of INTEGER")
+    # MinHash signature per JD (see minhash.py) and its LSH band buckets.
+    # Backfilled by `manage.py reindex-signatures`; hashing can't run in SQL.
+    conn.execute("""
+    CREATE TABLE jd_signatures (
+        opportunity_id INTEGER PRIMARY KEY,
+        signature BLOB NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE jd_lsh (
+        band INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        opportunity_id INTEGER NOT NULL,
+        PRIMARY KEY (band, bucket, opportunity_id)
+    ) WITHOUT ROWID
+    """)
+
+def _m014_search_index_packed_text(conn: sqlite3.Connection) -> None:
+    # jd_text / analysis_json / analysis_jd_text may now hold zlib blobs; the
+    # search triggers read them through unpack_text(), which db registers on
+    # every connection it opens.
+    conn.execute("DROP TRIGGER opportunities_fts_ai")
+    conn.execute("DROP TRIGGER opportunities_fts_au")
+    insert = f"""
+        INSERT INTO opportunities_fts (rowid, company, role_title, jd_text, analysis)
+        VALUES (new.id, new.company, new.role_title, unpack_text(new.jd_text),
+                {_FLAT_ANALYSIS.format(col="unpack_text(new.analysis_json)")});
+    """
+    conn.execute(f"CREATE TRIGGER opportunities_fts_ai AFTER INSERT ON opportunities BEGIN {insert} END")
+    conn.execute(f"""
+    CREATE TRIGGER opportunities_fts_au AFTER UPDATE OF company, role_title, jd_text, analysis_json ON opportunities BEGIN
+        DELETE FROM opportunities_fts WHERE rowid = old.id;
+        {insert}
+    END
+    """)
+
+def _m015_import_dedupe_keys(conn: sqlite3.Connection) -> None:
+    # Keys the bulk importer skips duplicates on: JD link and JD content hash
+    conn.execute("ALTER TABLE opportunities ADD COLUMN jd_hash TEXT")
+    rows = conn.execute("SELECT id, unpack_text(jd_text) FROM opportunities WHERE jd_text IS NOT NULL").fetchall()
+    conn.executemany("UPDATE opportunities SET jd_hash = ? WHERE id = ?", [(jd_hash(t), i) for i, t in rows])
+    conn.execute("CREATE INDEX idx_opportunities_jd_hash ON opportunities (jd_hash) WHERE jd_hash IS NOT NULL")
+    conn.execute("CREATE INDEX idx_opportunities_jd_link ON opportunities (jd_link) WHERE jd_link != ''")
+
+def _m016_jobs(conn: sqlite3.Connection) -> None:
+    # Persistent analysis job queue; one row per (opportunity, input hash)
+    conn.execute("""
+    CREATE TABLE jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        opportunity_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        input_hash TEXT NOT NULL,
+        params_json TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress REAL NOT NULL DEFAULT 0,
+        progress_text TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        error TEXT,
+        result_json TEXT,
+        partial_json TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        heartbeat_at TEXT,
+        finished_at TEXT
+    )
+    """)
+    conn.execute("CREATE UNIQUE INDEX idx_jobs_input ON jobs (opportunity_id, input_hash)")
+    conn.execute("CREATE INDEX idx_jobs_status ON jobs (status, id)")
+
+def _m017_rate_limiter(conn: sqlite3.Connection) -> None:
+    # Shared OpenAI token buckets, their FIFO waiter queue and the spend ledger
+    conn.execute("""
+    CREATE TABLE rate_buckets (
+        name TEXT PRIMARY KEY,
+        level REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE rate_waiters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tokens INTEGER NOT NULL,
+        enqueued_at REAL NOT NULL,
+        seen_at REAL NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE llm_spend (
+        id INTEGER PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        model TEXT NOT NULL,
+        scope TEXT,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        cost_usd REAL NOT NULL,
+        settled INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute("CREATE INDEX idx_llm_spend_created ON llm_spend (created_at)")
+
+def _m018_jd_vectors(conn: sqlite3.Connection) -> None:
+    # Hashed n-gram counts and rule-term signals per JD for the local
+    # pre-screen; rebuilt when jd_hash or prescreen.RULES_VERSION changes
+    conn.execute("""
+    CREATE TABLE jd_vectors (
+        opportunity_id INTEGER PRIMARY KEY,
+        jd_hash TEXT NOT NULL,
+        indices BLOB NOT NULL,
+        counts BLOB NOT NULL,
+        signals TEXT NOT NULL,
+        rules_version INTEGER NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+    # Covers the staleness check and fingerprint without reading the vector blobs
+    conn.execute("CREATE INDEX idx_jd_vectors_hash ON jd_vectors (opportunity_id, jd_hash, rules_version, updated_at)")
+
+def _m019_triage_tier(conn: sqlite3.Connection) -> None:
+    # Cheap triage pass, recorded apart from the full analysis's model, tokens and
+    # cost. triage_jd_hash is the jd_hash of the text it scored, so a batch can
+    # reuse a current triage instead of paying for it again.
+    for column, col_type in (
+        ("triage_json", "TEXT"),
+        ("triage_model", "TEXT"),
+        ("triage_score", "REAL"),
+        ("triage_prompt_tokens", "INTEGER"),
+        ("triage_completion_tokens", "INTEGER"),
+        ("triage_cached_prompt_tokens", "INTEGER"),
+        ("triage_cost_usd", "REAL"),
+        ("triage_at", "TEXT"),
+        ("triage_jd_hash", "TEXT"),
+    ):
+        conn.execute(f"ALTER TABLE opportunities ADD COLUMN {column} {col_type}")
+
+def _m020_jd_compaction(conn: sqlite3.Connection) -> None:
+    # Estimated JD tokens before / after compaction for the last analysis run
+    conn.execute("ALTER TABLE opportunities ADD COLUMN jd_tokens_raw INTEGER")
+    conn.execute("ALTER TABLE opportunities ADD COLUMN jd_tokens_compact INTEGER")
+    # Sentence hashes (utils.unit_key) per JD, keyed by normalized company and
+    # role, so blurbs a company repeats across its roles can be dropped.
+    # Backfilled by `manage.py reindex-units`.
+    conn.execute("""
+    CREATE TABLE jd_units (
+        company_key TEXT NOT NULL,
+        unit_key TEXT NOT NULL,
+        opportunity_id INTEGER NOT NULL,
+        role_key TEXT NOT NULL,
+        PRIMARY KEY (company_key, unit_key, opportunity_id)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_jd_units_opportunity ON jd_units (opportunity_id)")
+    # Normalized phrases whose sentences are stripped from prompts: learned
+    # from the corpus by `manage.py learn-boilerplate` or added by hand
+    conn.execute("""
+    CREATE TABLE boilerplate_phrases (
+        phrase TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        companies INTEGER,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _m001_opportunities,
+    _m002_fix_analysis_model_type,
+    _m003_analysis_cache,
+    _m004_analysis_index,
+    _m005_listing_indexes,
+    _m006_due_queue_index,
+    _m007_cached_prompt_tokens,
+    _m008_metrics_spans,
+    _m009_section_usage,
+    _m010_analysis_history,
+    _m011_analysis_repairs,
+    _m012_search_index,
+    _m013_near_duplicates,
+    _m014_search_index_packed_text,
+    _m015_import_dedupe_keys,
+    _m016_jobs,
+    _m017_rate_limiter,
+    _m018_jd_vectors,
+    _m019_triage_tier,
+    _m020_jd_compaction,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Applies pending steps, each in its own transaction together with its
+    user_version bump. conn must be in autocommit mode (isolation_level=None).
+    Returns the number of steps applied.
+    """
+    applied = 0
+    while True:
+        # IMMEDIATE serialises concurrent migrators; re-read the version under the lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.execute("COMMIT")
+                return applied
+            MIGRATIONS[version](conn)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        applied += 1
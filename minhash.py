@@ -0,0 +1,80 @@
+# minhash.py
+"""
+MinHash signatures and LSH banding for near-duplicate JD detection.
+
+signature() hashes the 5-word shingles of the normalized text (a rolling
+polynomial over per-word hashes) and keeps, per permutation, the minimum
+of (a * h + b) mod P. The share of equal positions in two signatures
+estimates the Jaccard similarity of their shingle sets. band_keys() splits
+a signature into BANDS bands of ROWS values; texts sharing any band
+bucket are duplicate candidates, so a lookup touches a handful of index
+entries instead of every stored JD.
+
+With 16 bands of 4 rows a pair at Jaccard 0.8 collides in some band with
+probability ~0.9998, a pair at 0.3 with ~0.12, and unrelated JDs almost never.
+The permutation parameters are derived from fixed hashes: stored signatures
+stay comparable across processes and numpy versions.
+"""
+import hashlib
+import os
+import re
+import zlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SHINGLE_WORDS = 5
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+
+DEFAULT_THRESHOLD = float(os.getenv("JD_DUPLICATE_THRESHOLD", 0.8))
+
+_P = np.uint64((1 << 31) - 1)  # Mersenne prime; keeps values in uint32
+
+def _param(tag: str, i: int) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{tag}{i}".encode(), digest_size=8).digest(), "big") % int(_P)
+
+_BASE = np.uint64(1_000_003)
+_A = np.array([_param("a", i) or 1 for i in range(NUM_PERM)], dtype=np.uint64)
+_B = np.array([_param("b", i) for i in range(NUM_PERM)], dtype=np.uint64)
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Distinct hashes of the text's SHINGLE_WORDS-word shingles (one shingle if shorter)."""
+    words = re.findall(r"\w+", (text or "").lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    # Each distinct word is hashed once; shingles are combined numerically
+    vocab = {w: zlib.crc32(w.encode()) for w in set(words)}
+    wh = np.fromiter((vocab[w] for w in words), dtype=np.uint64, count=len(words)) % _P
+    k = min(SHINGLE_WORDS, len(words))
+    n = len(words) - k + 1
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        h = (h * _BASE + wh[j:j + n]) % _P
+    return np.unique(h)
+
+def signature(text: str) -> Optional[np.ndarray]:
+    """uint32 MinHash signature of the text, or None if it has no words."""
+    h = shingle_hashes(text)
+    if not h.size:
+        return None
+    # (a * h + b) < 2^62: no overflow in uint64
+    return ((_A[:, None] * h[None, :] + _B[:, None]) % _P).min(axis=1).astype(np.uint32)
+
+def band_keys(sig: np.ndarray) -> List[Tuple[int, int]]:
+    """(band, bucket) pairs; bucket is a signed 64-bit hash of the band's rows."""
+    return [
+        (b, int.from_bytes(hashlib.blake2b(sig[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=8).digest(), "big", signed=True))
+        for b in range(BANDS)
+    ]
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the two texts' shingle sets."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def to_blob(sig: np.ndarray) -> bytes:
+    return sig.astype("<u4").tobytes()
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<u4")
@@ -0,0 +1,255 @@
+# prescreen.py
+"""
+Local, offline fit pre-screen for the NEW queue.
+
+Each JD is reduced to hashed word unigram + bigram counts (N_FEATURES
+buckets, so there is no vocabulary to maintain), stored in jd_vectors and
+rebuilt only when the JD changes. load_index() stacks them into a CSR matrix
+with TF-IDF weights and unit-length rows, cached until the stored vectors
+change, so scoring every JD against the profile and rubric is a few NumPy
+passes over the non-zeros.
+
+Likely DQ reasons come from keyword rules: on-site requirements against a
+remote profile (LOCATION_MISMATCH), required years or a junior level against
+the profile's experience (SENIORITY_MISMATCH), and tools the profile never
+mentions (TECH_STACK_MISMATCH). Rule terms are matched exactly (hashed
+features collide too often for single keywords) when the JD is vectorized and
+stored with it. The flags order the queue; they don't decide anything.
+"""
+import json
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import db
+
+FEATURE_BITS = 18
+N_FEATURES = 1 << FEATURE_BITS
+
+# fit = PROFILE_WEIGHT * profile similarity + (1 - PROFILE_WEIGHT) * rubric similarity
+PROFILE_WEIGHT = 0.7
+# Rank score is fit * FLAG_PENALTY ** (number of likely DQ flags)
+FLAG_PENALTY = 0.5
+SENIORITY_SLACK_YEARS = 2
+STACK_MIN_MISSING = 3
+
+ONSITE_TERMS = ("onsite", "on site", "in office", "in person", "relocation", "relocate")
+REMOTE_TERMS = ("remote", "from home", "wfh")
+JUNIOR_TERMS = ("junior", "entry level", "intern", "internship", "new grad")
+TECH_TERMS = (
+    "python", "java", "scala", "kotlin", "swift", "javascript", "typescript", "react", "angular", "node",
+    "ruby", "rails", "php", "golang", "rust", "sql", "kafka", "spark", "hadoop", "airflow", "dbt",
+    "snowflake", "aws", "gcp", "azure", "kubernetes", "docker", "terraform", "salesforce", "sap",
+    "tableau", "looker", "figma", "pytorch", "tensorflow",
+)
+
+_MASK = np.uint64(N_FEATURES - 1)
+_P = np.uint64((1 << 31) - 1)
+_BASE = np.uint64(1_000_003)
+_BIGRAM_SALT = np.uint64(0x9E3779B1)
+_YEARS_RE = re.compile(r"(\d{1,2})\s*\+?\s*(?:years|yrs)\b", re.I)
+
+def features(text: str) -> np.ndarray:
+    """Feature id of every unigram and bigram occurrence in the text."""
+    words = re.findall(r"\w+", (text or "").lower())
+    vocab = {w: zlib.crc32(w.encode()) for w in set(words)}
+    wh = np.fromiter((vocab[w] for w in words), dtype=np.uint64, count=len(words))
+    bigrams = (((wh[:-1] * _BASE + wh[1:]) % _P) ^ _BIGRAM_SALT) & _MASK
+    return np.concatenate([wh & _MASK, bigrams])
+
+def vectorize(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(sorted feature ids, counts) of the text."""
+    idx, counts = np.unique(features(text), return_counts=True)
+    return idx.astype(np.uint32), np.minimum(counts, np.iinfo(np.uint16).max).astype(np.uint16)
+
+RULE_TERMS = ONSITE_TERMS + REMOTE_TERMS + JUNIOR_TERMS + TECH_TERMS
+# Bump when the rule terms change, so stored JD signals are recomputed
+RULES_VERSION = 1
+_TERM_COLUMN = {t: i for i, t in enumerate(RULE_TERMS)}
+
+def signals(text: str) -> Dict[str, Any]:
+    """Rule terms present in the text (as whole words) and the most years of experience it mentions."""
+    words = re.findall(r"\w+", (text or "").lower())
+    grams = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+    years = [int(m) for m in _YEARS_RE.findall(text or "")]
+    return {"terms": [t for t in RULE_TERMS if t in grams], "years": max(years, default=0)}
+
+def _cols(terms) -> List[int]:
+    return [_TERM_COLUMN[t] for t in terms]
+
+def refresh_index(batch_size: int = 500) -> int:
+    """Vectorizes JDs that are new or changed since their vector was stored. Returns how many."""
+    done = 0
+    while True:
+        rows = db.jd_vectors_to_refresh(RULES_VERSION, batch_size)
+        if not rows:
+            break
+        out = []
+        for r in rows:
+            idx, counts = vectorize(r["jd_text"])
+            out.append((
+                r["id"], r["jd_hash"], idx.astype("<u4").tobytes(), counts.astype("<u2").tobytes(),
+                json.dumps(signals(r["jd_text"])), RULES_VERSION,
+            ))
+        db.put_jd_vectors(out)
+        done += len(rows)
+    db.prune_jd_vectors()
+    return done
+
+class Index:
+    """
+    Stored JD vectors as a CSR matrix (indptr, indices, data) of TF-IDF
+    weighted, unit-length rows, plus a dense (JDs x RULE_TERMS) matrix of
+    which rule terms each JD contains and the years each asks for.
+    """
+
+    def __init__(self, rows: List[Tuple[int, bytes, bytes, str]]):
+        n = len(rows)
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.position = {oid: i for i, oid in enumerate(self.ids.tolist())}
+        parts = [np.frombuffer(r[1], dtype="<u4") for r in rows]
+        lengths = np.array([len(p) for p in parts], dtype=np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)])
+        self.indices = np.concatenate(parts) if n else np.empty(0, dtype=np.uint32)
+        counts = np.concatenate([np.frombuffer(r[2], dtype="<u2") for r in rows]) if n else np.empty(0, dtype=np.uint16)
+
+        df = np.bincount(self.indices, minlength=N_FEATURES)
+        self.idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        w = (1 + np.log(counts.astype(np.float32))) * self.idf[self.indices]
+        norms = np.sqrt(self._row_sums(w * w))
+        self.data = w / np.repeat(np.where(norms > 0, norms, 1).astype(np.float32), lengths)
+
+        self.rule_hits = np.zeros((n, len(RULE_TERMS)), dtype=bool)
+        self.years = np.zeros(n, dtype=np.int64)
+        for i, r in enumerate(rows):
+            sig = json.loads(r[3])
+            self.rule_hits[i, _cols(sig["terms"])] = True
+            self.years[i] = sig["years"]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _row_sums(self, values: np.ndarray) -> np.ndarray:
+        """Per-row sums of values aligned with indices."""
+        out = np.zeros(len(self), dtype=values.dtype)
+        if not len(values):
+            return out
+        # reduceat over an empty row yields its neighbour's value; those are zeroed
+        nonempty = np.diff(self.indptr) > 0
+        out[nonempty] = np.add.reduceat(values, self.indptr[:-1][nonempty])
+        return out
+
+    def query(self, text: str) -> np.ndarray:
+        """Dense unit-length TF-IDF vector of the text."""
+        idx, counts = vectorize(text)
+        q = np.zeros(N_FEATURES, dtype=np.float32)
+        w = (1 + np.log(counts.astype(np.float32))) * self.idf[idx]
+        norm = np.sqrt((w * w).sum())
+        if norm:
+            q[idx] = w / norm
+        return q
+
+    def dot(self, q: np.ndarray) -> np.ndarray:
+        """Every stored JD's dot product with the dense vector q."""
+        return self._row_sums(self.data * q[self.indices])
+
+    def any_of(self, terms) -> np.ndarray:
+        return self.rule_hits[:, _cols(terms)].any(axis=1)
+
+_cache: Dict[str, Any] = {}
+_cache_lock = threading.Lock()
+
+def load_index() -> Index:
+    """The Index of stored vectors, rebuilt only when they changed."""
+    key = (db.DB_PATH, db.jd_vectors_fingerprint())
+    with _cache_lock:
+        if _cache.get("key") != key:
+            _cache["index"] = Index(db.load_jd_vectors())
+            _cache["key"] = key
+        return _cache["index"]
+
+def likely_dq(index: Index, profile: str) -> Dict[str, Any]:
+    """
+    Rule flags for every JD in the index: a bool array per DQ code, plus the
+    per-JD values the reasons are written from.
+    """
+    sig = signals(profile)
+    no = np.zeros(len(index), dtype=bool)
+
+    location = no
+    if set(REMOTE_TERMS) & set(sig["terms"]):
+        location = index.any_of(ONSITE_TERMS) & ~index.any_of(REMOTE_TERMS)
+
+    too_senior = too_junior = no
+    if sig["years"]:
+        too_senior = index.years > sig["years"] + SENIORITY_SLACK_YEARS
+        if sig["years"] >= 5:
+            too_junior = index.any_of(JUNIOR_TERMS)
+
+    tech = set(TECH_TERMS) & set(sig["terms"])
+    missing = [t for t in TECH_TERMS if t not in tech]
+    missing_hits = index.rule_hits[:, _cols(missing)]
+    stack = no
+    if tech:
+        stack = missing_hits.sum(axis=1) >= STACK_MIN_MISSING
+
+    return {
+        "LOCATION_MISMATCH": location,
+        "SENIORITY_MISMATCH": too_senior | too_junior,
+        "TECH_STACK_MISMATCH": stack,
+        "too_senior": too_senior,
+        "jd_years": index.years,
+        "profile_years": sig["years"],
+        "missing_hits": missing_hits,
+        "missing_names": missing,
+    }
+
+def _reasons(dq: Dict[str, Any], rows: np.ndarray) -> List[List[Dict[str, str]]]:
+    """Flags with reasons for the given index rows."""
+    location = dq["LOCATION_MISMATCH"][rows].tolist()
+    seniority = dq["SENIORITY_MISMATCH"][rows].tolist()
+    too_senior = dq["too_senior"][rows].tolist()
+    jd_years = dq["jd_years"][rows].tolist()
+    stack = dq["TECH_STACK_MISMATCH"][rows]
+    # Only the stack-flagged rows need their missing terms spelled out
+    missing = iter(dq["missing_hits"][rows[stack]].tolist())
+    stack = stack.tolist()
+    out = []
+    for i in range(len(rows)):
+        flags = []
+        if location[i]:
+            flags.append({"code": "LOCATION_MISMATCH", "reason": "Mentions on-site work or relocation, no remote option"})
+        if seniority[i]:
+            reason = f"Asks for {jd_years[i]}+ years (profile: {dq['profile_years']})" if too_senior[i] else "Junior / entry-level role"
+            flags.append({"code": "SENIORITY_MISMATCH", "reason": reason})
+        if stack[i]:
+            names = [name for name, hit in zip(dq["missing_names"], next(missing)) if hit]
+            flags.append({"code": "TECH_STACK_MISMATCH", "reason": "Stack not in profile: " + ", ".join(names)})
+        out.append(flags)
+    return out
+
+def rank_new(profile: str, rubric: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    NEW opportunities with JD text, best predicted fit first: id, fit, likely
+    DQ flags ({code, reason}) and the rank score.
+    """
+    refresh_index()
+    index = load_index()
+    pos = np.array([index.position[i] for i in db.new_opportunity_ids() if i in index.position], dtype=np.int64)
+    if not len(pos):
+        return []
+
+    # Cosine similarity is linear in the query, so one pass scores both
+    fit = index.dot(PROFILE_WEIGHT * index.query(profile) + (1 - PROFILE_WEIGHT) * index.query(rubric))
+    dq = likely_dq(index, profile)
+    n_flags = dq["LOCATION_MISMATCH"].astype(np.int64) + dq["SENIORITY_MISMATCH"] + dq["TECH_STACK_MISMATCH"]
+    score = fit * FLAG_PENALTY ** n_flags
+
+    order = pos[np.argsort(-score[pos], kind="stable")][:limit]
+    return [
+        {"id": oid, "fit": f, "score": sc, "flags": flags}
+        for oid, f, sc, flags in zip(index.ids[order].tolist(), fit[order].tolist(), score[order].tolist(), _reasons(dq, order))
+    ]
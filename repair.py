@@ -0,0 +1,259 @@
+# repair.py
+"""
+Schema repair for model output that fails validation.
+
+Instead of discarding a paid completion, validate_with_repair:
+  1. applies cheap local fixes (clamp out-of-range ints, coerce scalars,
+     default missing lists/strings/objects, drop unknown keys), then
+  2. if errors remain, sends a small follow-up request containing only the
+     validation errors and the offending top-level fields, never the JD.
+
+strict_response_format builds an OpenAI strict json_schema response_format
+so compliant models cannot produce invalid output in the first place.
+"""
+import copy
+import functools
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, get_args, get_origin
+
+from pydantic import BaseModel, ValidationError, create_model
+
+import governor
+from tracing import span
+
+MAX_REMOTE_ATTEMPTS = 1
+# Completion size reserved against the rate limiter for a repair call
+REPAIR_COMPLETION_TOKENS = 1_000
+
+class SchemaRepairError(RuntimeError):
+    """Output still invalid after repair; .report says what was tried."""
+
+    def __init__(self, message: str, report: Dict[str, Any]):
+        super().__init__(message)
+        self.report = report
+
+REPAIR_SYSTEM = (
+    "You fix JSON fragments so they validate against a JSON Schema.\n"
+    "Return JSON only: an object with exactly the same top-level keys as the fragment, corrected.\n"
+    "Change only what the validation errors require; keep all other content as is.\n"
+)
+
+def _bounds(field) -> Tuple[Optional[float], Optional[float]]:
+    lo = hi = None
+    for m in field.metadata:
+        lo = getattr(m, "ge", lo)
+        hi = getattr(m, "le", hi)
+    return lo, hi
+
+def _coerce(value: Any, annotation: Any, path: str, fixes: List[str]) -> Any:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _coerce_model(value, annotation, path, fixes)
+
+    if get_origin(annotation) in (list, List):
+        item_type = (get_args(annotation) or (Any,))[0]
+        if value is None:
+            fixes.append(f"{path}: null -> []")
+            return []
+        if not isinstance(value, list):
+            fixes.append(f"{path}: wrapped single value in a list")
+            value = [value]
+        return [_coerce(v, item_type, f"{path}.{i}", fixes) for i, v in enumerate(value)]
+
+    if annotation is str:
+        if value is None:
+            fixes.append(f"{path}: null -> \"\"")
+            return ""
+        if isinstance(value, (int, float)):
+            fixes.append(f"{path}: number -> string")
+            return str(value)
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            fixes.append(f"{path}: joined list into string")
+            return "; ".join(value)
+        return value
+
+    if annotation is int and not isinstance(value, bool):
+        if isinstance(value, float) or (isinstance(value, str) and value.strip().lstrip("-").replace(".", "", 1).isdigit()):
+            fixes.append(f"{path}: {value!r} -> int")
+            return int(round(float(value)))
+    return value
+
+def _coerce_model(value: Any, cls: Type[BaseModel], path: str, fixes: List[str]) -> Any:
+    if value is None:
+        fixes.append(f"{path or '<root>'}: null -> {{}}")
+        value = {}
+    if not isinstance(value, dict):
+        return value  # nothing safe to do locally
+
+    out = {}
+    for k in value:
+        if k not in cls.model_fields:
+            fixes.append(f"{path + '.' if path else ''}{k}: dropped unknown key")
+    for name, field in cls.model_fields.items():
+        p = f"{path}.{name}" if path else name
+        if value.get(name) is None:
+            if not field.is_required():
+                if name in value:
+                    fixes.append(f"{p}: null -> default")
+                continue
+            ann = field.annotation
+            if get_origin(ann) in (list, List):
+                out[name] = []
+            elif ann is str:
+                out[name] = ""
+            elif isinstance(ann, type) and issubclass(ann, BaseModel):
+                out[name] = _coerce_model({}, ann, p, fixes)
+            else:
+                continue  # e.g. a missing score: can't be invented locally
+            fixes.append(f"{p}: missing -> {out[name]!r}")
+            continue
+
+        v = _coerce(value[name], field.annotation, p, fixes)
+        lo, hi = _bounds(field)
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            if lo is not None and v < lo:
+                fixes.append(f"{p}: {v} clamped to {lo}")
+                v = type(v)(lo)
+            if hi is not None and v > hi:
+                fixes.append(f"{p}: {v} clamped to {hi}")
+                v = type(v)(hi)
+        out[name] = v
+    return out
+
+def local_repair(data: Dict[str, Any], model_cls: Type[BaseModel]) -> Tuple[Dict[str, Any], List[str]]:
+    fixes: List[str] = []
+    return _coerce_model(copy.deepcopy(data), model_cls, "", fixes), fixes
+
+def _strictify(node: Any) -> Any:
+    if isinstance(node, dict):
+        node = {k: _strictify(v) for k, v in node.items() if k not in ("default", "title", "minimum", "maximum")}
+        if node.get("type") == "object" and "properties" in node:
+            node["additionalProperties"] = False
+            node["required"] = list(node["properties"])
+        return node
+    if isinstance(node, list):
+        return [_strictify(v) for v in node]
+    return node
+
+@functools.lru_cache(maxsize=None)
+def strict_response_format(model_cls: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    response_format for OpenAI structured outputs (strict json_schema). Strict
+    mode needs every property required and no additional properties; numeric
+    bounds are dropped from the schema and enforced by local_repair instead.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model_cls.__name__,
+            "schema": _strictify(model_cls.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+def _error_lines(e: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()]
+
+def _fragment_model(model_cls: Type[BaseModel], fields: List[str]) -> Type[BaseModel]:
+    return create_model(
+        f"{model_cls.__name__}Fragment",
+        **{f: (model_cls.model_fields[f].annotation, model_cls.model_fields[f]) for f in fields},
+    )
+
+def validate_with_repair(
+    data: Dict[str, Any],
+    model_cls: Type[BaseModel],
+    model: str,
+    client_factory: Callable[[], Any],
+    original_seconds: Optional[float] = None,
+    original_tokens: int = 0,
+    allow_remote: bool = True,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Returns (valid data, repair report). The report is None when the data was
+    valid as returned; otherwise it records the local fixes, remote attempts,
+    extra tokens billed and an estimate of what a full re-run would have cost.
+    Raises SchemaRepairError if the data cannot be repaired.
+    """
+    try:
+        model_cls.model_validate(data)
+        return data, None
+    except ValidationError:
+        pass
+
+    t0 = time.perf_counter()
+    report = {
+        "local_fixes": [],
+        "remote_attempts": 0,
+        "extra_prompt_tokens": 0,
+        "extra_completion_tokens": 0,
+    }
+    with span("llm.repair_local"):
+        data, report["local_fixes"] = local_repair(data, model_cls)
+
+    last_error: Optional[ValidationError] = None
+    for attempt in range(MAX_REMOTE_ATTEMPTS + 1):
+        try:
+            model_cls.model_validate(data)
+            last_error = None
+            break
+        except ValidationError as e:
+            last_error = e
+        if not allow_remote or attempt == MAX_REMOTE_ATTEMPTS:
+            break
+
+        bad_fields = sorted({str(err["loc"][0]) for err in last_error.errors() if err["loc"]} & set(model_cls.model_fields))
+        fragment = {f: data.get(f) for f in bad_fields}
+        schema = json.dumps(_fragment_model(model_cls, bad_fields).model_json_schema(), separators=(",", ":"))
+        messages = [
+            {"role": "system", "content": REPAIR_SYSTEM},
+            {"role": "user", "content": (
+                f"JSON Schema for these fields:\n{schema}\n\n"
+                "VALIDATION ERRORS:\n" + "\n".join(f"- {line}" for line in _error_lines(last_error)) +
+                f"\n\nFRAGMENT:\n{json.dumps(fragment)}\n"
+            )},
+        ]
+        with governor.reserve(model, messages, REPAIR_COMPLETION_TOKENS, scope="repair") as grant:
+            with span("llm.repair_remote", fields=bad_fields) as sp:
+                resp = client_factory().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    response_format={"type": "json_object"},
+                )
+                sp.set(tokens=getattr(resp.usage, "total_tokens", None))
+            grant.settle(resp.usage)
+        report["remote_attempts"] += 1
+        report["extra_prompt_tokens"] += getattr(resp.usage, "prompt_tokens", 0)
+        report["extra_completion_tokens"] += getattr(resp.usage, "completion_tokens", 0)
+        try:
+            fixed = json.loads(resp.choices[0].message.content)
+        except ValueError:
+            continue
+        data = {**data, **{k: v for k, v in fixed.items() if k in bad_fields}}
+        data, more = local_repair(data, model_cls)
+        report["local_fixes"] += more
+
+    report["repair_seconds"] = time.perf_counter() - t0
+    extra = report["extra_prompt_tokens"] + report["extra_completion_tokens"]
+    report["tokens_saved"] = max(0, original_tokens - extra)
+    if original_seconds is not None:
+        report["seconds_saved"] = max(0.0, original_seconds - report["repair_seconds"])
+
+    if last_error is not None:
+        report["errors"] = _error_lines(last_error)
+        raise SchemaRepairError(f"Model returned invalid schema: {last_error}", report)
+    return data, report
+
+def merge_reports(reports: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Combines per-section repair reports into one, or None if there were none."""
+    if not reports:
+        return None
+    out: Dict[str, Any] = {"local_fixes": []}
+    for r in reports:
+        for k, v in r.items():
+            if k == "local_fixes":
+                out[k] += v
+            elif isinstance(v, (int, float)):
+                out[k] = out.get(k, 0) + v
+    return out
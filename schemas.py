@@ -1,5 +1,5 @@
 # schemas.py
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 from typing import List, Literal, Optional
 
 class Evidence(BaseModel):
@@ -40,4 +40,32 @@ class JDAnalysis(BaseModel):
     strengths_and_gaps: StrengthGap
     storyline: Storyline
     interview_prep: InterviewPrep
-    downside_case: DownsideCase
\ No newline at end of file
+    downside_case: DownsideCase
+
+# Independent slices of JDAnalysis that can be generated concurrently and
+# regenerated on their own. Together they cover every JDAnalysis field.
+JD_SECTIONS = {
+    "overview": ("role_summary", "extracted_requirements", "extracted_responsibilities"),
+    "scorecard": ("scorecard",),
+    "positioning": ("strengths_and_gaps", "storyline"),
+    "prep": ("interview_prep", "downside_case"),
+}
+
+SECTION_MODELS = {
+    name: create_model(
+        f"JDAnalysis_{name}",
+        **{f: (JDAnalysis.model_fields[f].annotation, JDAnalysis.model_fields[f]) for f in fields},
+    )
+    for name, fields in JD_SECTIONS.items()
+}
+
+# Cheap first pass: enough to decide whether the full JDAnalysis is worth paying for
+class ProvisionalScore(BaseModel):
+    quality: str
+    score: int = Field(..., ge=1, le=5)
+    rationale: str = Field(..., description="One sentence")
+
+class JDTriage(BaseModel):
+    role_summary: str
+    extracted_requirements: List[str]
+    provisional_scores: List[ProvisionalScore]
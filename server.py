@@ -0,0 +1,495 @@
+# server.py
+"""
+Headless HTTP/JSON API over the tracker, for scripts and other tools.
+
+    python server.py --port 8765 --rubric-file rubric.txt --profile-file profile.txt
+
+    GET   /opportunities?stage=&decision=&company=&q=&limit=&cursor=
+    POST  /opportunities                  {company, role_title, jd_link?, jd_text?}
+    GET   /opportunities/{id}             ETag; If-None-Match answers 304
+    PATCH /opportunities/{id}             editable fields; If-Match answers 412 if it changed
+    POST  /opportunities/{id}/analysis    {rubric?, profile?, mode?, use_cache?, triage?, wait?}
+    GET   /jobs/{id}
+    POST  /sweep
+    GET   /due?before=&limit=
+    GET   /health
+
+One asyncio event loop serves every connection (HTTP/1.1 keep-alive). Each
+database call runs on a small thread pool sized to the db connection pool,
+so requests never wait on each other's queries and every thread reuses a
+pooled connection. An analysis is queued for the job workers (this
+process's --workers, or jobs.py) and answered 202 with the job; with
+"wait": true it runs on the event loop through the async OpenAI client and
+answers with the analyzed opportunity.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import openai
+
+import db
+import governor
+import jobs
+from llm import (
+    analysis_update_fields,
+    get_async_client,
+    run_day0_analysis_async,
+    run_day0_triage_async,
+    triage_enabled,
+    triage_passed,
+    triage_update_fields,
+)
+from tracing import span
+from transfer import DECISIONS, STAGES
+from utils import compute_bucket
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 1 << 20
+DEFAULT_PAGE = 50
+MAX_PAGE = 200
+# Bump when the opportunity representation changes, so old ETags stop matching
+REPRESENTATION_VERSION = 1
+
+# Fields PATCH may set, as in the app's "Save fields"
+EDITABLE = ("company", "role_title", "jd_link", "jd_text", "stage", "decision")
+_JSON_COLUMNS = ("dq_reasons_json", "section_usage_json", "triage_json")
+_FLAG_COLUMNS = ("has_jd", "has_analysis", "jd_changed")
+
+_REASONS = {
+    200: "OK", 201: "Created", 202: "Accepted", 204: "No Content", 304: "Not Modified",
+    400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 412: "Precondition Failed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway",
+}
+
+Reply = Tuple[int, Any, Dict[str, str]]
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path.rstrip("/") or "/"
+        self.query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> Dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The JSON body must be an object.")
+        return data
+
+    def int_arg(self, name: str, default: int, maximum: int) -> int:
+        try:
+            return max(1, min(maximum, int(self.query.get(name, default))))
+        except ValueError:
+            raise HTTPError(400, f"{name} must be an integer.")
+
+# --- representation ---
+
+def etag(header: Dict[str, Any]) -> str:
+    """
+    Strong validator for an opportunity. Every write through
+    update_opportunity bumps updated_at (which covers the JD and analysis),
+    and sweeps change the SLA columns, so hashing the header is enough.
+    """
+    raw = json.dumps([REPRESENTATION_VERSION, header], sort_keys=True, default=str)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+def _etag_matches(header_value: str, tag: str) -> bool:
+    for t in header_value.split(","):
+        t = t.strip()
+        # Weak comparison: a W/ prefix still matches
+        if t == "*" or (t[2:] if t.startswith("W/") else t) == tag:
+            return True
+    return False
+
+def _decode(header: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(header)
+    for col in _JSON_COLUMNS:
+        raw = out.pop(col, None)
+        out[col[:-len("_json")]] = json.loads(raw) if raw else None
+    for col in _FLAG_COLUMNS:
+        if col in out:
+            out[col] = bool(out[col])
+    return out
+
+def _representation(header: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **_decode(header),
+        "jd_text": db.get_jd_text(header["id"]) or "",
+        "analysis": db.get_analysis(header["id"], header["updated_at"]) if header["has_analysis"] else None,
+    }
+
+def _encode_cursor(cursor: Optional[Tuple[str, int]]) -> Optional[str]:
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode().rstrip("=")
+
+def _decode_cursor(value: str) -> Tuple[str, int]:
+    try:
+        updated_at, oid = json.loads(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)))
+        return str(updated_at), int(oid)
+    except (ValueError, TypeError):
+        raise HTTPError(400, "Invalid cursor.")
+
+# --- blocking handlers (run on the db thread pool) ---
+
+def _sync_sla(header: Dict[str, Any]) -> None:
+    """Mirrors app.sync_sla: keep the SLA fields in step with a stage/decision edit."""
+    if not header.get("day0_at"):
+        return
+    b = compute_bucket(header["stage"], header["day0_at"], header["decision"])
+    if b["stage"] != header["stage"] or b["bucket_due"] != header.get("bucket_due") or b["next_action"] != (header.get("next_action") or ""):
+        db.update_opportunity(header["id"], {f: b[f] for f in db.SLA_FIELDS})
+
+def _validate_fields(body: Dict[str, Any], required: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    unknown = sorted(set(body) - set(EDITABLE))
+    if unknown:
+        raise HTTPError(400, f"Not editable: {', '.join(unknown)}")
+    for k, v in body.items():
+        if not isinstance(v, str):
+            raise HTTPError(400, f"{k} must be a string.")
+    for k in required:
+        if not (body.get(k) or "").strip():
+            raise HTTPError(400, f"{k} is required.")
+    if "stage" in body and body["stage"] not in STAGES:
+        raise HTTPError(400, f"Unknown stage: {body['stage']}")
+    if "decision" in body and body["decision"] not in DECISIONS:
+        raise HTTPError(400, f"Unknown decision: {body['decision']}")
+    return {k: v.strip() if k != "jd_text" else v for k, v in body.items()}
+
+def get_opportunity(opp_id: int, if_none_match: Optional[str]) -> Reply:
+    header = db.get_opportunity_header(opp_id)
+    if header is None:
+        raise HTTPError(404, f"No opportunity #{opp_id}")
+    tag = etag(header)
+    # Checked before the JD and analysis are read: an unchanged opportunity costs one header lookup
+    if if_none_match and _etag_matches(if_none_match, tag):
+        return 304, None, {"ETag": tag}
+    return 200, _representation(header), {"ETag": tag}
+
+def create_opportunity(body: Dict[str, Any]) -> Reply:
+    fields = _validate_fields(body, required=("company", "role_title"))
+    extra = sorted(set(fields) - {"company", "role_title", "jd_link", "jd_text"})
+    if extra:
+        raise HTTPError(400, f"Set with PATCH after creating: {', '.join(extra)}")
+    oid = db.create_opportunity(fields["company"], fields["role_title"], fields.get("jd_link", ""), fields.get("jd_text", ""))
+    header = db.get_opportunity_header(oid)
+    return 201, _representation(header), {"ETag": etag(header), "Location": f"/opportunities/{oid}"}
+
+def update_opportunity(opp_id: int, body: Dict[str, Any], if_match: Optional[str]) -> Reply:
+    fields = _validate_fields(body)
+    # Check, write and SLA recompute in one commit, so If-Match can't race another writer
+    with db.transaction():
+        header = db.get_opportunity_header(opp_id)
+        if header is None:
+            raise HTTPError(404, f"No opportunity #{opp_id}")
+        if if_match and not _etag_matches(if_match, etag(header)):
+            raise HTTPError(412, "The opportunity changed since that ETag; fetch it again.")
+        if fields:
+            db.update_opportunity(opp_id, fields)
+            _sync_sla(db.get_opportunity_header(opp_id))
+        header = db.get_opportunity_header(opp_id)
+    return 200, _representation(header), {"ETag": etag(header)}
+
+def list_opportunities(req: Request) -> Reply:
+    limit = req.int_arg("limit", DEFAULT_PAGE, MAX_PAGE)
+    stage = req.query.get("stage") or None
+    decision = req.query.get("decision") or None
+    if req.query.get("q"):
+        rows = db.search_opportunities(req.query["q"], limit=limit, stage=stage, decision=decision)
+        return 200, {"items": rows, "next_cursor": None}, {}
+    after = _decode_cursor(req.query["cursor"]) if req.query.get("cursor") else None
+    rows, cursor = db.list_opportunities_page(
+        limit=limit, after=after, stage=stage, decision=decision, company_prefix=req.query.get("company"),
+    )
+    return 200, {"items": rows, "next_cursor": _encode_cursor(cursor)}, {}
+
+def get_job(job_id: int) -> Reply:
+    job = db.get_job(job_id)
+    if job is None:
+        raise HTTPError(404, f"No job #{job_id}")
+    return 200, job, {}
+
+def sweep(_req: Request) -> Reply:
+    return 200, db.sweep_buckets(), {}
+
+def due(req: Request) -> Reply:
+    return 200, {"items": db.list_due_queue(req.query.get("before") or None, req.int_arg("limit", 200, 1000))}, {}
+
+def health(_req: Request) -> Reply:
+    return 200, {"ok": True, "jobs": db.job_counts()}, {}
+
+# --- server ---
+
+class Api:
+    """Routes requests to handlers; blocking ones run on the db thread pool."""
+
+    def __init__(self, rubric: str = "", profile: str = "", db_threads: int = db.POOL_SIZE):
+        self.rubric = rubric
+        self.profile = profile
+        self.executor = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix="api-db")
+        self._client = None
+        self.routes: List[Tuple[str, str, Callable[..., Awaitable[Reply]]]] = [
+            ("GET", "/health", self._blocking(health)),
+            ("GET", "/opportunities", self._blocking(list_opportunities)),
+            ("POST", "/opportunities", self.create),
+            ("GET", "/opportunities/{id}", self.get),
+            ("PATCH", "/opportunities/{id}", self.update),
+            ("POST", "/opportunities/{id}/analysis", self.analyze),
+            ("GET", "/jobs/{id}", self.job),
+            ("POST", "/sweep", self._blocking(sweep)),
+            ("GET", "/due", self._blocking(due)),
+        ]
+
+    def run(self, fn: Callable, *args: Any) -> Awaitable[Any]:
+        return asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args))
+
+    def _blocking(self, fn: Callable[[Request], Reply]) -> Callable[..., Awaitable[Reply]]:
+        async def handler(req: Request) -> Reply:
+            return await self.run(fn, req)
+        return handler
+
+    @property
+    def client(self):
+        if self._client is None:
+            # No SDK retries: they would skip governor admission. A 429 pauses
+            # every caller and reaches the API client as a 502 to retry
+            self._client = get_async_client(max_retries=0)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        self.executor.shutdown(wait=False)
+
+    def _match(self, req: Request) -> Tuple[str, Callable[..., Awaitable[Reply]], Dict[str, int]]:
+        parts = req.path.strip("/").split("/")
+        allowed = []
+        for method, pattern, handler in self.routes:
+            pparts = pattern.strip("/").split("/")
+            if len(pparts) != len(parts):
+                continue
+            params = {}
+            for p, v in zip(pparts, parts):
+                if p == "{id}" and v.isdigit():
+                    params["id"] = int(v)
+                elif p != v:
+                    break
+            else:
+                if method == req.method:
+                    return pattern, handler, params
+                allowed.append(method)
+        if allowed:
+            raise HTTPError(405, f"{req.method} not allowed; use {', '.join(allowed)}")
+        raise HTTPError(404, f"No route for {req.path}")
+
+    async def dispatch(self, req: Request) -> Reply:
+        try:
+            route, handler, params = self._match(req)
+            with span("api.request", method=req.method, route=route) as sp:
+                status, payload, headers = await handler(req, **params)
+                sp.set(status=status)
+            return status, payload, headers
+        except HTTPError as e:
+            return e.status, {"error": str(e)}, {}
+        except governor.BudgetExceededError as e:
+            return 429, {"error": str(e)}, {}
+        except openai.APIError as e:
+            return 502, {"error": f"OpenAI: {e}"}, {}
+        except ValueError as e:
+            return 400, {"error": str(e)}, {}
+        except Exception as e:
+            traceback.print_exc(file=sys.stderr)
+            return 500, {"error": f"{type(e).__name__}: {e}"}, {}
+
+    async def get(self, req: Request, id: int) -> Reply:
+        return await self.run(get_opportunity, id, req.headers.get("if-none-match"))
+
+    async def create(self, req: Request) -> Reply:
+        return await self.run(create_opportunity, req.json())
+
+    async def update(self, req: Request, id: int) -> Reply:
+        return await self.run(update_opportunity, id, req.json(), req.headers.get("if-match"))
+
+    async def job(self, req: Request, id: int) -> Reply:
+        return await self.run(get_job, id)
+
+    async def analyze(self, req: Request, id: int) -> Reply:
+        body = req.json()
+        rubric = body.get("rubric") or self.rubric
+        profile = body.get("profile") or self.profile
+        if not rubric.strip() or not profile.strip():
+            raise HTTPError(400, "rubric and profile are required (or start the server with --rubric-file / --profile-file).")
+        mode = body.get("mode", "single")
+        use_cache = bool(body.get("use_cache", True))
+        triage = triage_enabled() if body.get("triage") is None else bool(body["triage"])
+
+        header = await self.run(db.get_opportunity_header, id)
+        if header is None:
+            raise HTTPError(404, f"No opportunity #{id}")
+        jd_text = await self.run(db.get_jd_text, id) or ""
+        if not jd_text.strip():
+            raise HTTPError(400, "The opportunity has no JD text.")
+
+        if not body.get("wait"):
+            job = await self.run(partial(
+                jobs.enqueue_day0, header, jd_text, rubric, profile, mode=mode, use_cache=use_cache, triage=triage,
+            ))
+            return 202, job, {"Location": f"/jobs/{job['id']}"}
+
+        if mode != "single":
+            raise HTTPError(400, "wait runs the single-call analysis; queue other modes as a job.")
+        run = await self._analyze_now(header, jd_text, rubric, profile, use_cache, triage)
+        header = await self.run(db.get_opportunity_header, id)
+        rep = await self.run(_representation, header)
+        return 200, {**rep, "run": run}, {"ETag": etag(header)}
+
+    async def _analyze_now(
+        self, opp: Dict[str, Any], jd_text: str, rubric: str, profile: str, use_cache: bool, triage: bool,
+    ) -> Dict[str, Any]:
+        kwargs = dict(
+            jd_text=jd_text,
+            company=opp["company"],
+            role_title=opp["role_title"],
+            user_rubric=rubric,
+            user_profile=profile,
+            use_cache=use_cache,
+        )
+        fields: Dict[str, Any] = {}
+        run: Dict[str, Any] = {"cached": True, "total_tokens": 0, "triage_only": False}
+        if triage:
+            t = await run_day0_triage_async(self.client, **kwargs)
+            fields = triage_update_fields(t, jd_text)
+            run.update(cached=t["cached"], total_tokens=t["total_tokens"], triage_score=t["score"], model=t["model"])
+            if not triage_passed(t):
+                await self.run(db.update_opportunity, opp["id"], fields)
+                return {**run, "triage_only": True}
+
+        result = await run_day0_analysis_async(self.client, **kwargs)
+        fields.update(analysis_update_fields(result))
+        await self.run(db.update_opportunity, opp["id"], fields)
+        run.update(cached=run["cached"] and result["cached"], model=result["model"],
+                   total_tokens=run["total_tokens"] + result["total_tokens"])
+        return run
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    req = await _read_request(reader)
+                except HTTPError as e:
+                    writer.write(_response(e.status, {"error": str(e)}, {}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if req is None:
+                    break
+                status, payload, headers = await self.dispatch(req)
+                writer.write(_response(status, payload, headers, req.keep_alive))
+                await writer.drain()
+                if not req.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """The next request on the connection, or None once the client closed it."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers: Dict[str, str] = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = h.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Bodies are limited to {MAX_BODY_BYTES} bytes.")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target, headers, body)
+
+def _response(status: int, payload: Any, headers: Dict[str, str], keep_alive: bool) -> bytes:
+    body = b"" if payload is None else json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+    if body:
+        lines.append("Content-Type: application/json")
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+async def serve(api: Api, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, ready: Optional[Callable[[int], None]] = None) -> None:
+    server = await asyncio.start_server(api.serve_connection, host, port)
+    if ready:
+        ready(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await api.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--host", default=DEFAULT_HOST)
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--workers", type=int, default=jobs.DEFAULT_WORKERS, help="Job workers in this process (0: run jobs.py instead)")
+    p.add_argument("--rubric-file", default=None, help="Default rubric for analysis requests")
+    p.add_argument("--profile-file", default=None, help="Default profile for analysis requests")
+    args = p.parse_args(argv)
+
+    def read(path: Optional[str]) -> str:
+        if not path:
+            return ""
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    db.init_db()
+    jobs.start_workers(args.workers)
+    api = Api(read(args.rubric_file), read(args.profile_file))
+    try:
+        asyncio.run(serve(api, args.host, args.port, ready=lambda port: print(
+            f"Serving on http://{args.host}:{port} ({args.workers} job workers; Ctrl+C to stop)", flush=True,
+        )))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
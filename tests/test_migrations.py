@@ -0,0 +1,206 @@
+# test_migrations.py
+"""
+Every schema a user's database may be in, from the pre-versioning shapes
+the old init_db left to each user_version since, must migrate forward to
+SCHEMA_VERSION with its rows intact.
+
+    python -m pytest -q tests
+"""
+import sqlite3
+
+import pytest
+
+import db
+import migrations
+from utils import jd_hash
+
+# The MVP table before the token columns existed
+PRE_TOKEN_COLUMNS = """
+CREATE TABLE opportunities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    company TEXT NOT NULL,
+    role_title TEXT NOT NULL,
+    jd_link TEXT,
+    jd_text TEXT,
+    stage TEXT NOT NULL DEFAULT 'NEW',
+    decision TEXT DEFAULT 'PENDING',
+    day0_at TEXT,
+    bucket_due TEXT,
+    next_action TEXT,
+    next_action_due TEXT,
+    dq_reasons_json TEXT,
+    analysis_json TEXT,
+    analysis_model TEXT
+)
+"""
+
+# The original init_db CREATE: no comma after analysis_model, so its declared
+# type swallowed "prompt_tokens INTEGER" and that column was never created
+MISSING_COMMA = """
+CREATE TABLE opportunities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    company TEXT NOT NULL,
+    role_title TEXT NOT NULL,
+    jd_link TEXT,
+    jd_text TEXT,
+    stage TEXT NOT NULL DEFAULT 'NEW',
+    decision TEXT DEFAULT 'PENDING',
+    day0_at TEXT,
+    bucket_due TEXT,
+    next_action TEXT,
+    next_action_due TEXT,
+    dq_reasons_json TEXT,
+    analysis_json TEXT,
+    analysis_model TEXT
+
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    estimated_cost_usd REAL
+)
+"""
+
+# Columns the old init_db created, with the types they must end up with
+BASE_COLUMNS = {
+    "id": "INTEGER", "created_at": "TEXT", "updated_at": "TEXT", "company": "TEXT", "role_title": "TEXT",
+    "jd_link": "TEXT", "jd_text": "TEXT", "stage": "TEXT", "decision": "TEXT", "day0_at": "TEXT",
+    "bucket_due": "TEXT", "next_action": "TEXT", "next_action_due": "TEXT", "dq_reasons_json": "TEXT",
+    "analysis_json": "TEXT", "analysis_model": "TEXT", "prompt_tokens": "INTEGER",
+    "completion_tokens": "INTEGER", "total_tokens": "INTEGER", "estimated_cost_usd": "REAL",
+}
+
+SHORT_JD = "Senior PM, payments. 5+ years of product experience."
+LONG_JD = "Own the kafka payments platform roadmap with engineering and design. " * 40
+
+# First user_version whose search triggers read packed text; JD and
+# analysis text is only ever stored packed from then on
+PACKED_FROM = 14
+
+def _pre_token_columns(conn: sqlite3.Connection) -> None:
+    conn.execute(PRE_TOKEN_COLUMNS)
+
+def _missing_comma(conn: sqlite3.Connection) -> None:
+    conn.execute(MISSING_COMMA)
+
+def _missing_comma_patched(conn: sqlite3.Connection) -> None:
+    # After ensure_column ran: the token columns that were missing got added
+    conn.execute(MISSING_COMMA)
+    conn.execute("ALTER TABLE opportunities ADD COLUMN prompt_tokens INTEGER")
+
+PRE_VERSIONING_SHAPES = {
+    "pre_token_columns": _pre_token_columns,
+    "missing_comma": _missing_comma,
+    "missing_comma_patched": _missing_comma_patched,
+}
+
+def _open(path) -> sqlite3.Connection:
+    # db's connection setup registers the SQL functions later steps call
+    return db._open_connection(str(path))
+
+@pytest.fixture
+def conn(tmp_path):
+    c = _open(tmp_path / "jd_copilot.sqlite")
+    yield c
+    c.close()
+
+def _schema(conn: sqlite3.Connection) -> dict:
+    """Columns of every table plus every index and trigger, in a comparable form."""
+    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    return {
+        "columns": {t: sorted(tuple(c)[1:] for c in conn.execute(f"PRAGMA table_info({t})")) for t in tables},
+        "objects": sorted(tuple(r) for r in conn.execute(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('index', 'trigger')"
+        )),
+    }
+
+@pytest.fixture(scope="module")
+def fresh_schema(tmp_path_factory):
+    c = _open(tmp_path_factory.mktemp("fresh") / "jd_copilot.sqlite")
+    migrations.migrate(c)
+    schema = _schema(c)
+    c.close()
+    return schema
+
+def _at_version(conn: sqlite3.Connection, version: int) -> None:
+    """The schema as migrate() left it when `version` was the latest."""
+    for step in migrations.MIGRATIONS[:version]:
+        step(conn)
+    conn.execute(f"PRAGMA user_version = {version}")
+
+def _seed(conn: sqlite3.Connection, rows: list) -> list:
+    # Only the columns every version has, as the app of the time wrote them
+    for oid, text, analysis, model in rows:
+        conn.execute("""
+            INSERT INTO opportunities (id, created_at, updated_at, company, role_title, jd_text, analysis_json, analysis_model)
+            VALUES (?, '2024-01-01T00:00:00', '2024-01-01T00:00:00', 'Acme', 'PM', ?, ?, ?)
+        """, (oid, text, analysis, model))
+    if "jd_hash" in {c[1] for c in conn.execute("PRAGMA table_info(opportunities)")}:
+        # Written with the JD ever since the column was added
+        conn.executemany("UPDATE opportunities SET jd_hash = ? WHERE id = ?",
+                         [(jd_hash(db.unpack_text(text)), oid) for oid, text, _, _ in rows])
+    return rows
+
+PLAIN_ROWS = [
+    (1, SHORT_JD, '{"verdict": "maybe"}', "gpt-4o-mini"),
+    (2, LONG_JD, None, None),
+]
+
+def _assert_migrated(conn: sqlite3.Connection, rows: list, fresh_schema: dict) -> None:
+    assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+    assert _schema(conn) == fresh_schema
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    for oid, text, analysis, model in rows:
+        got = conn.execute(
+            "SELECT jd_text, analysis_json, analysis_model, jd_hash, stage FROM opportunities WHERE id = ?", (oid,)
+        ).fetchone()
+        # Stored values come through byte for byte, packed ones still packed
+        assert got["jd_text"] == text
+        assert (got["analysis_json"], got["analysis_model"], got["stage"]) == (analysis, model, "NEW")
+        assert got["jd_hash"] == jd_hash(db.unpack_text(text))
+    assert migrations.migrate(conn) == 0
+
+def _search(conn: sqlite3.Connection, term: str) -> list:
+    return [r[0] for r in conn.execute("SELECT rowid FROM opportunities_fts WHERE opportunities_fts MATCH ?", (term,))]
+
+def test_empty_database(conn, fresh_schema):
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+    assert _schema(conn) == fresh_schema
+    columns = {c[1]: c[2] for c in conn.execute("PRAGMA table_info(opportunities)")}
+    assert {k: columns.get(k) for k in BASE_COLUMNS} == BASE_COLUMNS
+    assert migrations.migrate(conn) == 0
+
+@pytest.mark.parametrize("shape", sorted(PRE_VERSIONING_SHAPES))
+def test_pre_versioning_shape(conn, fresh_schema, shape):
+    PRE_VERSIONING_SHAPES[shape](conn)
+    rows = _seed(conn, PLAIN_ROWS)
+    migrations.migrate(conn)
+    _assert_migrated(conn, rows, fresh_schema)
+    assert _search(conn, "senior") == [1]
+
+@pytest.mark.parametrize("version", range(1, migrations.SCHEMA_VERSION))
+def test_from_version(conn, fresh_schema, version):
+    _at_version(conn, version)
+    rows = _seed(conn, PLAIN_ROWS)
+    migrations.migrate(conn)
+    _assert_migrated(conn, rows, fresh_schema)
+    assert _search(conn, "senior") == [1]
+    assert _search(conn, "kafka") == [2]
+
+@pytest.mark.parametrize("version", range(PACKED_FROM, migrations.SCHEMA_VERSION + 1))
+def test_packed_rows_from_version(conn, fresh_schema, version):
+    _at_version(conn, version)
+    rows = _seed(conn, [
+        (1, SHORT_JD, '{"verdict": "maybe"}', "gpt-4o-mini"),
+        # Stored compressed, as db.pack_text writes it
+        (2, db.pack_text(LONG_JD), None, None),
+    ])
+    assert isinstance(rows[1][1], bytes) and rows[1][1].startswith(db.PACK_MARKER)
+    migrations.migrate(conn)
+    _assert_migrated(conn, rows, fresh_schema)
+    assert db.unpack_text(conn.execute("SELECT jd_text FROM opportunities WHERE id = 2").fetchone()[0]) == LONG_JD
+    assert _search(conn, "kafka") == [2]
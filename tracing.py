@@ -0,0 +1,171 @@
+# tracing.py
+"""
+Lightweight hot-path tracing.
+
+    with span("llm.completion", model=model) as sp:
+        resp = client.chat.completions.create(...)
+        sp.set(tokens=resp.usage.total_tokens)
+
+    @traced("db.get_opportunity")
+    def get_opportunity(...): ...
+
+Spans nest through a contextvar. The sampling decision is made once per
+root span and inherited by its children. Finished spans are buffered in
+memory and written to the metrics_spans table in batches (when the buffer fills,
+or when a root span ends at least FLUSH_INTERVAL_S after the last write),
+so tracing never adds a write per call.
+
+JD_TRACE_SAMPLE_RATE (0..1, default 1) sets the share of root spans kept.
+"""
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+FLUSH_EVERY = 200
+FLUSH_INTERVAL_S = 1.0
+
+_sample_rate = float(os.getenv("JD_TRACE_SAMPLE_RATE", "1.0"))
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_buffer: List[tuple] = []
+_buffer_lock = threading.Lock()
+_last_flush = 0.0
+
+class Span:
+    __slots__ = ("trace_id", "name", "parent", "sampled", "started_at", "_t0", "attrs")
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        if parent is None:
+            self.trace_id = uuid.uuid4().hex
+            self.sampled = random.random() < _sample_rate
+        else:
+            self.trace_id = parent.trace_id
+            self.sampled = parent.sampled
+        self.attrs = attrs
+        self.started_at = ""
+        self._t0 = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+def set_sample_rate(rate: float) -> None:
+    global _sample_rate
+    _sample_rate = max(0.0, min(1.0, rate))
+
+def sample_rate() -> float:
+    return _sample_rate
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span]:
+    parent = _current.get()
+    sp = Span(name, parent, attrs)
+    if not sp.sampled:
+        token = _current.set(sp)
+        try:
+            yield sp
+        finally:
+            _current.reset(token)
+        return
+
+    sp.started_at = datetime.utcnow().isoformat()
+    sp._t0 = time.perf_counter()
+    token = _current.set(sp)
+    error = None
+    try:
+        yield sp
+    except BaseException as e:
+        # Streamlit's st.rerun/st.stop are BaseExceptions; they aren't failures
+        if isinstance(e, Exception):
+            error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        duration_ms = (time.perf_counter() - sp._t0) * 1000
+        if error:
+            sp.attrs["error"] = error
+        tokens = sp.attrs.pop("tokens", None)
+        row = (
+            sp.trace_id,
+            parent.name if parent else None,
+            name,
+            sp.started_at,
+            duration_ms,
+            tokens,
+            json.dumps(sp.attrs, default=str) if sp.attrs else None,
+        )
+        with _buffer_lock:
+            _buffer.append(row)
+            due = len(_buffer) >= FLUSH_EVERY or (
+                parent is None and time.monotonic() - _last_flush >= FLUSH_INTERVAL_S
+            )
+        if due:
+            flush()
+
+def record(name: str, started_at: str, duration_ms: float, tokens: Optional[int] = None, **attrs: Any) -> None:
+    """Records an already-timed span (e.g. one that spanned generator yields) under the current span."""
+    parent = _current.get()
+    if parent is not None and not parent.sampled:
+        return
+    if parent is None and random.random() >= _sample_rate:
+        return
+    row = (
+        parent.trace_id if parent else uuid.uuid4().hex,
+        parent.name if parent else None,
+        name,
+        started_at,
+        duration_ms,
+        tokens,
+        json.dumps(attrs, default=str) if attrs else None,
+    )
+    with _buffer_lock:
+        _buffer.append(row)
+        due = len(_buffer) >= FLUSH_EVERY
+    if due:
+        flush()
+
+def traced(name: Optional[str] = None) -> Callable:
+    def deco(fn: Callable) -> Callable:
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def flush() -> None:
+    global _last_flush
+    with _buffer_lock:
+        _last_flush = time.monotonic()
+        if not _buffer:
+            return
+        rows = _buffer[:]
+        _buffer.clear()
+    # Imported here: db itself is instrumented with this module
+    import db
+    try:
+        db.record_spans(rows)
+    except Exception:
+        # Metrics must never break the request path
+        pass
+
+atexit.register(flush)
@@ -0,0 +1,207 @@
+# transfer.py
+"""
+Streaming bulk import and export of opportunities.
+
+Import reads JSONL or CSV one record at a time and inserts in chunks (one
+transaction each), so memory stays flat however large the file is. Records
+whose jd_link or JD content already exists are skipped as duplicates;
+invalid records are reported by line number and never stop the import.
+
+Export yields one JSON object per opportunity, with dq_reasons and analysis
+parsed, as JSONL or as a ZIP holding one JSON file per opportunity. Exported
+JSONL can be imported again.
+"""
+import csv
+import json
+import re
+import time
+import zipfile
+from datetime import datetime
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+import db
+from schemas import JDAnalysis
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 200
+IMPORT_FORMATS = ("jsonl", "csv")
+EXPORT_FORMATS = ("jsonl", "zip")
+
+# Mirrors app.STAGES / app.DECISIONS
+STAGES = ("NEW", "ANALYZED", "DECISION_PENDING", "QUALIFIED_PREP", "APPLIED", "INTERVIEWING", "CLOSED", "DQ")
+DECISIONS = ("PENDING", "QUALIFIED", "UNQUALIFIED")
+
+# Accepted spellings of import columns (header names / JSON keys)
+_ALIASES = {
+    "title": "role_title",
+    "role": "role_title",
+    "link": "jd_link",
+    "url": "jd_link",
+    "jd": "jd_text",
+    "description": "jd_text",
+}
+
+EXPORT_FIELDS = (
+    "id", "created_at", "updated_at", "company", "role_title", "jd_link", "jd_text",
+    "stage", "decision", "day0_at", "bucket_due", "next_action", "next_action_due", "duplicate_of",
+    "analysis_model", "prompt_tokens", "completion_tokens", "total_tokens", "cached_prompt_tokens",
+    "estimated_cost_usd",
+)
+
+def detect_format(filename: str) -> str:
+    return "csv" if filename.lower().endswith(".csv") else "jsonl"
+
+def iter_records(fp: IO[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, record) pairs; a record that can't be parsed comes back as the exception."""
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    if fmt == "csv":
+        # JDs easily exceed the csv module's default 128 KB field limit
+        csv.field_size_limit(max(csv.field_size_limit(), 1 << 24))
+        reader = csv.DictReader(fp)
+        while True:
+            try:
+                rec = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield reader.line_num, e
+                continue
+            yield reader.line_num, rec
+    else:
+        for n, line in enumerate(fp, 1):
+            if not line.strip():
+                continue
+            try:
+                yield n, json.loads(line)
+            except ValueError as e:
+                yield n, e
+
+def _iso(value: Any, name: str) -> Optional[str]:
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).isoformat()
+    except ValueError:
+        raise ValueError(f"{name} is not an ISO date: {value!r}")
+
+def _json_field(value: Any) -> Any:
+    # CSV cells carry nested values as JSON text
+    return json.loads(value) if isinstance(value, str) and value.strip() else (value or None)
+
+def to_import_row(rec: Any) -> Dict[str, Any]:
+    """Validates one parsed record into db.IMPORT_COLUMNS. Raises ValueError."""
+    if isinstance(rec, Exception):
+        raise ValueError(f"Unreadable record: {rec}")
+    if not isinstance(rec, dict):
+        raise ValueError("Expected an object per record")
+    rec = {_ALIASES.get(k.strip().lower(), k.strip().lower()): v for k, v in rec.items() if k}
+
+    row = {
+        "company": str(rec.get("company") or "").strip(),
+        "role_title": str(rec.get("role_title") or "").strip(),
+        "jd_link": str(rec.get("jd_link") or "").strip(),
+        "jd_text": rec.get("jd_text") or "",
+        "stage": str(rec.get("stage") or "").strip().upper() or None,
+        "decision": str(rec.get("decision") or "").strip().upper() or None,
+        "created_at": _iso(rec.get("created_at"), "created_at"),
+        "day0_at": _iso(rec.get("day0_at"), "day0_at"),
+    }
+    if not row["company"] or not row["role_title"]:
+        raise ValueError("company and role_title are required")
+    if not isinstance(row["jd_text"], str):
+        raise ValueError("jd_text must be text")
+    if row["stage"] and row["stage"] not in STAGES:
+        raise ValueError(f"Unknown stage: {row['stage']}")
+    if row["decision"] and row["decision"] not in DECISIONS:
+        raise ValueError(f"Unknown decision: {row['decision']}")
+
+    try:
+        dq = _json_field(rec.get("dq_reasons"))
+        analysis = _json_field(rec.get("analysis"))
+    except ValueError as e:
+        raise ValueError(f"Nested field is not valid JSON: {e}")
+    row["dq_reasons_json"] = json.dumps(dq) if dq else None
+    if analysis:
+        try:
+            JDAnalysis.model_validate(analysis)
+        except ValidationError as e:
+            raise ValueError(f"analysis does not match the schema: {e.error_count()} errors, first: {e.errors()[0]['msg']}")
+        row["analysis_json"] = json.dumps(analysis)
+        row["analysis_model"] = rec.get("analysis_model")
+    return row
+
+def import_opportunities(
+    fp: IO[str],
+    fmt: str = "jsonl",
+    chunk_size: int = CHUNK_SIZE,
+    on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Streams records from fp into the database. Returns counts of records
+    read / inserted / duplicates / errors, and the first MAX_REPORTED_ERRORS
+    errors as {"line", "error"}. on_progress(summary) runs after each chunk.
+    """
+    t0 = time.perf_counter()
+    summary: Dict[str, Any] = {"read": 0, "inserted": 0, "duplicates": 0, "errors": 0, "error_rows": []}
+    chunk: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        ids, skipped = db.bulk_insert_opportunities(chunk)
+        summary["inserted"] += len(ids)
+        summary["duplicates"] += len(skipped)
+        chunk.clear()
+        if on_progress:
+            on_progress(summary)
+
+    for line, rec in iter_records(fp, fmt):
+        summary["read"] += 1
+        try:
+            chunk.append(to_import_row(rec))
+        except ValueError as e:
+            summary["errors"] += 1
+            if len(summary["error_rows"]) < MAX_REPORTED_ERRORS:
+                summary["error_rows"].append({"line": line, "error": str(e)})
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    summary["seconds"] = time.perf_counter() - t0
+    return summary
+
+def export_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    rec = {f: row.get(f) for f in EXPORT_FIELDS}
+    rec["dq_reasons"] = json.loads(row["dq_reasons_json"]) if row.get("dq_reasons_json") else None
+    rec["analysis"] = json.loads(row["analysis_json"]) if row.get("analysis_json") else None
+    return rec
+
+def iter_export(stage: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    for row in db.iter_opportunities(stage=stage):
+        yield export_record(row)
+
+def iter_jsonl(stage: Optional[str] = None) -> Iterator[bytes]:
+    for rec in iter_export(stage):
+        yield (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _slug(s: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", (s or "").lower()).strip("-")[:40] or "opportunity"
+
+def write_export(fp: IO[bytes], fmt: str = "jsonl", stage: Optional[str] = None) -> int:
+    """Writes the export to a binary file object, one record at a time. Returns the record count."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    n = 0
+    if fmt == "jsonl":
+        for line in iter_jsonl(stage):
+            fp.write(line)
+            n += 1
+        return n
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for rec in iter_export(stage):
+            zf.writestr(f"{rec['id']:06d}-{_slug(rec['company'])}.json", json.dumps(rec, ensure_ascii=False, indent=2))
+            n += 1
+    return n
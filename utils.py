@@ -1,6 +1,9 @@
 # utils.py
+import re
+import difflib
+import hashlib
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 def iso_to_dt(s: str) -> datetime:
     return datetime.fromisoformat(s)
@@ -8,12 +11,20 @@ def iso_to_dt(s: str) -> datetime:
 def dt_to_iso(dt: datetime) -> str:
     return dt.isoformat()
 
-def compute_bucket(stage: str, day0_at: str, decision: str) -> Dict[str, Any]:
+def jd_hash(text: Optional[str]) -> Optional[str]:
+    """Content hash of a JD, insensitive to case and whitespace. None for blank text."""
+    norm = re.sub(r"\s+", " ", (text or "")).strip().lower()
+    if not norm:
+        return None
+    return hashlib.sha256(norm.encode("utf-8")).hexdigest()[:32]
+
+def compute_bucket(stage: str, day0_at: str, decision: str, now: Optional[datetime] = None) -> Dict[str, Any]:
     """
     Returns: bucket_due, next_action, next_action_due, suggested_stage
+    Pass `now` to evaluate many rows against one clock reading.
     """
     day0 = iso_to_dt(day0_at)
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
 
     # Defaults
     next_action = ""
@@ -54,29 +65,146 @@ def compute_bucket(stage: str, day0_at: str, decision: str) -> Dict[str, Any]:
         "stage": suggested_stage
     }
 
+# Standard-tier prices per 1M tokens (USD). Dated snapshots such as
+# "gpt-4.1-mini-2025-04-14" match their base name; unknown models are priced
+# as DEFAULT_PRICED_MODEL.
+MODEL_PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-5": {"input": 1.25, "cached_input": 0.125, "output": 10.00},
+    "gpt-5-mini": {"input": 0.25, "cached_input": 0.025, "output": 2.00},
+    "gpt-5-nano": {"input": 0.05, "cached_input": 0.005, "output": 0.40},
+    "gpt-4.1": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "gpt-4.1-mini": {"input": 0.40, "cached_input": 0.10, "output": 1.60},
+    "gpt-4.1-nano": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "o3": {"input": 2.00, "cached_input": 0.50, "output": 8.00},
+    "o4-mini": {"input": 1.10, "cached_input": 0.275, "output": 4.40},
+    "o3-mini": {"input": 1.10, "cached_input": 0.55, "output": 4.40},
+}
+DEFAULT_PRICED_MODEL = "gpt-4.1-mini"
+
+def model_pricing(model: str) -> Dict[str, float]:
+    # Longest matching prefix, so "gpt-4.1-mini-..." isn't priced as "gpt-4.1"
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model == name or model.startswith(name + "-"):
+            return MODEL_PRICES[name]
+    return MODEL_PRICES[DEFAULT_PRICED_MODEL]
+
 def estimate_openai_cost(
     prompt_tokens: int,
     completion_tokens: int,
-    model: str
+    model: str,
+    cached_tokens: int = 0
 ) -> float:
     """
-    Rough cost estimate in USD based on published pricing.
-    Currently assumes gpt-4.1-mini standard pricing.
+    Rough cost estimate in USD based on published pricing (MODEL_PRICES).
+    cached_tokens is the part of prompt_tokens served from the provider's
+    prompt cache, billed at the cached input rate.
     """
-
-    # Prices per 1M tokens (USD)
-    PRICES = {
-        "gpt-4.1-mini": {
-            "input": 0.80,
-            "output": 3.20,
-        }
-    }
-
-    pricing = PRICES.get(model, PRICES["gpt-4.1-mini"])
+    pricing = model_pricing(model or DEFAULT_PRICED_MODEL)
+    cached_tokens = min(cached_tokens, prompt_tokens)
 
     cost = (
-        (prompt_tokens / 1_000_000) * pricing["input"]
+        ((prompt_tokens - cached_tokens) / 1_000_000) * pricing["input"]
+        + (cached_tokens / 1_000_000) * pricing["cached_input"]
         + (completion_tokens / 1_000_000) * pricing["output"]
     )
 
     return round(cost, 6)
+
+# Analysis tiers and the model each is priced at when none was recorded
+MODEL_TIERS: Dict[str, str] = {"triage": "gpt-4.1-nano", "full": DEFAULT_PRICED_MODEL}
+
+def estimate_tiered_cost(usage: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Cost per tier from {tier: {model, prompt_tokens, completion_tokens,
+    cached_prompt_tokens}}, each tier at its own model's prices, plus "total".
+    """
+    costs = {
+        tier: estimate_openai_cost(
+            u.get("prompt_tokens") or 0,
+            u.get("completion_tokens") or 0,
+            u.get("model") or MODEL_TIERS.get(tier, DEFAULT_PRICED_MODEL),
+            cached_tokens=u.get("cached_prompt_tokens") or 0,
+        )
+        for tier, u in usage.items()
+    }
+    costs["total"] = round(sum(costs.values()), 6)
+    return costs
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English prose; good enough for throttling
+    return max(1, len(text) // 4)
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    # Plus a few tokens of per-message framing
+    return sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+
+def _passages(text: str) -> List[str]:
+    parts = re.split(r"(?<=[.!?])\s+|\n+", text or "")
+    return [p.strip() for p in parts if re.search(r"\w", p)]
+
+def _words(p: str) -> List[str]:
+    return re.findall(r"\w+", p.lower())
+
+def jd_changes(old: str, new: str) -> List[Dict[str, List[str]]]:
+    """
+    Passage-level diff of two JD texts. Each change is
+    {"removed": [...], "added": [...]}. Edits that only touch whitespace,
+    case or punctuation are not changes, so an empty list means nothing
+    material changed.
+    """
+    a, b = _passages(old), _passages(new)
+    sm = difflib.SequenceMatcher(a=[" ".join(_words(p)) for p in a], b=[" ".join(_words(p)) for p in b], autojunk=False)
+    changes = []
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            continue
+        removed, added = a[i1:i2], b[j1:j2]
+        if sorted(w for p in removed for w in _words(p)) == sorted(w for p in added for w in _words(p)):
+            continue  # same words, just re-split or re-punctuated
+        changes.append({"removed": removed, "added": added})
+    return changes
+
+# Sentences shorter than this are never treated as repeated boilerplate
+UNIT_MIN_WORDS = 8
+
+_ODD_SPACE = re.compile(r"[ \t\f\v\u00a0\u1680\u2000-\u200a\u202f\u205f\u3000]+")
+_ZERO_WIDTH = re.compile(r"[\u200b-\u200d\u2060\ufeff]")
+
+def normalize_jd_whitespace(text: str) -> str:
+    """
+    Collapses runs of spaces/tabs (including non-breaking and zero-width
+    ones), trims every line and keeps at most one blank line in a row.
+    Words and their order are untouched.
+    """
+    text = _ZERO_WIDTH.sub("", (text or "").replace("\r\n", "\n").replace("\r", "\n"))
+    lines = [_ODD_SPACE.sub(" ", line).strip() for line in text.split("\n")]
+    out: List[str] = []
+    for line in lines:
+        if line or (out and out[-1]):
+            out.append(line)
+    while out and not out[-1]:
+        out.pop()
+    return "\n".join(out)
+
+def jd_units(text: str) -> List[List[str]]:
+    """
+    Whitespace-normalized JD as lines of sentence units; a blank line is [].
+    Every unit is a verbatim substring of normalize_jd_whitespace(text).
+    """
+    return [
+        [s for s in re.split(r"(?<=[.!?])\s+", line) if s] if line else []
+        for line in normalize_jd_whitespace(text).split("\n")
+    ]
+
+def unit_key(unit: str) -> Optional[str]:
+    """Hash of a unit's words (case and punctuation ignored); None for units too short to dedupe."""
+    words = _words(unit)
+    if len(words) < UNIT_MIN_WORDS:
+        return None
+    return hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()[:16]
+
+def jd_unit_keys(text: str) -> List[str]:
+    """Distinct unit_key()s of a JD, for the corpus index."""
+    return sorted({k for line in jd_units(text) for u in line for k in [unit_key(u)] if k})